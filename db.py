@@ -0,0 +1,282 @@
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+import httpx
+from dotenv import load_dotenv
+from postgrest import AsyncPostgrestClient
+from postgrest.constants import DEFAULT_POSTGREST_CLIENT_HEADERS
+from postgrest.types import ReturnMethod
+from supabase import Client, create_client
+
+load_dotenv()
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
+# One pool for every async query in the process; requests beyond it wait for a connection.
+DB_MAX_CONNECTIONS = int(os.environ.get("DB_MAX_CONNECTIONS", "20"))
+DB_MAX_KEEPALIVE = int(os.environ.get("DB_MAX_KEEPALIVE", "10"))
+DB_TIMEOUT_SECONDS = float(os.environ.get("DB_TIMEOUT_SECONDS", "10"))
+DB_HTTP2 = os.environ.get("DB_HTTP2", "1") == "1"
+
+# hook(query name, seconds, exception or None), called after every timed query.
+QueryHook = Callable[[str, float, Optional[BaseException]], None]
+query_hooks: List[QueryHook] = []
+
+_client: Optional[AsyncPostgrestClient] = None
+_sync_client: Optional[Client] = None
+_sync_lock = threading.Lock()
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def configured() -> bool:
+    return bool(SUPABASE_URL and SUPABASE_KEY)
+
+
+class _PooledPostgrestClient(AsyncPostgrestClient):
+    def create_session(self, base_url, headers, timeout, verify=True) -> httpx.AsyncClient:
+        return httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=httpx.Timeout(DB_TIMEOUT_SECONDS, connect=5.0, pool=DB_TIMEOUT_SECONDS),
+            verify=verify,
+            follow_redirects=True,
+            http2=DB_HTTP2,
+            limits=httpx.Limits(max_connections=DB_MAX_CONNECTIONS, max_keepalive_connections=DB_MAX_KEEPALIVE),
+        )
+
+
+def get_client() -> AsyncPostgrestClient:
+    """The process-wide async PostgREST client (created on first use, inside the event loop)."""
+    global _client
+    if _client is None:
+        if not configured():
+            raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+        _client = _PooledPostgrestClient(
+            f"{SUPABASE_URL}/rest/v1",
+            headers={**DEFAULT_POSTGREST_CLIENT_HEADERS, "apikey": SUPABASE_KEY,
+                     "Authorization": f"Bearer {SUPABASE_KEY}"},
+        )
+    return _client
+
+
+def get_sync_client() -> Optional[Client]:
+    """The process-wide sync supabase client, for threads, workers and storage; None if not configured."""
+    global _sync_client
+    if _sync_client is None and configured():
+        with _sync_lock:
+            if _sync_client is None:
+                try:
+                    _sync_client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                except Exception as e:
+                    print(f"Failed to initialize Supabase: {e}")
+    return _sync_client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+def _record(name: str, seconds: float, error: Optional[BaseException]):
+    with _stats_lock:
+        s = _stats.setdefault(name, {"count": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+        s["count"] += 1
+        s["errors"] += error is not None
+        s["total_ms"] += seconds * 1000
+        s["max_ms"] = max(s["max_ms"], seconds * 1000)
+    for hook in query_hooks:
+        try:
+            hook(name, seconds, error)
+        except Exception as e:
+            print(f"Query hook failed: {e}")
+
+
+async def execute(name: str, builder):
+    """Runs an async request builder, timing it under `name`."""
+    started = time.perf_counter()
+    error = None
+    try:
+        return await builder.execute()
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _record(name, time.perf_counter() - started, error)
+
+
+def execute_sync(name: str, builder):
+    """Same as execute() for sync builders (worker threads and scripts)."""
+    started = time.perf_counter()
+    error = None
+    try:
+        return builder.execute()
+    except BaseException as e:
+        error = e
+        raise
+    finally:
+        _record(name, time.perf_counter() - started, error)
+
+
+def query_stats() -> Dict[str, Dict[str, float]]:
+    with _stats_lock:
+        return {
+            name: {**s, "avg_ms": round(s["total_ms"] / s["count"], 2), "total_ms": round(s["total_ms"], 1),
+                   "max_ms": round(s["max_ms"], 2)}
+            for name, s in _stats.items()
+        }
+
+
+def vector_literal(values) -> str:
+    """pgvector text literal for an embedding. Stored as float16 (halfvec), so digits past the 5th are wasted payload."""
+    return "[" + ",".join(f"{float(v):.5g}" for v in values) + "]"
+
+
+# --- Tracks ---
+
+async def get_track(track_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+    res = await execute("tracks.get", get_client().table("tracks").select(columns).eq("id", track_id).limit(1))
+    return res.data[0] if res.data else None
+
+
+async def list_tracks(columns: str, status: Optional[str] = None,
+                      bbox: Optional[Sequence[float]] = None) -> List[Dict[str, Any]]:
+    query = get_client().table("tracks").select(columns)
+    if status:
+        query = query.eq("status", status)
+    if bbox:
+        x1, y1, x2, y2 = bbox
+        query = query.gte("map_x", x1).lte("map_x", x2).gte("map_y", y1).lte("map_y", y2)
+    res = await execute("tracks.list", query)
+    return res.data or []
+
+
+async def create_track(params: Dict[str, Any]) -> Dict[str, Any]:
+    """create_track_with_licensing: track, artist and license template in one transaction."""
+    res = await execute("tracks.create", get_client().rpc("create_track_with_licensing", params))
+    return res.data or {}
+
+
+async def create_tracks(rows: List[Dict[str, Any]], template: Optional[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    res = await execute("tracks.create_bulk", get_client().rpc("create_tracks_with_licensing", {
+        "p_tracks": rows,
+        "p_template": template,
+    }))
+    return res.data or []
+
+
+async def add_track_revenue(track_id: str, artist_id: Optional[str], cents: int):
+    """Credits a sale to the track's revenue and its artist's balance."""
+    client = get_client()
+    res = await execute("tracks.revenue_get", client.table("tracks").select("license_revenue_cents").eq("id", track_id))
+    if res.data:
+        new_rev = (res.data[0].get("license_revenue_cents") or 0) + cents
+        await execute("tracks.revenue_set", client.table("tracks").update({"license_revenue_cents": new_rev}).eq("id", track_id))
+    if artist_id:
+        res = await execute("artists.balance_get", client.table("artists").select("balance_cents").eq("id", artist_id))
+        if res.data:
+            new_bal = (res.data[0].get("balance_cents") or 0) + cents
+            await execute("artists.balance_set", client.table("artists").update({"balance_cents": new_bal}).eq("id", artist_id))
+
+
+# --- Artists ---
+
+async def get_artist(artist_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+    res = await execute("artists.get", get_client().table("artists").select(columns).eq("id", artist_id).limit(1))
+    return res.data[0] if res.data else None
+
+
+# --- Events ---
+
+def insert_events(supabase: Client, rows: List[Dict[str, Any]]):
+    """Bulk event insert from the ingest flusher thread (sync; it runs off the event loop).
+
+    Rows carry client-side ids, so a retried batch skips the rows that already landed.
+    """
+    execute_sync("events.insert", supabase.table("events").upsert(
+        rows, on_conflict="id", ignore_duplicates=True, returning=ReturnMethod.minimal
+    ))
+
+
+# --- Licenses ---
+
+async def list_license_templates(track_id: str) -> List[Dict[str, Any]]:
+    res = await execute("license_templates.list", get_client().table("license_templates").select("*").eq("track_id", track_id))
+    return res.data or []
+
+
+async def get_license_template(template_id: str, track_id: str) -> Optional[Dict[str, Any]]:
+    res = await execute(
+        "license_templates.get",
+        get_client().table("license_templates").select("*").eq("id", template_id).eq("track_id", track_id),
+    )
+    return res.data[0] if res.data else None
+
+
+async def create_license_template(row: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    res = await execute("license_templates.create", get_client().table("license_templates").insert(row))
+    return res.data[0] if res.data else None
+
+
+async def insert_license(record: Dict[str, Any]):
+    await execute("licenses.insert", get_client().table("licenses").insert(record))
+
+
+async def set_license_tx_hash(license_id: str, tx_hash: str):
+    await execute("licenses.set_tx", get_client().table("licenses").update({"xrpl_tx_hash": tx_hash}).eq("id", license_id))
+
+
+async def artist_dashboard(artist_id: str) -> Optional[Dict[str, Any]]:
+    """Revenue, license count and the 10 most recent licenses across an artist's tracks; None if no such artist."""
+    client = get_client()
+    artist = await execute("artists.get", client.table("artists").select("balance_cents").eq("id", artist_id))
+    if not artist.data:
+        return None
+    tracks = await execute("tracks.by_artist", client.table("tracks").select("id, license_revenue_cents").eq("artist_id", artist_id))
+    track_ids = [t["id"] for t in tracks.data or []]
+    recent, total = [], 0
+    if track_ids:
+        licenses = client.table("licenses")
+        recent_res = await execute(
+            "licenses.recent",
+            licenses.select("*").in_("track_id", track_ids).order("created_at", desc=True).limit(10),
+        )
+        count_res = await execute("licenses.count", licenses.select("id", count="exact").in_("track_id", track_ids))
+        recent = recent_res.data or []
+        total = count_res.count if count_res.count is not None else len(count_res.data or [])
+    return {
+        "total_license_revenue_cents": sum(t.get("license_revenue_cents") or 0 for t in tracks.data or []),
+        "total_licenses": total,
+        "recent_licenses": recent,
+    }
+
+
+# --- Votes ---
+
+async def cast_vote(track_id: str, session_id: str, tokens: int, default_balance: int,
+                    defer_score: bool) -> Dict[str, Any]:
+    res = await execute("votes.cast", get_client().rpc("cast_vote", {
+        "p_track_id": track_id,
+        "p_session_id": session_id,
+        "p_tokens": tokens,
+        "p_default_balance": default_balance,
+        "p_defer_score": defer_score,
+    }))
+    return res.data or {}
+
+
+async def get_token_balance(session_id: str) -> Optional[Dict[str, Any]]:
+    res = await execute("token_balances.get", get_client().table("token_balances").select("*").eq("session_id", session_id))
+    return res.data[0] if res.data else None
+
+
+async def create_token_balance(session_id: str, balance: int) -> Dict[str, Any]:
+    res = await execute("token_balances.create", get_client().table("token_balances").insert({
+        "session_id": session_id,
+        "balance": balance,
+    }))
+    return res.data[0] if res.data else {"session_id": session_id, "balance": balance}
@@ -0,0 +1,283 @@
+import os
+import ast
+import json
+import time
+import fcntl
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+EMBEDDINGS_PATH = os.environ.get("EMBEDDINGS_PATH", "embeddings.npy")
+EMBEDDING_DIM = 512
+EMBEDDING_DTYPE = np.float16
+STORE_REFRESH_SECONDS = 30.0
+# Fixed header size so the shape can be rewritten in place as rows are appended.
+HEADER_BYTES = 128
+TOPK_CHUNK_ROWS = 65536
+
+MAGIC = b"\x93NUMPY\x01\x00"
+# Id of a row whose track left the catalog; it's masked out until the next full export.
+REMOVED_ID = "-"
+
+
+def _ids_path(path: str) -> str:
+    return path + ".ids"
+
+
+def _meta_path(path: str) -> str:
+    return path + ".meta.json"
+
+
+@contextmanager
+def _locked(path: str, exclusive: bool):
+    """Cross-process lock so readers never pair a new ids file with an old matrix (or vice versa)."""
+    with open(path + ".lock", "a") as f:
+        fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _header(rows: int, dim: int) -> bytes:
+    """A version 1.0 .npy header padded to HEADER_BYTES, so np.load reads the file as-is."""
+    descr = np.lib.format.dtype_to_descr(np.dtype(EMBEDDING_DTYPE))
+    text = repr({"descr": descr, "fortran_order": False, "shape": (rows, dim)})
+    body_len = HEADER_BYTES - len(MAGIC) - 2
+    text = text.ljust(body_len - 1) + "\n"
+    if len(text) != body_len:
+        raise ValueError(f"shape {(rows, dim)} doesn't fit a {HEADER_BYTES}-byte header")
+    return MAGIC + body_len.to_bytes(2, "little") + text.encode("latin1")
+
+
+def _read_shape(f) -> Tuple[int, int]:
+    f.seek(0)
+    head = f.read(HEADER_BYTES)
+    if head[:len(MAGIC)] != MAGIC or len(head) < HEADER_BYTES:
+        raise ValueError("not an embedding snapshot written by embedding_store")
+    return ast.literal_eval(head[len(MAGIC) + 2:].decode("latin1"))["shape"]
+
+
+def read_meta(path: str = EMBEDDINGS_PATH) -> dict:
+    try:
+        with open(_meta_path(path), encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def _write_meta(path: str, meta: dict):
+    tmp = _meta_path(path) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp, _meta_path(path))
+
+
+def write_snapshot(path: str, pages: Iterable[Tuple[List[str], np.ndarray]], meta: Optional[dict] = None,
+                   dim: int = EMBEDDING_DIM) -> int:
+    """Streams (ids, matrix) pages into a fresh snapshot and swaps it in atomically.
+
+    Processes that already mapped the old file keep reading it until they refresh.
+    Returns the number of rows written.
+    """
+    tmp = path + ".tmp"
+    rows = 0
+    with open(tmp, "wb") as data, open(_ids_path(tmp), "w", encoding="utf-8") as ids_out:
+        data.write(_header(0, dim))
+        for ids, matrix in pages:
+            data.write(np.ascontiguousarray(matrix, dtype=EMBEDDING_DTYPE).tobytes())
+            ids_out.write("".join(f"{track_id}\n" for track_id in ids))
+            rows += len(ids)
+        data.seek(0)
+        data.write(_header(rows, dim))
+    with _locked(path, exclusive=True):
+        os.replace(_ids_path(tmp), _ids_path(path))
+        os.replace(tmp, path)
+    _write_meta(path, {**(meta or {}), "rows": rows, "dim": dim, "written_at": time.time()})
+    return rows
+
+
+def append(path: str, ids: Sequence[str], matrix: np.ndarray, meta: Optional[dict] = None) -> Tuple[int, int]:
+    """Adds rows for new tracks and overwrites rows of ids already in the snapshot.
+
+    Rows go in before the header is rewritten, so a crash mid-append leaves the
+    previous snapshot intact (trailing bytes and ids past the header's row count
+    are ignored and overwritten next time). Returns (appended, updated).
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=EMBEDDING_DTYPE)
+    with _locked(path, exclusive=True), open(path, "r+b") as data:
+        rows, dim = _read_shape(data)
+        existing = _load_ids(path, rows)
+        index = {track_id: i for i, track_id in enumerate(existing)}
+        row_bytes = dim * matrix.itemsize
+
+        new_ids, new_rows = [], []
+        updated = 0
+        for track_id, vec in zip(ids, matrix):
+            i = index.get(track_id)
+            if i is not None and i >= rows:
+                new_rows[i - rows] = vec
+            elif i is None:
+                index[track_id] = rows + len(new_ids)
+                new_ids.append(track_id)
+                new_rows.append(vec)
+            else:
+                data.seek(HEADER_BYTES + i * row_bytes)
+                data.write(vec.tobytes())
+                updated += 1
+
+        if new_ids:
+            data.seek(HEADER_BYTES + rows * row_bytes)
+            data.truncate()
+            data.write(np.stack(new_rows).tobytes())
+            with open(_ids_path(path), "w", encoding="utf-8") as ids_out:
+                ids_out.write("".join(f"{track_id}\n" for track_id in [*existing, *new_ids]))
+            data.flush()
+            os.fsync(data.fileno())
+            data.seek(0)
+            data.write(_header(rows + len(new_ids), dim))
+    if meta is not None:
+        _write_meta(path, {**read_meta(path), **meta, "rows": rows + len(new_ids)})
+    return len(new_ids), updated
+
+
+def remove(path: str, ids: Sequence[str], meta: Optional[dict] = None) -> int:
+    """Masks the rows of `ids` (zeroed vector, id REMOVED_ID) so searches skip them.
+
+    The slots stay in the file until the next write_snapshot(). Returns how many rows were masked.
+    """
+    removed = 0
+    with _locked(path, exclusive=True), open(path, "r+b") as data:
+        rows, dim = _read_shape(data)
+        existing = _load_ids(path, rows)
+        index = {track_id: i for i, track_id in enumerate(existing)}
+        zero = np.zeros(dim, dtype=EMBEDDING_DTYPE).tobytes()
+        for track_id in set(ids):
+            i = index.get(track_id)
+            if i is None:
+                continue
+            data.seek(HEADER_BYTES + i * len(zero))
+            data.write(zero)
+            existing[i] = REMOVED_ID
+            removed += 1
+        if removed:
+            tmp = _ids_path(path) + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as ids_out:
+                ids_out.write("".join(f"{track_id}\n" for track_id in existing))
+            os.replace(tmp, _ids_path(path))
+    if meta is not None:
+        _write_meta(path, {**read_meta(path), **meta})
+    return removed
+
+
+def _load_ids(path: str, rows: int) -> List[str]:
+    with open(_ids_path(path), encoding="utf-8") as f:
+        ids = f.read().split()
+    if len(ids) < rows:
+        raise ValueError(f"{_ids_path(path)} has {len(ids)} ids for {rows} rows")
+    return ids[:rows]
+
+
+class EmbeddingStore:
+    """Read-only, memory-mapped view of an embedding snapshot.
+
+    The matrix is an np.memmap, so every process that opens the same file shares one
+    page-cached copy and nothing is parsed or copied up front. `refresh()` picks up
+    appends and replaced snapshots.
+    """
+
+    def __init__(self, path: str = EMBEDDINGS_PATH, refresh_seconds: float = STORE_REFRESH_SECONDS):
+        self.path = path
+        self.refresh_seconds = refresh_seconds
+        self.matrix = np.zeros((0, EMBEDDING_DIM), dtype=EMBEDDING_DTYPE)
+        self.ids: List[str] = []
+        self._index: Dict[str, int] = {}
+        self._removed: List[int] = []
+        self._stamp = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self.refresh(force=True)
+
+    def __len__(self):
+        return len(self._index)
+
+    def refresh(self, force: bool = False) -> bool:
+        """Remaps the file if it changed since the last load. Returns True when it did."""
+        now = time.monotonic()
+        if not force and now - self._checked < self.refresh_seconds:
+            return False
+        self._checked = now
+        if not os.path.exists(self.path):
+            return False
+        with _locked(self.path, exclusive=False):
+            with open(self.path, "rb") as f:
+                shape = _read_shape(f)
+                # remove() rewrites only the ids file, so its mtime is part of the stamp.
+                stamp = (os.fstat(f.fileno()).st_ino, shape, os.stat(_ids_path(self.path)).st_mtime_ns)
+            if stamp == self._stamp:
+                return False
+            matrix = np.load(self.path, mmap_mode="r")
+            ids = _load_ids(self.path, shape[0])
+        with self._lock:
+            self.matrix, self.ids = matrix, ids
+            self._index = {track_id: i for i, track_id in enumerate(ids) if track_id != REMOVED_ID}
+            self._removed = [i for i, track_id in enumerate(ids) if track_id == REMOVED_ID]
+            self._stamp = stamp
+        return True
+
+    def vectors(self, track_ids: Sequence[str]) -> Tuple[List[str], np.ndarray]:
+        """(found ids, float32 rows) for the ids present in the snapshot."""
+        self.refresh()
+        with self._lock:
+            found = [t for t in track_ids if t in self._index]
+            rows = [self._index[t] for t in found]
+            matrix = self.matrix
+        return found, np.asarray(matrix[rows], dtype=np.float32)
+
+    def cosine(self, query: np.ndarray, track_ids: Sequence[str]) -> Dict[str, float]:
+        """Exact cosine similarity of `query` to each listed track in the snapshot."""
+        found, vecs = self.vectors(track_ids)
+        if not found:
+            return {}
+        q = np.asarray(query, dtype=np.float32)
+        sims = vecs @ q / (np.linalg.norm(vecs, axis=1) * np.linalg.norm(q) + 1e-12)
+        return dict(zip(found, sims.tolist()))
+
+    def top_k(self, query: np.ndarray, k: int = 20, exclude: Sequence[str] = ()) -> List[Tuple[str, float]]:
+        """Brute-force cosine over the whole snapshot, scanned in chunks to bound memory."""
+        self.refresh()
+        with self._lock:
+            matrix, ids, index, removed = self.matrix, self.ids, self._index, self._removed
+        if not len(ids) or k <= 0:
+            return []
+        q = np.asarray(query, dtype=np.float32)
+        q = q / (np.linalg.norm(q) + 1e-12)
+        sims = np.empty(len(ids), dtype=np.float32)
+        for start in range(0, len(ids), TOPK_CHUNK_ROWS):
+            chunk = np.asarray(matrix[start:start + TOPK_CHUNK_ROWS], dtype=np.float32)
+            sims[start:start + len(chunk)] = chunk @ q / (np.linalg.norm(chunk, axis=1) + 1e-12)
+        excluded = list({index[t] for t in exclude if t in index}) + removed
+        sims[excluded] = -np.inf
+        k = min(k, len(ids) - len(excluded))
+        if k <= 0:
+            return []
+        top = np.argpartition(-sims, k - 1)[:k]
+        top = top[np.argsort(-sims[top])]
+        return [(ids[i], float(sims[i])) for i in top]
+
+    def similar(self, track_id: str, k: int = 20, exclude: Sequence[str] = ()) -> List[Tuple[str, float]]:
+        found, vecs = self.vectors([track_id])
+        if not found:
+            return []
+        return self.top_k(vecs[0], k, [*exclude, track_id])
+
+
+def open_store(path: str = EMBEDDINGS_PATH) -> Optional[EmbeddingStore]:
+    """A store for `path` (empty until a snapshot is exported there), or None if the file is unreadable."""
+    try:
+        return EmbeddingStore(path)
+    except Exception as e:
+        print(f"Warning: failed to open embedding snapshot {path}: {e}")
+        return None
@@ -0,0 +1,241 @@
+import os
+import glob
+import json
+import fcntl
+import time
+import asyncio
+from collections import deque
+from typing import Callable, Dict, List, Optional
+
+from postgrest import APIError
+
+from db import insert_events
+
+EVENT_QUEUE_MAX = int(os.environ.get("EVENT_QUEUE_MAX", "50000"))
+EVENT_FLUSH_SIZE = int(os.environ.get("EVENT_FLUSH_SIZE", "500"))
+EVENT_FLUSH_INTERVAL_SECONDS = float(os.environ.get("EVENT_FLUSH_INTERVAL_SECONDS", "1.0"))
+EVENT_SPOOL_DIR = os.environ.get("EVENT_SPOOL_DIR", "event_spool")
+EVENT_RETRY_MAX_SECONDS = 30.0
+
+
+class IngestOverloaded(Exception):
+    pass
+
+
+class _Segment:
+    """A spool file, held open under an exclusive flock until all of its events are flushed.
+
+    The lock is what tells other processes sharing the spool directory (e.g. uvicorn
+    workers) that the segment is live and must not be replayed.
+    """
+
+    def __init__(self, path: str, file):
+        self.path = path
+        self.file = file
+        self.pending = 0
+        self.closed = False
+
+
+class EventIngestor:
+    """Buffers events in memory and writes them to `events` in bulk.
+
+    Every accepted event is first appended to a write-ahead spool segment on disk; a
+    segment is deleted once all of its events are in the database, and segments whose
+    owner is gone (no flock held) are replayed on start(). Events carry their own id and
+    are upserted with ignore-duplicates, so a replay never double-counts. Segments are
+    fsynced when rotated (every flush interval), so a process crash loses nothing and a
+    host crash at most the last interval.
+    """
+
+    def __init__(self, supabase, spool_dir: str = EVENT_SPOOL_DIR, max_queue: int = EVENT_QUEUE_MAX,
+                 flush_size: int = EVENT_FLUSH_SIZE, flush_interval: float = EVENT_FLUSH_INTERVAL_SECONDS):
+        self.supabase = supabase
+        self.spool_dir = spool_dir
+        self.max_queue = max_queue
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.listeners: List[Callable[[List[dict]], None]] = []
+        self.metrics: Dict[str, float] = {
+            "accepted": 0, "shed": 0, "flushed": 0, "rejected": 0,
+            "batches": 0, "flush_failures": 0, "replayed": 0, "last_flush_ms": 0.0,
+        }
+        self._buffer = deque()  # (row, segment)
+        self._inflight = 0
+        self._segment: Optional[_Segment] = None
+        self._spool = None
+        self._seq = 0
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    # --- spool ---
+
+    def _open_segment(self):
+        self._seq += 1
+        path = os.path.join(self.spool_dir, f"{int(time.time() * 1000)}-{os.getpid()}-{self._seq}.jsonl")
+        self._spool = open(path, "a", encoding="utf-8")
+        fcntl.flock(self._spool, fcntl.LOCK_EX)
+        self._segment = _Segment(path, self._spool)
+
+    def _rotate(self):
+        """Seals the active segment; it's deleted (and unlocked) once drained."""
+        if self._segment is None:
+            return
+        self._spool.flush()
+        os.fsync(self._spool.fileno())
+        self._segment.closed = True
+        self._release(self._segment, 0)
+        self._segment = None
+        self._spool = None
+
+    def _release(self, segment: _Segment, n: int):
+        segment.pending -= n
+        if segment.closed and segment.pending <= 0:
+            try:
+                os.remove(segment.path)
+            except FileNotFoundError:
+                pass
+            # Removing before unlocking: a replaying process never sees a drained, unlocked file.
+            segment.file.close()
+
+    def _replay(self):
+        for path in sorted(glob.glob(os.path.join(self.spool_dir, "*.jsonl"))):
+            try:
+                f = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue  # drained by its owner meanwhile
+            try:
+                fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                f.close()
+                continue  # still being written or drained by another process
+            if not os.path.exists(path):
+                f.close()
+                continue
+            segment = _Segment(path, f)
+            segment.closed = True
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    continue  # torn final write
+                self._buffer.append((row, segment))
+                segment.pending += 1
+            self.metrics["replayed"] += segment.pending
+            self._release(segment, 0)
+
+    # --- lifecycle ---
+
+    async def start(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        self._replay()
+        self._wake = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        # Whatever can't be flushed now stays in the spool and is replayed on the next start.
+        self._rotate()
+        while self._buffer and await self._flush_once():
+            pass
+
+    # --- ingest ---
+
+    def submit(self, rows: List[dict]) -> int:
+        """Accepts a batch of event rows or raises IngestOverloaded (all-or-nothing)."""
+        if len(self._buffer) + self._inflight + len(rows) > self.max_queue:
+            self.metrics["shed"] += len(rows)
+            raise IngestOverloaded("Event buffer full")
+        if self._segment is None:
+            self._open_segment()
+        self._spool.write("".join(json.dumps(r, default=str) + "\n" for r in rows))
+        self._spool.flush()
+        for row in rows:
+            self._buffer.append((row, self._segment))
+        self._segment.pending += len(rows)
+        self.metrics["accepted"] += len(rows)
+        for listener in self.listeners:
+            try:
+                listener(rows)
+            except Exception as e:
+                print(f"Event listener failed: {e}")
+        if len(self._buffer) >= self.flush_size and self._wake:
+            self._wake.set()
+        return len(rows)
+
+    def stats(self) -> dict:
+        return {**self.metrics, "queue_depth": len(self._buffer), "inflight": self._inflight,
+                "capacity": self.max_queue}
+
+    # --- flush ---
+
+    async def _run(self):
+        backoff = self.flush_interval
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            self._rotate()
+            while self._buffer:
+                if not await self._flush_once():
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, EVENT_RETRY_MAX_SECONDS)
+                    break
+                backoff = self.flush_interval
+
+    async def _flush_once(self) -> bool:
+        n = min(self.flush_size, len(self._buffer))
+        batch = [self._buffer.popleft() for _ in range(n)]
+        self._inflight += n
+        started = time.monotonic()
+        try:
+            rejected = await asyncio.to_thread(self._insert_isolating, [row for row, _ in batch])
+        except Exception as e:
+            # Transient failure: put the batch back in order and retry later.
+            self.metrics["flush_failures"] += 1
+            print(f"Event flush failed ({n} events): {e}")
+            self._buffer.extendleft(reversed(batch))
+            return False
+        finally:
+            self._inflight -= n
+
+        self.metrics["batches"] += 1
+        self.metrics["flushed"] += n - rejected
+        self.metrics["rejected"] += rejected
+        self.metrics["last_flush_ms"] = round((time.monotonic() - started) * 1000, 1)
+        segments: Dict[int, list] = {}
+        for _, segment in batch:
+            segments.setdefault(id(segment), [segment, 0])[1] += 1
+        for segment, count in segments.values():
+            self._release(segment, count)
+        return True
+
+    def _insert(self, rows: List[dict]):
+        insert_events(self.supabase, rows)
+
+    def _insert_isolating(self, rows: List[dict]) -> int:
+        """Inserts rows; a batch failing on bad data is bisected so only the offending rows are dropped.
+
+        Returns how many rows were rejected. Non-data errors propagate for a retry.
+        """
+        try:
+            self._insert(rows)
+            return 0
+        except APIError as e:
+            # Postgres classes 22 (data exception) and 23 (constraint violation) won't fix themselves.
+            if not (e.code or "").startswith(("22", "23")):
+                raise
+            if len(rows) == 1:
+                print(f"Dropping invalid event {rows[0].get('id')}: {e.message}")
+                return 1
+        mid = len(rows) // 2
+        return self._insert_isolating(rows[:mid]) + self._insert_isolating(rows[mid:])
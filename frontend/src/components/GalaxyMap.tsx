@@ -9,6 +9,7 @@ export default function GalaxyMap() {
     const {
         tracks,
         setTracks,
+        applyTrackChanges,
         setHoveredTrack,
         hoveredTrack,
         setPlayingTrack,
@@ -24,15 +25,23 @@ export default function GalaxyMap() {
 
     useEffect(() => {
         let alive = true;
+        let cursor = 0;
         const apiUrl = process.env.NEXT_PUBLIC_API_URL || "http://localhost:7860";
 
+        // Delta sync: the first call (cursor 0) returns the full LIVE catalog,
+        // later calls only what was placed, moved or removed since `cursor`.
         const fetchTracks = async () => {
             try {
-                const res = await fetch(`${apiUrl}/tracks?status=LIVE`);
+                const res = await fetch(`${apiUrl}/tracks/changes?since=${cursor}`);
                 if (!res.ok) return;
                 const data = await res.json();
                 if (!alive) return;
-                setTracks(data.tracks || []);
+                if (data.reset) {
+                    setTracks(data.upserts || []);
+                } else if (data.upserts?.length || data.removed?.length) {
+                    applyTrackChanges(data.upserts || [], data.removed || []);
+                }
+                cursor = data.cursor ?? cursor;
             } catch (e) {
                 console.error("Failed to fetch tracks", e);
             }
@@ -44,7 +53,7 @@ export default function GalaxyMap() {
             alive = false;
             clearInterval(id);
         };
-    }, [setTracks]);
+    }, [setTracks, applyTrackChanges]);
 
     useEffect(() => {
         if (!pendingUploadTrackId || !tracks.length) return;
@@ -18,6 +18,7 @@ export interface Track {
 interface StellosState {
     tracks: Track[];
     setTracks: (tracks: Track[]) => void;
+    applyTrackChanges: (upserts: Track[], removed: string[]) => void;
 
     hoveredTrack: Track | null;
     setHoveredTrack: (track: Track | null) => void;
@@ -39,6 +40,12 @@ interface StellosState {
 export const useStore = create<StellosState>((set) => ({
     tracks: [],
     setTracks: (tracks) => set({ tracks }),
+    applyTrackChanges: (upserts, removed) => set((state) => {
+        const byId = new Map(state.tracks.map((t) => [t.id, t]));
+        for (const id of removed) byId.delete(id);
+        for (const t of upserts) byId.set(t.id, t);
+        return { tracks: Array.from(byId.values()) };
+    }),
 
     hoveredTrack: null,
     setHoveredTrack: (track) => set({ hoveredTrack: track }),
@@ -0,0 +1,103 @@
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+# Score = sum of weight * feature. Features are on comparable scales:
+#   similarity  cosine similarity to the seed (or prompt), -1..1
+#   gravity     normalized track_edges weight from the current track, <= 1
+#   votes       log-scaled vote_score relative to the best in the pool, 0..1
+#   repeat      recency of a play in this session, 1 for the last track .. ~0
+DEFAULT_WEIGHTS = {"similarity": 1.0, "gravity": 0.6, "votes": 0.15, "repeat": 2.0}
+# A track played this many tracks ago has half the repeat penalty of the last one.
+REPEAT_HALF_LIFE = 10.0
+
+
+def _align(ids: np.ndarray, values: Optional[Dict[str, float]], default: float = np.nan) -> np.ndarray:
+    """Looks up `values` for every id with one sort + searchsorted instead of a dict probe per id."""
+    out = np.full(len(ids), default, dtype=np.float64)
+    if not values or not len(ids):
+        return out
+    keys = np.array(list(values.keys()))
+    vals = np.array(list(values.values()), dtype=np.float64)
+    order = np.argsort(keys)
+    keys, vals = keys[order], vals[order]
+    pos = np.clip(np.searchsorted(keys, ids), 0, len(keys) - 1)
+    hit = keys[pos] == ids
+    out[hit] = vals[pos[hit]]
+    return out
+
+
+def repeat_recency(ids: np.ndarray, session_history: Sequence[str], half_life: float = REPEAT_HALF_LIFE) -> np.ndarray:
+    """1.0 for the most recently played track, halving every `half_life` plays back; 0 if never played."""
+    if not len(session_history) or not len(ids):
+        return np.zeros(len(ids))
+    recent_first = np.array(list(session_history)[::-1])
+    uniq, first = np.unique(recent_first, return_index=True)
+    ages = _align(ids, dict(zip(uniq.tolist(), first.tolist())))
+    return np.where(np.isnan(ages), 0.0, 0.5 ** (np.nan_to_num(ages) / half_life))
+
+
+def score_candidates(similarity: np.ndarray, gravity: np.ndarray, votes: np.ndarray, repeat: np.ndarray,
+                     weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+    """Hybrid score for aligned feature arrays (one entry per candidate)."""
+    w = {**DEFAULT_WEIGHTS, **(weights or {})}
+    similarity = np.asarray(similarity, dtype=np.float64)
+    # Candidates without a similarity (e.g. gravity-only) rank like the weakest match in the pool.
+    if np.isnan(similarity).any():
+        floor = np.nanmin(similarity) if not np.isnan(similarity).all() else 0.0
+        similarity = np.where(np.isnan(similarity), floor, similarity)
+    gravity = np.nan_to_num(np.asarray(gravity, dtype=np.float64))
+    votes = np.log1p(np.clip(np.nan_to_num(np.asarray(votes, dtype=np.float64)), 0, None))
+    top = votes.max() if len(votes) else 0.0
+    if top > 0:
+        votes = votes / top
+    return (
+        w["similarity"] * similarity
+        + w["gravity"] * gravity
+        + w["votes"] * votes
+        - w["repeat"] * np.asarray(repeat, dtype=np.float64)
+    )
+
+
+def rank_candidates(current_track_id: str, candidate_track_ids: Sequence[str],
+                    embeddings_scores: Optional[Dict[str, float]] = None,
+                    session_history: Sequence[str] = (),
+                    gravity_scores: Optional[Dict[str, float]] = None,
+                    vote_scores: Optional[Dict[str, float]] = None,
+                    weights: Optional[Dict[str, float]] = None,
+                    top_n: Optional[int] = None) -> List[dict]:
+    """Ranks next-track candidates, best first.
+
+    embeddings_scores: track id -> cosine similarity to the seed.
+    gravity_scores: track id -> normalized gravity weight from current_track_id.
+    vote_scores: track id -> vote_score.
+    The current track is never returned. Missing entries count as neutral.
+    """
+    ids = np.array(list(dict.fromkeys(candidate_track_ids)))
+    if len(ids):
+        ids = ids[ids != current_track_id]
+    if not len(ids):
+        return []
+
+    similarity = _align(ids, embeddings_scores)
+    gravity = _align(ids, gravity_scores, 0.0)
+    votes = _align(ids, vote_scores, 0.0)
+    repeat = repeat_recency(ids, session_history)
+    scores = score_candidates(similarity, gravity, votes, repeat, weights)
+
+    if top_n is not None and top_n < len(ids):
+        part = np.argpartition(-scores, top_n)[:top_n]
+        order = part[np.argsort(-scores[part])]
+    else:
+        order = np.argsort(-scores)
+    return [
+        {
+            "track_id": str(ids[i]),
+            "score": float(scores[i]),
+            "similarity": None if np.isnan(similarity[i]) else float(similarity[i]),
+            "gravity": float(gravity[i]),
+            "votes": float(votes[i]),
+            "repeat": float(repeat[i]),
+        }
+        for i in order
+    ]
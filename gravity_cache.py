@@ -0,0 +1,172 @@
+import os
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+GRAVITY_CACHE_SIZE = int(os.environ.get("GRAVITY_CACHE_SIZE", "20000"))
+GRAVITY_TOP_K = int(os.environ.get("GRAVITY_TOP_K", "50"))
+GRAVITY_INVALIDATE_SECONDS = float(os.environ.get("GRAVITY_INVALIDATE_SECONDS", "5"))
+# Must match the builder's --half-life-days.
+GRAVITY_HALF_LIFE_DAYS = float(os.environ.get("GRAVITY_HALF_LIFE_DAYS", "30"))
+
+
+def normalize_edges(edges: List[dict]) -> List[dict]:
+    """Edges sorted by weight desc -> neighbor list scored against the strongest edge.
+
+    The strongest edge is the same for any prefix of the list, so a cached top-K list can
+    be sliced to a smaller limit without renormalizing.
+    """
+    if not edges:
+        return []
+    max_weight = max(float(e["weight"]) for e in edges)
+    return [
+        {
+            "track_id": e["to_track_id"],
+            "weight": e["weight"],
+            "normalized_score": float(e["weight"]) / max_weight if max_weight > 0 else 0,
+        }
+        for e in edges
+    ]
+
+
+def canonical_id(track_id: str) -> Optional[str]:
+    """Lowercase hyphenated UUID, or None if `track_id` isn't a UUID."""
+    try:
+        return str(uuid.UUID(str(track_id)))
+    except ValueError:
+        return None
+
+
+class NeighborCache:
+    """LRU of track id -> top-K normalized gravity neighbors.
+
+    Entries are dropped when the gravity builder logs a batch touching their track
+    (gravity_batches), checked at most every `invalidate_seconds`.
+    """
+
+    def __init__(self, supabase, max_size: int = GRAVITY_CACHE_SIZE, top_k: int = GRAVITY_TOP_K,
+                 invalidate_seconds: float = GRAVITY_INVALIDATE_SECONDS):
+        self.supabase = supabase
+        self.max_size = max_size
+        self.top_k = top_k
+        self.invalidate_seconds = invalidate_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._epoch = 0
+        self._last_batch_id: Optional[int] = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _fetch(self, track_ids: List[str], limit: int) -> Dict[str, List[dict]]:
+        res = self.supabase.rpc("gravity_neighbors_bulk", {
+            "p_track_ids": track_ids,
+            "p_limit": limit,
+            "p_half_life_days": GRAVITY_HALF_LIFE_DAYS,
+        }).execute()
+        edges: Dict[str, List[dict]] = {t: [] for t in track_ids}
+        for row in res.data or []:
+            edges[row["from_track_id"]].append(row)
+        return {t: normalize_edges(rows) for t, rows in edges.items()}
+
+    def get_many(self, track_ids: List[str], limit: int = GRAVITY_TOP_K) -> Dict[str, List[dict]]:
+        """Neighbor lists for many tracks, keyed by the ids as given; misses are resolved in a single round-trip.
+
+        Ids are matched in canonical UUID form (what PostgREST returns); one that isn't a UUID has no neighbors.
+        """
+        canonical = {t: canonical_id(t) for t in track_ids}
+        found = self._get_canonical(list(dict.fromkeys(c for c in canonical.values() if c)), limit)
+        return {t: found.get(c, []) for t, c in canonical.items()}
+
+    def _get_canonical(self, track_ids: List[str], limit: int) -> Dict[str, List[dict]]:
+        if not track_ids:
+            return {}
+        if limit > self.top_k:
+            # Deeper than what's cached; go straight to the database.
+            return self._fetch(track_ids, limit)
+
+        self.maybe_invalidate()
+        found, missing = {}, []
+        with self._lock:
+            for track_id in track_ids:
+                entry = self._entries.get(track_id)
+                if entry is None:
+                    missing.append(track_id)
+                    continue
+                self._entries.move_to_end(track_id)
+                found[track_id] = entry[:limit]
+            self.hits += len(found)
+            self.misses += len(missing)
+            epoch = self._epoch
+
+        if missing:
+            fetched = self._fetch(missing, self.top_k)
+            with self._lock:
+                # An invalidation that raced the fetch may have been for these rows; don't cache them.
+                if epoch == self._epoch:
+                    for track_id, neighbors in fetched.items():
+                        self._entries[track_id] = neighbors
+                        self._entries.move_to_end(track_id)
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+            for track_id, neighbors in fetched.items():
+                found[track_id] = neighbors[:limit]
+        return found
+
+    def get(self, track_id: str, limit: int = GRAVITY_TOP_K) -> List[dict]:
+        return self.get_many([track_id], limit)[track_id]
+
+    def maybe_invalidate(self):
+        if time.monotonic() - self._checked_at < self.invalidate_seconds:
+            return
+        self._checked_at = time.monotonic()
+        try:
+            self.invalidate()
+        except Exception as e:
+            print(f"Gravity cache invalidation check failed: {e}")
+
+    def invalidate(self):
+        """Drops entries for tracks touched by gravity batches applied since the last check."""
+        if self._last_batch_id is None:
+            res = self.supabase.table("gravity_batches").select("id").order("id", desc=True).limit(1).execute()
+            with self._lock:
+                # Nothing cached yet can predate this; start watching from here.
+                self._last_batch_id = res.data[0]["id"] if res.data else 0
+                self._epoch += 1
+                self._entries.clear()
+            return
+
+        while True:
+            res = (
+                self.supabase.table("gravity_batches")
+                .select("id,from_track_ids")
+                .gt("id", self._last_batch_id)
+                .order("id")
+                .limit(1000)
+                .execute()
+            )
+            batches = res.data or []
+            if not batches:
+                return
+            with self._lock:
+                self._epoch += 1
+                for batch in batches:
+                    for track_id in batch["from_track_ids"] or []:
+                        if self._entries.pop(track_id, None) is not None:
+                            self.invalidations += 1
+                self._last_batch_id = batches[-1]["id"]
+            if len(batches) < 1000:
+                return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "invalidations": self.invalidations,
+                "last_batch_id": self._last_batch_id,
+            }
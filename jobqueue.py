@@ -0,0 +1,289 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Backend selection: "sqlite" (single host, API and workers share a disk) or "postgres" (Supabase `jobs` table).
+JOB_QUEUE_BACKEND = os.environ.get("JOB_QUEUE_BACKEND", "sqlite")
+JOB_QUEUE_PATH = os.environ.get("JOB_QUEUE_PATH", "stellos_jobs.db")
+JOB_BACKOFF_BASE_SECONDS = float(os.environ.get("JOB_BACKOFF_BASE_SECONDS", "10"))
+JOB_BACKOFF_MAX_SECONDS = float(os.environ.get("JOB_BACKOFF_MAX_SECONDS", "900"))
+
+# Job states: queued -> running -> done, or back to queued with a backoff delay
+# until max_attempts is used up, then dead (dead-letter, kept for inspection).
+STATUSES = ("queued", "running", "done", "dead")
+
+
+def backoff_seconds(attempts: int) -> float:
+    return min(JOB_BACKOFF_BASE_SECONDS * (2 ** max(attempts - 1, 0)), JOB_BACKOFF_MAX_SECONDS)
+
+
+class JobQueue(ABC):
+    """Interface shared by the queue backends. Jobs are plain dicts.
+
+    complete() and fail() only act while `worker_id` still holds the job's lease; once a lease
+    expires and another worker reclaims the job, the late worker's result is dropped.
+    """
+
+    @abstractmethod
+    def enqueue(self, kind: str, payload: Dict[str, Any], priority: int = 0,
+                max_attempts: int = 5, blob: Optional[bytes] = None) -> str:
+        ...
+
+    def enqueue_many(self, jobs: List[Dict[str, Any]]) -> List[str]:
+        """Enqueues several jobs (dicts of enqueue() arguments) at once."""
+        return [self.enqueue(**job) for job in jobs]
+
+    @abstractmethod
+    def claim(self, worker_id: str, limit: int = 1, lease_seconds: int = 300,
+              kinds: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        """Marks the job done; False if `worker_id` no longer holds the lease."""
+
+    @abstractmethod
+    def fail(self, job_id: str, error: str, worker_id: str) -> bool:
+        """Requeues the job with backoff (or dead-letters it); False if the lease was lost."""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        ...
+
+
+class SQLiteJobQueue(JobQueue):
+    """Local queue in a SQLite file. Claims take a write lock (BEGIN IMMEDIATE), so they are atomic across processes.
+
+    Only this backend keeps `blob`, which lets workers decode uploads without downloading them again.
+    """
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                blob BLOB,
+                priority INTEGER NOT NULL DEFAULT 0,
+                status TEXT NOT NULL DEFAULT 'queued',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                max_attempts INTEGER NOT NULL DEFAULT 5,
+                run_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, priority DESC, run_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, kind, payload, priority=0, max_attempts=5, blob=None):
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        self._conn().execute(
+            "INSERT INTO jobs (id, kind, payload, blob, priority, max_attempts, run_at, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(payload), blob, priority, max_attempts, now, now, now),
+        )
+        return job_id
+
+    def enqueue_many(self, jobs):
+        now = time.time()
+        rows = [
+            (str(uuid.uuid4()), j["kind"], json.dumps(j["payload"]), j.get("blob"), j.get("priority", 0),
+             j.get("max_attempts", 5), now, now, now)
+            for j in jobs
+        ]
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT INTO jobs (id, kind, payload, blob, priority, max_attempts, run_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return [r[0] for r in rows]
+
+    def claim(self, worker_id, limit=1, lease_seconds=300, kinds=None):
+        conn = self._conn()
+        now = time.time()
+        kind_filter = ""
+        params: List[Any] = [now, now]
+        if kinds:
+            kind_filter = f" AND kind IN ({','.join('?' * len(kinds))})"
+            params.extend(kinds)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Running jobs whose lease ran out belong to a dead worker; dead-letter those out of attempts.
+            conn.execute(
+                "UPDATE jobs SET status = 'dead', last_error = 'lease expired', updated_at = ? "
+                "WHERE status = 'running' AND lease_expires_at < ? AND attempts >= max_attempts",
+                (now, now),
+            )
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE ((status = 'queued' AND run_at <= ?) "
+                "OR (status = 'running' AND lease_expires_at < ?))" + kind_filter +
+                " ORDER BY priority DESC, run_at LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+            ids = [r["id"] for r in rows]
+            if ids:
+                conn.execute(
+                    f"UPDATE jobs SET status = 'running', lease_owner = ?, lease_expires_at = ?, "
+                    f"attempts = attempts + 1, updated_at = ? WHERE id IN ({','.join('?' * len(ids))})",
+                    (worker_id, now + lease_seconds, now, *ids),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        jobs = []
+        for r in rows:
+            job = dict(r)
+            job["payload"] = json.loads(job["payload"])
+            job["attempts"] += 1
+            job["status"] = "running"
+            jobs.append(job)
+        return jobs
+
+    def complete(self, job_id, worker_id):
+        cur = self._conn().execute(
+            "UPDATE jobs SET status = 'done', blob = NULL, lease_owner = NULL, updated_at = ? "
+            "WHERE id = ? AND status = 'running' AND lease_owner = ?",
+            (time.time(), job_id, worker_id),
+        )
+        return cur.rowcount > 0
+
+    def fail(self, job_id, error, worker_id):
+        conn = self._conn()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT attempts, max_attempts FROM jobs WHERE id = ? AND status = 'running' AND lease_owner = ?",
+                (job_id, worker_id),
+            ).fetchone()
+            if row and row["attempts"] >= row["max_attempts"]:
+                conn.execute(
+                    "UPDATE jobs SET status = 'dead', last_error = ?, lease_owner = NULL, updated_at = ? WHERE id = ?",
+                    (error, now, job_id),
+                )
+            elif row:
+                conn.execute(
+                    "UPDATE jobs SET status = 'queued', last_error = ?, lease_owner = NULL, run_at = ?, updated_at = ? "
+                    "WHERE id = ?",
+                    (error, now + backoff_seconds(row["attempts"]), now, job_id),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return row is not None
+
+    def stats(self):
+        rows = self._conn().execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        counts = {s: 0 for s in STATUSES}
+        counts.update({r["status"]: r["n"] for r in rows})
+        return counts
+
+
+class PostgresJobQueue(JobQueue):
+    """Queue backed by the Supabase `jobs` table; claims go through the claim_jobs RPC (FOR UPDATE SKIP LOCKED).
+
+    Payloads must be JSON; `blob` is ignored, so workers fetch audio from storage.
+    """
+
+    def __init__(self, supabase):
+        self.supabase = supabase
+
+    def enqueue(self, kind, payload, priority=0, max_attempts=5, blob=None):
+        job_id = str(uuid.uuid4())
+        self.supabase.table("jobs").insert({
+            "id": job_id,
+            "kind": kind,
+            "payload": payload,
+            "priority": priority,
+            "max_attempts": max_attempts,
+        }).execute()
+        return job_id
+
+    def enqueue_many(self, jobs):
+        rows = [
+            {
+                "id": str(uuid.uuid4()),
+                "kind": j["kind"],
+                "payload": j["payload"],
+                "priority": j.get("priority", 0),
+                "max_attempts": j.get("max_attempts", 5),
+            }
+            for j in jobs
+        ]
+        if rows:
+            self.supabase.table("jobs").insert(rows).execute()
+        return [r["id"] for r in rows]
+
+    def claim(self, worker_id, limit=1, lease_seconds=300, kinds=None):
+        res = self.supabase.rpc("claim_jobs", {
+            "p_worker_id": worker_id,
+            "p_limit": limit,
+            "p_lease_seconds": lease_seconds,
+            "p_kinds": kinds,
+        }).execute()
+        return res.data or []
+
+    def complete(self, job_id, worker_id):
+        res = self.supabase.rpc("complete_job", {"p_job_id": job_id, "p_worker_id": worker_id}).execute()
+        return bool(res.data)
+
+    def fail(self, job_id, error, worker_id):
+        res = self.supabase.rpc("fail_job", {
+            "p_job_id": job_id,
+            "p_error": error,
+            "p_worker_id": worker_id,
+            "p_backoff_base_seconds": JOB_BACKOFF_BASE_SECONDS,
+            "p_backoff_max_seconds": JOB_BACKOFF_MAX_SECONDS,
+        }).execute()
+        return res.data is not None
+
+    def stats(self):
+        counts = {}
+        for status in STATUSES:
+            res = self.supabase.table("jobs").select("id", count="exact").eq("status", status).limit(1).execute()
+            counts[status] = res.count or 0
+        return counts
+
+
+def create_queue(backend: str = JOB_QUEUE_BACKEND, supabase=None) -> JobQueue:
+    if backend == "postgres":
+        if supabase is None:
+            raise RuntimeError("Postgres job queue needs a Supabase client")
+        return PostgresJobQueue(supabase)
+    if backend == "sqlite":
+        return SQLiteJobQueue()
+    raise ValueError(f"Unknown JOB_QUEUE_BACKEND: {backend}")
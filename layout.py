@@ -0,0 +1,114 @@
+import json
+import time
+import base64
+import random
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# Map coordinates live in [0, MAP_SIZE]; the 1st..99th percentile of the fitted catalog
+# spans [MAP_MARGIN, MAP_SIZE - MAP_MARGIN] so outliers still land on the map.
+MAP_SIZE = 100.0
+MAP_MARGIN = 5.0
+PROJECTION_REFRESH_SECONDS = 300.0
+
+_cached_projection: Optional[Dict] = None
+_cached_at = 0.0
+
+
+def parse_vector(value) -> np.ndarray:
+    """Parses a pgvector value as returned by PostgREST ("[0.1,0.2,...]")."""
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def decode_halfvec(value: str) -> np.ndarray:
+    """Decodes an export_embeddings value (base64 of halfvec_send) to a float16 vector."""
+    return np.frombuffer(base64.b64decode(value), dtype=">f2", offset=4).astype(np.float16)
+
+
+def fit_projection(embeddings: np.ndarray) -> Dict:
+    """Fits a 2D PCA projection (via SVD) to an (n, d) embedding matrix."""
+    X = np.asarray(embeddings, dtype=np.float64)
+    mean = X.mean(axis=0)
+    centered = X - mean
+    # Top-2 right singular vectors are the principal axes.
+    _, _, vt = np.linalg.svd(centered, full_matrices=False)
+    components = vt[:2]
+    coords = centered @ components.T
+    lo = np.percentile(coords, 1, axis=0)
+    hi = np.percentile(coords, 99, axis=0)
+    hi = np.where(hi - lo < 1e-9, lo + 1.0, hi)
+    return {
+        "method": "pca",
+        "mean": mean.tolist(),
+        "components": components.tolist(),
+        "lo": lo.tolist(),
+        "hi": hi.tolist(),
+        "n_tracks": int(X.shape[0]),
+    }
+
+
+def project(projection: Dict, embeddings: np.ndarray) -> np.ndarray:
+    """Places (n, d) embeddings on the map with a frozen projection. Returns (n, 2) coordinates."""
+    X = np.atleast_2d(np.asarray(embeddings, dtype=np.float64))
+    mean = np.asarray(projection["mean"])
+    components = np.asarray(projection["components"])
+    lo = np.asarray(projection["lo"])
+    hi = np.asarray(projection["hi"])
+    coords = (X - mean) @ components.T
+    scaled = MAP_MARGIN + (coords - lo) / (hi - lo) * (MAP_SIZE - 2 * MAP_MARGIN)
+    return np.clip(scaled, 0.0, MAP_SIZE)
+
+
+def load_projection(supabase, max_age: float = PROJECTION_REFRESH_SECONDS) -> Optional[Dict]:
+    """Latest fitted projection, cached in-process for `max_age` seconds."""
+    global _cached_projection, _cached_at
+    if _cached_projection is not None and time.monotonic() - _cached_at < max_age:
+        return _cached_projection
+    try:
+        res = supabase.table("layout_projections").select("*").order("id", desc=True).limit(1).execute()
+        _cached_projection = res.data[0] if res.data else None
+        _cached_at = time.monotonic()
+    except Exception as e:
+        print(f"Failed to load layout projection: {e}")
+    return _cached_projection
+
+
+def save_projection(supabase, projection: Dict):
+    global _cached_projection, _cached_at
+    res = supabase.table("layout_projections").insert(projection).execute()
+    _cached_projection = res.data[0] if res.data else projection
+    _cached_at = time.monotonic()
+    return _cached_projection
+
+
+def place(supabase, embeddings) -> List[Tuple[float, float]]:
+    """Map positions for freshly embedded tracks; random until a projection has been fitted."""
+    X = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    projection = load_projection(supabase) if supabase else None
+    if projection is None:
+        return [(random.uniform(0, MAP_SIZE), random.uniform(0, MAP_SIZE)) for _ in range(len(X))]
+    return [(float(x), float(y)) for x, y in project(projection, X)]
+
+
+def iter_embeddings(supabase, page_size: int = 1000, status: str = "LIVE", dtype=np.float32,
+                    after: Optional[str] = None) -> Iterator[Tuple[List[str], np.ndarray]]:
+    """Streams (ids, matrix) pages of stored embeddings in id order, starting past `after`.
+
+    Vectors travel as base64 float16 (export_embeddings), not pgvector text.
+    """
+    last_id = after
+    while True:
+        rows = supabase.rpc("export_embeddings", {
+            "p_after": last_id,
+            "p_limit": page_size,
+            "p_status": status,
+        }).execute().data or []
+        if not rows:
+            return
+        last_id = rows[-1]["id"]
+        yield [r["id"] for r in rows], np.stack([decode_halfvec(r["embedding"]) for r in rows]).astype(dtype, copy=False)
+        if len(rows) < page_size:
+            return
@@ -0,0 +1,204 @@
+import os
+import time
+import asyncio
+import threading
+from bisect import bisect_left, insort
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+LEADERBOARD_SYNC_SECONDS = float(os.environ.get("LEADERBOARD_SYNC_SECONDS", "5"))
+# window name -> (length, bucket width) in seconds
+LEADERBOARD_WINDOWS = {"hour": (3600, 60), "day": (86400, 3600)}
+# Votes are re-read this far behind the sync cursor: created_at is the inserting
+# transaction's start time, so rows can commit out of order.
+SYNC_OVERLAP_SECONDS = 60.0
+
+
+def _epoch(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+class SortedScores:
+    """(score, track_id) kept sorted with bisect, best first; O(log n) search, O(n) shift per update."""
+
+    def __init__(self):
+        self.scores: Dict[str, int] = {}
+        self._keys: List[Tuple[int, str]] = []  # (-score, track_id)
+
+    def add(self, track_id: str, delta: int):
+        old = self.scores.get(track_id)
+        if old is not None:
+            i = bisect_left(self._keys, (-old, track_id))
+            del self._keys[i]
+        new = (old or 0) + delta
+        if new == 0:
+            self.scores.pop(track_id, None)
+            return
+        self.scores[track_id] = new
+        insort(self._keys, (-new, track_id))
+
+    def top(self, limit: int) -> List[Tuple[str, int]]:
+        return [(track_id, -neg) for neg, track_id in self._keys[:limit]]
+
+    def __len__(self):
+        return len(self._keys)
+
+
+class WindowedScores:
+    """Scores over a sliding window, kept as per-bucket counts that are subtracted as they expire."""
+
+    def __init__(self, length: float, width: float):
+        self.width = width
+        self.n_buckets = int(length // width)
+        self.buckets = deque()  # (bucket, {track_id: tokens}), oldest first
+        self.totals = SortedScores()
+
+    def add(self, track_id: str, tokens: int, ts: float):
+        # Expiring here as well as on read keeps the bucket count bounded by the window
+        # on replicas that record and sync votes but never serve the leaderboard.
+        now = time.time()
+        self.expire(now)
+        bucket = int(ts // self.width)
+        if bucket <= int(now // self.width) - self.n_buckets:
+            return
+        counts = None
+        for b, c in reversed(self.buckets):
+            if b == bucket:
+                counts = c
+                break
+            if b < bucket:
+                break
+        if counts is None:
+            counts = {}
+            self.buckets.append((bucket, counts))
+            if len(self.buckets) > 1 and self.buckets[-2][0] > bucket:
+                # A late vote opened an older bucket; restore order.
+                self.buckets = deque(sorted(self.buckets, key=lambda x: x[0]))
+        counts[track_id] = counts.get(track_id, 0) + tokens
+        self.totals.add(track_id, tokens)
+
+    def expire(self, now: float):
+        oldest = int(now // self.width) - self.n_buckets
+        while self.buckets and self.buckets[0][0] <= oldest:
+            _, counts = self.buckets.popleft()
+            for track_id, tokens in counts.items():
+                self.totals.add(track_id, -tokens)
+
+
+class Leaderboard:
+    """Top tracks by tokens voted, all-time and per window, served from memory.
+
+    Built by streaming `votes` once at startup, then kept current by recording each
+    vote cast through this process and syncing votes cast elsewhere every
+    `sync_seconds`. Vote ids already applied are skipped, so the two paths never
+    double-count.
+    """
+
+    def __init__(self, supabase, windows: Dict[str, Tuple[float, float]] = LEADERBOARD_WINDOWS,
+                 sync_seconds: float = LEADERBOARD_SYNC_SECONDS, page_size: int = 5000):
+        self.supabase = supabase
+        self.sync_seconds = sync_seconds
+        self.page_size = page_size
+        self.all_time = SortedScores()
+        self.windows = {name: WindowedScores(length, width) for name, (length, width) in windows.items()}
+        self.loaded = False
+        self._lock = threading.Lock()
+        self._cursor: Optional[str] = None  # created_at of the newest vote read from the table
+        self._seen: Dict[str, float] = {}  # vote id -> created_at epoch, kept for the overlap window
+
+    def _apply(self, vote_id: str, track_id: str, tokens: int, ts: float):
+        if vote_id in self._seen:
+            return
+        self._seen[vote_id] = ts
+        self.all_time.add(track_id, tokens)
+        for window in self.windows.values():
+            window.add(track_id, tokens, ts)
+
+    def record(self, vote_id: str, track_id: str, tokens: int, ts: Optional[float] = None):
+        with self._lock:
+            self._apply(vote_id, track_id, tokens, ts or time.time())
+
+    def _stream(self, since: Optional[str]):
+        """Votes after `since` in (created_at, id) order, one keyset page at a time."""
+        last_id = None
+        while True:
+            query = (
+                self.supabase.table("votes")
+                .select("id,track_id,tokens_spent,created_at")
+                .order("created_at")
+                .order("id")
+                .limit(self.page_size)
+            )
+            if since and last_id:
+                query = query.or_(f'created_at.gt."{since}",and(created_at.eq."{since}",id.gt.{last_id})')
+            elif since:
+                query = query.gte("created_at", since)
+            rows = query.execute().data or []
+            yield rows
+            if len(rows) < self.page_size:
+                return
+            since, last_id = rows[-1]["created_at"], rows[-1]["id"]
+
+    def _ingest(self, since: Optional[str]) -> int:
+        applied = 0
+        for rows in self._stream(since):
+            with self._lock:
+                for r in rows:
+                    before = len(self._seen)
+                    self._apply(r["id"], r["track_id"], r["tokens_spent"] or 0, _epoch(r["created_at"]))
+                    applied += len(self._seen) - before
+                if rows and (self._cursor is None or _epoch(rows[-1]["created_at"]) > _epoch(self._cursor)):
+                    self._cursor = rows[-1]["created_at"]
+                # The keyset stream never goes back, so only the overlap window needs remembering;
+                # pruning per page keeps a full rebuild's memory flat instead of growing with history.
+                self._prune()
+        return applied
+
+    def rebuild(self) -> int:
+        """Single streaming pass over every vote."""
+        applied = self._ingest(None)
+        self.loaded = True
+        return applied
+
+    def sync(self) -> int:
+        if self._cursor is None:
+            return self.rebuild()
+        since = datetime.fromtimestamp(_epoch(self._cursor) - SYNC_OVERLAP_SECONDS, tz=timezone.utc).isoformat()
+        applied = self._ingest(since)
+        # Quiet periods add nothing, so buckets that aged out are dropped here too.
+        with self._lock:
+            now = time.time()
+            for window in self.windows.values():
+                window.expire(now)
+        return applied
+
+    def _prune(self):
+        """Forgets vote ids older than the overlap window behind the cursor (caller holds the lock)."""
+        if self._cursor is None:
+            return
+        horizon = _epoch(self._cursor) - 2 * SYNC_OVERLAP_SECONDS
+        self._seen = {v: ts for v, ts in self._seen.items() if ts >= horizon}
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.sync)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Leaderboard sync failed: {e}")
+            await asyncio.sleep(self.sync_seconds)
+
+    def top(self, window: str = "all", limit: int = 50) -> List[dict]:
+        with self._lock:
+            if window == "all":
+                scores = self.all_time
+            else:
+                scores = self.windows[window]
+                scores.expire(time.time())
+                scores = scores.totals
+            return [
+                {"rank": i + 1, "track_id": track_id, "score": score}
+                for i, (track_id, score) in enumerate(scores.top(limit))
+            ]
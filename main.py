@@ -1,13 +1,34 @@
+import io
 import os
 import uuid
-from fastapi import FastAPI, UploadFile, File, Form, HTTPException, BackgroundTasks
+import hashlib
+import random
+import asyncio
+import threading
+import numpy as np
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request, Response
+from fastapi.responses import StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from supabase import create_client, Client
 from dotenv import load_dotenv
 from pydantic import BaseModel
-from typing import Optional, Dict, Any
-from datetime import datetime
+from typing import Optional, Dict, Any, List
+from datetime import datetime, timezone
+import db
+import services
 from licensing import router as licensing_router
+from jobqueue import create_queue, JOB_QUEUE_BACKEND
+from text_steering import PromptEncoder
+from spatial_index import TrackSpatialIndex, TILE_MAX_POINTS, SLIM_COLUMNS
+from track_feed import TrackFeed
+from layout import iter_embeddings
+from embedding_store import open_store
+from storage import stream_to_storage, iter_upload_file, public_url, UploadTooLarge, MAX_UPLOAD_BYTES
+from event_ingest import EventIngestor, IngestOverloaded
+from gravity_cache import NeighborCache, GRAVITY_TOP_K
+from gravity import rank_candidates
+from radio_queue import RadioQueueManager
+from vote_coalescer import VoteCoalescer, VOTE_COALESCE_SECONDS
+from leaderboard import Leaderboard
 
 load_dotenv()
 
@@ -30,27 +51,311 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
 DEFAULT_TOKEN_BALANCE = int(os.environ.get("DEFAULT_TOKEN_BALANCE", "100"))
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
-    except Exception as e:
-        print(f"Failed to initialize Supabase: {e}")
-        supabase = None
-else:
-    supabase = None
+# Uploads up to this size are handed to the media pipeline in memory instead of re-downloaded.
+PIPELINE_INLINE_MAX_BYTES = int(os.environ.get("PIPELINE_INLINE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Total inline bytes one /upload/batch request may hold; files past it are re-downloaded by the worker.
+PIPELINE_INLINE_BATCH_MAX_BYTES = int(os.environ.get("PIPELINE_INLINE_BATCH_MAX_BYTES", str(64 * 1024 * 1024)))
+UPLOAD_JOB_PRIORITY = 10
+UPLOAD_BATCH_MAX_FILES = 50
+# Vector search tuning (HNSW ef_search trades recall for latency).
+DEFAULT_EF_SEARCH = int(os.environ.get("DEFAULT_EF_SEARCH", "40"))
+# Extra exact-scan neighbours fetched to cover snapshot rows that are no longer LIVE on the map.
+EXACT_SIMILAR_MARGIN = 20
+RADIO_CANDIDATES = 100
+RADIO_GRAVITY_CANDIDATES = 20
+# Softmax temperature over hybrid scores when sampling among the top few.
+RADIO_TEMPERATURE = 0.1
+EVENT_BATCH_MAX = 1000
+EVENT_RETRY_AFTER_SECONDS = 2
+GRAVITY_BULK_MAX_TRACKS = 500
+EMBEDDING_EXPORT_MAX = 50000
+# Components that must be ready (or switched off by config) before /ready answers 200.
+READY_REQUIRED = [s.strip() for s in os.environ.get("READY_REQUIRED", "database").split(",") if s.strip()]
+# Everything a client shows about a track; the embedding only when asked for.
+TRACK_COLUMNS = SLIM_COLUMNS + ",duration,loudness_db,created_at,tags,license_revenue_cents"
+# Sync client shared with licensing/process, for background threads; request handlers use db's async client.
+supabase = db.get_sync_client()
+
+prompt_encoder = PromptEncoder()
+spatial_index = TrackSpatialIndex(supabase) if supabase else None
+track_feed = TrackFeed(spatial_index) if spatial_index else None
+event_ingestor = EventIngestor(supabase) if supabase else None
+neighbor_cache = NeighborCache(supabase) if supabase else None
+# Set VOTE_COALESCE_SECONDS=0 to update vote_score inside every vote instead.
+vote_coalescer = VoteCoalescer(supabase) if supabase and VOTE_COALESCE_SECONDS > 0 else None
+leaderboard = Leaderboard(supabase) if supabase else None
+# Local snapshot written by scripts/export_embeddings.py; empty until one exists.
+embedding_store = open_store()
+
+@app.on_event("startup")
+async def warm_services():
+    # Heavy clients load in a worker thread after boot; requests that need one first just wait for it.
+    if services.WARM_SERVICES:
+        app.state.warmup_task = asyncio.create_task(asyncio.to_thread(services.registry.warm_up))
+
+@app.on_event("startup")
+async def start_track_feed():
+    if track_feed:
+        app.state.track_feed_task = asyncio.create_task(track_feed.run())
+
+@app.on_event("startup")
+async def start_leaderboard():
+    if leaderboard:
+        app.state.leaderboard_task = asyncio.create_task(leaderboard.run())
+
+@app.on_event("startup")
+async def start_vote_coalescer():
+    if vote_coalescer:
+        app.state.vote_coalescer_task = asyncio.create_task(vote_coalescer.run())
+
+@app.on_event("shutdown")
+async def stop_vote_coalescer():
+    if vote_coalescer:
+        app.state.vote_coalescer_task.cancel()
+        try:
+            await asyncio.to_thread(vote_coalescer.flush)
+        except Exception as e:
+            print(f"Final vote flush failed: {e}")
+
+@app.on_event("shutdown")
+async def close_db():
+    await db.close()
+
+@app.on_event("startup")
+async def start_event_ingestor():
+    if event_ingestor:
+        await event_ingestor.start()
+
+@app.on_event("shutdown")
+async def stop_event_ingestor():
+    if event_ingestor:
+        await event_ingestor.stop()
+
+try:
+    job_queue = create_queue(JOB_QUEUE_BACKEND, supabase)
+except Exception as e:
+    print(f"Failed to initialize job queue: {e}")
+    job_queue = None
 
 @app.get("/")
 def read_root():
     return {"status": "ok", "message": "STELLOS API"}
 
+@app.get("/ready")
+def readiness(response: Response):
+    """Per-component state: idle (loads on first use), loading, ready, disabled (not configured) or failed."""
+    # Warm services that failed are reloaded in the background once their backoff has passed.
+    retry = services.registry.due_for_retry(services.WARM_SERVICES)
+    if retry:
+        threading.Thread(target=services.registry.warm_up, args=(retry,), daemon=True).start()
+    components = services.registry.status()
+    components["database"] = {"state": "ready"} if supabase else {"state": "failed", "error": "Supabase not configured"}
+    if spatial_index:
+        components["spatial_index"] = {"state": "ready" if spatial_index.loaded else "loading"}
+    if leaderboard:
+        components["leaderboard"] = {"state": "ready" if leaderboard.loaded else "loading"}
+    ready = all(components.get(name, {}).get("state") in ("ready", "disabled") for name in READY_REQUIRED)
+    if not ready:
+        response.status_code = 503
+    return {"ready": ready, "components": components}
+
+@app.get("/jobs/stats")
+def get_job_stats():
+    if not job_queue:
+        raise HTTPException(status_code=500, detail="Job queue not configured")
+    try:
+        return {"backend": JOB_QUEUE_BACKEND, "jobs": job_queue.stats()}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 app.include_router(licensing_router)
 
+# Demo: every upload gets licensing enabled with this default template.
+DEMO_LICENSE_TEMPLATE = {
+    "name": "Standard License",
+    "description": "Demo license for web and social usage.",
+    "price_cents": 500,
+    "usage_terms_text": "Non-exclusive license for digital use. Demo terms."
+}
+ARTIST_CACHE_SIZE = 10000
+# Normalized artist name -> id (matches artists.name_key).
+artist_ids: Dict[str, str] = {}
+
+NO_REUSE = {"reused_from": None, "preview": False, "embedded": False}
+
+async def _register_upload(track_id: str, title: str, artist_name: str, full_url: str,
+                           content_hash: Optional[str] = None) -> dict:
+    """Creates the track, its artist (if new) and the demo license template in one RPC.
+
+    If an earlier track has the same content hash its preview, embedding and map position
+    are copied over; returns what was reused (see reuse_track_media).
+    """
+    name_key = artist_name.strip().lower()
+    params = {
+        "p_track_id": track_id,
+        "p_title": title,
+        "p_artist_name": artist_name,
+        "p_audio_file_url": full_url,
+        "p_template": DEMO_LICENSE_TEMPLATE,
+        "p_artist_id": artist_ids.get(name_key),
+        "p_content_hash": content_hash,
+    }
+    try:
+        try:
+            created = await db.create_track(params)
+        except Exception:
+            if not params["p_artist_id"]:
+                raise
+            # Cached artist may have been removed; let the database resolve it again.
+            artist_ids.pop(name_key, None)
+            params["p_artist_id"] = None
+            created = await db.create_track(params)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
+
+    artist_id = created.get("artist_id")
+    if artist_id:
+        if len(artist_ids) >= ARTIST_CACHE_SIZE:
+            artist_ids.clear()
+        artist_ids[name_key] = artist_id
+    return created.get("reused") or NO_REUSE
+
+def _media_job_payload(track_id: str, full_url: str, reused: dict) -> Optional[dict]:
+    """Job payload for whatever the upload didn't reuse, or None if there's nothing left to compute."""
+    if reused["preview"] and reused["embedded"]:
+        print(f"{track_id} reuses media from {reused['reused_from']}; no pipeline job")
+        return None
+    payload = {"track_id": track_id, "audio_url": full_url}
+    if reused["reused_from"]:
+        payload.update({"preview": not reused["preview"], "embed": not reused["embedded"]})
+    return payload
+
+def _enqueue_media_pipeline(track_id: str, full_url: str, audio_bytes: Optional[bytes] = None,
+                            reused: dict = NO_REUSE):
+    # Preview/embedding run in scripts/job_worker.py; if the queue is down, ml_worker still embeds UPLOADED tracks.
+    payload = _media_job_payload(track_id, full_url, reused)
+    if payload is None:
+        return
+    if not job_queue:
+        print(f"Warning: job queue unavailable; {track_id} left for ml_worker")
+        return
+    try:
+        job_queue.enqueue(
+            "media_pipeline",
+            payload,
+            priority=UPLOAD_JOB_PRIORITY,
+            blob=audio_bytes,
+        )
+    except Exception as e:
+        print(f"Warning: Failed to enqueue media pipeline for {track_id}: {e}")
+
+async def _register_uploads(tracks: List[Dict[str, str]]) -> List[dict]:
+    """Bulk _register_upload: one create_tracks_with_licensing call for the whole batch.
+
+    Returns the reuse result for each track, in order.
+    """
+    rows = [{**t, "artist_id": artist_ids.get(t["artist_name"].strip().lower())} for t in tracks]
+    try:
+        try:
+            results = await db.create_tracks(rows, DEMO_LICENSE_TEMPLATE)
+        except Exception:
+            if not any(r["artist_id"] for r in rows):
+                raise
+            # A cached artist may have been removed; let the database resolve them again.
+            artist_ids.clear()
+            results = await db.create_tracks([{**t, "artist_id": None} for t in tracks], DEMO_LICENSE_TEMPLATE)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
+    reused = []
+    for t, created in zip(tracks, results):
+        if created and created.get("artist_id"):
+            artist_ids[t["artist_name"].strip().lower()] = created["artist_id"]
+        reused.append((created or {}).get("reused") or NO_REUSE)
+    return reused + [NO_REUSE] * (len(tracks) - len(reused))
+
+def _enqueue_media_pipelines(uploads: List[tuple]):
+    """Bulk _enqueue_media_pipeline for (track_id, url, audio_bytes, reused) tuples."""
+    jobs = [
+        {"kind": "media_pipeline", "payload": payload, "priority": UPLOAD_JOB_PRIORITY, "blob": audio_bytes}
+        for track_id, url, audio_bytes, reused in uploads
+        for payload in [_media_job_payload(track_id, url, reused)]
+        if payload is not None
+    ]
+    if not jobs:
+        return
+    if not job_queue:
+        print(f"Warning: job queue unavailable; {len(uploads)} track(s) left for ml_worker")
+        return
+    try:
+        job_queue.enqueue_many(jobs)
+    except Exception as e:
+        print(f"Warning: Failed to enqueue media pipelines for {len(uploads)} track(s): {e}")
+
+class InlineBudget:
+    """Inline bytes left for the uploads of one request (they run concurrently on the event loop)."""
+
+    def __init__(self, max_bytes: int):
+        self.remaining = max_bytes
+
+    def take(self, n: int) -> bool:
+        if n > self.remaining:
+            return False
+        self.remaining -= n
+        return True
+
+    def give_back(self, n: int):
+        self.remaining += n
+
+async def _upload_to_storage(track_id: str, filename: str, chunks, content_type: Optional[str],
+                             budget: Optional[InlineBudget] = None):
+    """Streams an upload to storage.
+
+    Returns (public url, audio bytes for the pipeline or None, sha256 hex of the content).
+    The hash is computed as chunks pass through, so dedupe costs no extra read. With a
+    `budget`, the inline copy is also dropped once the request's shared allowance runs out.
+    """
+    file_ext = (filename or "").split('.')[-1] or "bin"
+    storage_path = f"raw/{track_id}.{file_ext}"
+
+    # Keep a copy of small uploads so the media pipeline can decode them without re-downloading.
+    # Only the local SQLite queue can carry the bytes to the worker.
+    inline = bytearray() if PIPELINE_INLINE_MAX_BYTES > 0 and JOB_QUEUE_BACKEND == "sqlite" else None
+    digest = hashlib.sha256()
+
+    async def tee(chunks):
+        nonlocal inline
+        async for chunk in chunks:
+            digest.update(chunk)
+            if inline is not None:
+                if (len(inline) + len(chunk) > PIPELINE_INLINE_MAX_BYTES
+                        or (budget is not None and not budget.take(len(chunk)))):
+                    if budget is not None:
+                        budget.give_back(len(inline))
+                    inline = None
+                else:
+                    inline.extend(chunk)
+            yield chunk
+
+    try:
+        await stream_to_storage(storage_path, tee(chunks), content_type)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return public_url(storage_path), bytes(inline) if inline is not None else None, digest.hexdigest()
+
+async def _store_upload(track_id: str, filename: str, chunks, content_type: Optional[str],
+                        title: str, artist_name: str):
+    full_url, audio_bytes, content_hash = await _upload_to_storage(track_id, filename, chunks, content_type)
+    reused = await _register_upload(track_id, title, artist_name, full_url, content_hash)
+    await asyncio.to_thread(_enqueue_media_pipeline, track_id, full_url, audio_bytes, reused)
+    
+    return {"track_id": track_id, "status": "UPLOADED", "url": full_url, "reused_from": reused["reused_from"]}
+
 @app.post("/upload")
 async def upload_audio(
-    background_tasks: BackgroundTasks,
     file: UploadFile = File(...), 
     title: str = Form("Unknown Title"), 
     artist_name: str = Form("Unknown Artist")
@@ -59,158 +364,260 @@ async def upload_audio(
         raise HTTPException(status_code=500, detail="Supabase not configured")
         
     track_id = str(uuid.uuid4())
-    file_ext = file.filename.split('.')[-1]
-    storage_path = f"raw/{track_id}.{file_ext}"
-    
-    contents = await file.read()
-    
-    try:
-        supabase.storage.from_("audio").upload(
-            path=storage_path, 
-            file=contents, 
-            file_options={"content-type": file.content_type}
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-        
-    full_url = f"{SUPABASE_URL}/storage/v1/object/public/audio/{storage_path}"
-    
-    track_data = {
-        "id": track_id,
-        "title": title,
-        "artist_name": artist_name,
-        "audio_file_url": full_url,
-        "status": "UPLOADED"
-    }
-    
-    try:
-        supabase.table("tracks").insert(track_data).execute()
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
+    return await _store_upload(
+        track_id, file.filename, iter_upload_file(file), file.content_type,
+        title, artist_name
+    )
 
-    # Demo: auto-associate artist + enable licensing + create a default template
-    try:
-        artist_id = None
-        artist_res = supabase.table("artists").select("id").eq("name", artist_name).limit(1).execute()
-        if artist_res.data:
-            artist_id = artist_res.data[0]["id"]
-        else:
-            a_insert = supabase.table("artists").insert({"name": artist_name}).execute()
-            if a_insert.data:
-                artist_id = a_insert.data[0]["id"]
-
-        if artist_id:
-            supabase.table("tracks").update({
-                "artist_id": artist_id,
-                "licensing_enabled": True
-            }).eq("id", track_id).execute()
-
-            tmpl_res = supabase.table("license_templates").select("id").eq("track_id", track_id).limit(1).execute()
-            if not tmpl_res.data:
-                supabase.table("license_templates").insert({
-                    "track_id": track_id,
-                    "name": "Standard License",
-                    "description": "Demo license for web and social usage.",
-                    "price_cents": 500,
-                    "usage_terms_text": "Non-exclusive license for digital use. Demo terms."
-                }).execute()
-    except Exception as e:
-        print(f"Warning: Failed to setup demo licensing: {e}")
-        
-    from process import make_preview, make_embedding
-    background_tasks.add_task(make_preview, track_id, full_url)
-    background_tasks.add_task(make_embedding, track_id, full_url)
-    
-    return {"track_id": track_id, "status": "UPLOADED", "url": full_url}
+@app.post("/upload/stream")
+async def upload_audio_stream(
+    request: Request,
+    filename: str,
+    title: str = "Unknown Title",
+    artist_name: str = "Unknown Artist"
+):
+    """Raw-body upload: the request body is piped to storage without multipart parsing or temp files."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"Upload exceeds {MAX_UPLOAD_BYTES} bytes")
+
+    track_id = str(uuid.uuid4())
+    return await _store_upload(
+        track_id, filename, request.stream(), request.headers.get("content-type"),
+        title, artist_name
+    )
+
+@app.post("/upload/batch")
+async def upload_audio_batch(
+    files: List[UploadFile] = File(...),
+    titles: Optional[List[str]] = Form(None),
+    artist_name: str = Form("Unknown Artist")
+):
+    """Many files in one multipart request: stored concurrently, then registered and enqueued in bulk.
+
+    `titles` pairs with `files` by position; missing titles default to the file name.
+    """
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"At most {UPLOAD_BATCH_MAX_FILES} files per batch")
+
+    titles = titles or []
+    track_ids = [str(uuid.uuid4()) for _ in files]
+    budget = InlineBudget(PIPELINE_INLINE_BATCH_MAX_BYTES)
+    stored = await asyncio.gather(
+        *(_upload_to_storage(tid, f.filename, iter_upload_file(f), f.content_type, budget)
+          for tid, f in zip(track_ids, files)),
+        return_exceptions=True,
+    )
+
+    results, tracks, uploads = [], [], []
+    for i, (track_id, f, outcome) in enumerate(zip(track_ids, files, stored)):
+        if isinstance(outcome, Exception):
+            detail = outcome.detail if isinstance(outcome, HTTPException) else str(outcome)
+            results.append({"filename": f.filename, "status": "FAILED", "error": detail})
+            continue
+        full_url, audio_bytes, content_hash = outcome
+        title = titles[i] if i < len(titles) and titles[i] else os.path.splitext(f.filename or "")[0] or "Unknown Title"
+        tracks.append({"id": track_id, "title": title, "artist_name": artist_name,
+                       "audio_file_url": full_url, "content_hash": content_hash})
+        uploads.append((track_id, full_url, audio_bytes))
+        results.append({"filename": f.filename, "track_id": track_id, "status": "UPLOADED", "url": full_url})
+
+    if tracks:
+        reused = await _register_uploads(tracks)
+        uploads = [(*u, r) for u, r in zip(uploads, reused)]
+        by_id = {u[0]: r for u, r in zip(uploads, reused)}
+        for result in results:
+            if "track_id" in result:
+                result["reused_from"] = by_id[result["track_id"]]["reused_from"]
+        await asyncio.to_thread(_enqueue_media_pipelines, uploads)
+    return {"uploads": results}
+
+def _indexed_tracks(request: Request, response: Response, bbox_values):
+    """LIVE listing from the spatial index, with an ETag derived from the change cursor."""
+    cursor, rows = spatial_index.snapshot()
+    if bbox_values:
+        rows = spatial_index.query_bbox(*bbox_values)
+    etag = f'W/"{cursor}-{len(rows)}-{",".join(map(str, bbox_values or []))}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return {"tracks": rows, "cursor": cursor}
 
 @app.get("/tracks")
-def get_tracks(bbox: str = None, status: str = "LIVE"):
+async def get_tracks(request: Request, response: Response, bbox: str = None, status: str = "LIVE",
+                     include_embedding: bool = False):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
         
-    query = supabase.table("tracks").select("*")
-    if status != "ALL":
-        query = query.eq("status", status)
-        
+    bbox_values = None
     if bbox:
         try:
-            x1, y1, x2, y2 = map(float, bbox.split(","))
-            query = query.gte("map_x", x1).lte("map_x", x2).gte("map_y", y1).lte("map_y", y2)
+            bbox_values = x1, y1, x2, y2 = tuple(map(float, bbox.split(",")))
         except ValueError:
             raise HTTPException(status_code=400, detail="Invalid bbox format. Expects x1,y1,x2,y2")
+
+    if status == "LIVE" and spatial_index and not include_embedding:
+        try:
+            # May refresh the index from the database, so keep it off the event loop.
+            return await asyncio.to_thread(_indexed_tracks, request, response, bbox_values)
+        except Exception as e:
+            print(f"Warning: spatial index unavailable, querying DB: {e}")
             
     try:
-        res = query.execute()
-        return {"tracks": res.data}
+        columns = TRACK_COLUMNS + (",embedding_vector" if include_embedding else "")
+        return {"tracks": await db.list_tracks(columns, None if status == "ALL" else status, bbox_values)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/tracks/changes")
+def get_track_changes(since: int = 0):
+    """Delta of the LIVE catalog since `cursor` from a previous response (0 or a stale cursor returns everything)."""
+    if not spatial_index:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    try:
+        return spatial_index.changes_since(since)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/tracks/stream")
+async def stream_track_changes(request: Request, since: int = 0):
+    """Server-Sent Events: a `changes` event per batch of catalog changes and status transitions."""
+    if not track_feed:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    last_event_id = request.headers.get("last-event-id", "")
+    if last_event_id.isdigit():
+        since = int(last_event_id)
+    return StreamingResponse(
+        track_feed.stream(since),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/tracks/tiles/{z}/{x}/{y}")
+def get_track_tile(z: int, x: int, y: int, max_points: int = TILE_MAX_POINTS):
+    if not spatial_index:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if z < 0 or z > 20 or not (0 <= x < 2 ** z) or not (0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Tile out of range")
+
+    try:
+        return spatial_index.tile(z, x, y, max_points=max(1, min(max_points, 5000)))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/track/{track_id}")
-def get_track(track_id: str):
+async def get_track(track_id: str, include_embedding: bool = False):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
         
     try:
-        res = supabase.table("tracks").select("*").eq("id", track_id).execute()
-        if not res.data:
-            raise HTTPException(status_code=404, detail="Track not found")
-        return {"track": res.data[0]}
+        track = await db.get_track(track_id, TRACK_COLUMNS + (",embedding_vector" if include_embedding else ""))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    if not track:
+        raise HTTPException(status_code=404, detail="Track not found")
+    return {"track": track}
 
-@app.post("/event")
-async def track_event(payload: EventPayload):
+@app.get("/embeddings/export")
+def export_embeddings(status: str = "LIVE", after: Optional[str] = None, limit: int = EMBEDDING_EXPORT_MAX):
+    """Embeddings as an .npz with `ids` and float16 `embeddings` (n, 512), for np.load.
+
+    Pages by track id: pass the X-Next-After header back as `after` until it's absent.
+    """
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
-        
-    event_data = {
+    limit = max(1, min(limit, EMBEDDING_EXPORT_MAX))
+
+    ids, pages = [], []
+    try:
+        for page_ids, matrix in iter_embeddings(supabase, min(limit, 1000), status, np.float16, after=after):
+            take = limit - len(ids)
+            ids.extend(page_ids[:take])
+            pages.append(matrix[:take])
+            if len(ids) >= limit:
+                break
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    buf = io.BytesIO()
+    np.savez(buf, ids=np.array(ids, dtype="U36"),
+             embeddings=np.concatenate(pages) if pages else np.zeros((0, 512), dtype=np.float16))
+    headers = {"Content-Disposition": 'attachment; filename="embeddings.npz"'}
+    if len(ids) >= limit:
+        headers["X-Next-After"] = ids[-1]
+    return Response(content=buf.getvalue(), media_type="application/octet-stream", headers=headers)
+
+def _event_row(payload: EventPayload) -> dict:
+    # Every row carries the same keys so a whole batch goes out as one bulk insert.
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": payload.user_id or None,
         "session_id": payload.session_id,
         "track_id": payload.track_id,
         "event_type": payload.event_type,
         "context": payload.context,
         "meta": payload.meta or {},
+        "timestamp": (payload.timestamp or datetime.now(timezone.utc)).isoformat(),
     }
-    
-    if payload.user_id:
-        event_data["user_id"] = payload.user_id
-        
-    if payload.timestamp:
-        event_data["timestamp"] = payload.timestamp.isoformat()
-        
+
+def _ingest_events(payloads: List[EventPayload]) -> int:
+    if not event_ingestor:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
     try:
-        supabase.table("events").insert(event_data).execute()
-        return {"status": "success"}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"DB error: {str(e)}")
+        return event_ingestor.submit([_event_row(p) for p in payloads])
+    except IngestOverloaded as e:
+        raise HTTPException(
+            status_code=503,
+            detail=str(e),
+            headers={"Retry-After": str(EVENT_RETRY_AFTER_SECONDS)},
+        )
+
+@app.post("/event")
+async def track_event(payload: EventPayload):
+    _ingest_events([payload])
+    return {"status": "success"}
+
+@app.post("/events/batch")
+async def track_events_batch(payloads: List[EventPayload]):
+    if len(payloads) > EVENT_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"At most {EVENT_BATCH_MAX} events per batch")
+    accepted = _ingest_events(payloads)
+    return {"status": "success", "accepted": accepted}
+
+@app.get("/events/metrics")
+def get_event_metrics():
+    if not event_ingestor:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    return event_ingestor.stats()
 
 @app.get("/tracks/{track_id}/gravity_neighbors")
-def get_gravity_neighbors(track_id: str, limit: int = 50):
-    if not supabase:
+def get_gravity_neighbors(track_id: str, limit: int = GRAVITY_TOP_K):
+    if not neighbor_cache:
         raise HTTPException(status_code=500, detail="Supabase not configured")
         
     try:
-        res = supabase.table("track_edges")\
-            .select("to_track_id, weight")\
-            .eq("from_track_id", track_id)\
-            .order("weight", desc=True)\
-            .limit(limit)\
-            .execute()
-            
-        edges = res.data
-        if not edges:
-            return {"neighbors": []}
-            
-        max_weight = max(e["weight"] for e in edges) if edges else 1.0
-        
-        neighbors = []
-        for e in edges:
-            neighbors.append({
-                "track_id": e["to_track_id"],
-                "weight": e["weight"],
-                "normalized_score": e["weight"] / max_weight if max_weight > 0 else 0
-            })
-            
-        return {"neighbors": neighbors}
+        return {"neighbors": neighbor_cache.get(track_id, limit)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+class GravityNeighborsRequest(BaseModel):
+    track_ids: List[str]
+    limit: int = GRAVITY_TOP_K
+
+@app.post("/gravity_neighbors")
+def get_gravity_neighbors_bulk(payload: GravityNeighborsRequest):
+    if not neighbor_cache:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if len(payload.track_ids) > GRAVITY_BULK_MAX_TRACKS:
+        raise HTTPException(status_code=413, detail=f"At most {GRAVITY_BULK_MAX_TRACKS} track ids per request")
+
+    try:
+        return {"neighbors": neighbor_cache.get_many(payload.track_ids, payload.limit)}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -218,50 +625,182 @@ class RadioNextRequest(BaseModel):
     session_id: str
     last_track_id: str
     prompt_text: Optional[str] = None
+    recent_track_ids: List[str] = []
+    weights: Optional[Dict[str, float]] = None
 
 class VoteRequest(BaseModel):
     session_id: str
     tokens_spent: int = 1
 
+def _similar_tracks(track_id: str, limit: int, exclude_ids: List[str], ef_search: int = DEFAULT_EF_SEARCH):
+    res = db.execute_sync("tracks.similar", supabase.rpc("similar_tracks", {
+        "p_track_id": track_id,
+        "match_count": limit,
+        "exclude_ids": exclude_ids,
+        "ef_search": ef_search,
+    }))
+    return res.data or []
+
+def _prompt_tracks(prompt_text: str, limit: int, exclude_ids: List[str], ef_search: int = DEFAULT_EF_SEARCH):
+    res = db.execute_sync("tracks.match", supabase.rpc("match_tracks", {
+        "query_embedding": db.vector_literal(prompt_encoder.encode(prompt_text)),
+        "match_count": limit,
+        "exclude_ids": exclude_ids,
+        "ef_search": ef_search,
+    }))
+    return res.data or []
+
+@app.get("/tracks/{track_id}/similar")
+def get_similar_tracks(track_id: str, limit: int = 20, ef_search: int = DEFAULT_EF_SEARCH, exclude: str = "",
+                       exact: bool = False):
+    """HNSW neighbours from pgvector, or with `exact` a brute-force scan of the local embedding snapshot."""
+    if not supabase:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+
+    exclude_ids = [e for e in exclude.split(",") if e]
+    limit = min(max(limit, 1), 200)
+    try:
+        if exact and embedding_store and len(embedding_store) and spatial_index:
+            hits = embedding_store.similar(track_id, limit + len(exclude_ids) + EXACT_SIMILAR_MARGIN, exclude_ids)
+            if hits:
+                rows = spatial_index.lookup([t for t, _ in hits])
+                tracks = [{**rows[t], "similarity": sim} for t, sim in hits if t in rows]
+                return {"tracks": tracks[:limit]}
+        return {"tracks": _similar_tracks(track_id, limit, exclude_ids, ef_search)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def _live_sample(exclude_ids: List[str], limit: int) -> List[dict]:
+    """Random LIVE tracks, from the in-memory spatial index when it's available."""
+    if spatial_index:
+        _, rows = spatial_index.snapshot()
+    else:
+        rows = supabase.table("tracks").select(SLIM_COLUMNS).eq("status", "LIVE").limit(50).execute().data or []
+    excluded = set(exclude_ids)
+    rows = [t for t in rows if t["id"] not in excluded]
+    return random.sample(rows, min(limit, len(rows)))
+
 @app.post("/radio/start")
 def start_radio():
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
         
     try:
-        res = supabase.table("tracks").select("*").eq("status", "LIVE").limit(50).execute()
-        if not res.data:
+        picks = _live_sample([], 1)
+        if not picks:
             return {"track": None, "message": "No live tracks found."}
-            
-        import random
-        return {"track": random.choice(res.data), "session_id": str(uuid.uuid4())}
+
+        session_id = str(uuid.uuid4())
+        radio_queue.start(session_id, picks[0]["id"])
+        return {"track": picks[0], "session_id": session_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _gravity_candidates(track_id: str, pool: List[dict], exclude_ids: List[str]):
+    """Gravity scores from the current track, plus rows for strong neighbors the vector search missed."""
+    if not neighbor_cache:
+        return {}, []
+    try:
+        neighbors = neighbor_cache.get(track_id)
+    except Exception as e:
+        print(f"Warning: gravity lookup failed: {e}")
+        return {}, []
+    scores = {n["track_id"]: n["normalized_score"] for n in neighbors}
+    known = {t["id"] for t in pool} | set(exclude_ids)
+    extra_ids = [n["track_id"] for n in neighbors if n["normalized_score"] > 0 and n["track_id"] not in known]
+    extra_ids = extra_ids[:RADIO_GRAVITY_CANDIDATES]
+    if not extra_ids:
+        return scores, []
+    res = supabase.table("tracks").select(SLIM_COLUMNS).in_("id", extra_ids).eq("status", "LIVE").execute()
+    return scores, res.data or []
+
+def _exact_similarity(seed_track_id: str, track_ids: List[str]) -> Dict[str, float]:
+    """Cosine to the seed from the local embedding snapshot, for candidates the vector search didn't score."""
+    if not embedding_store or not track_ids:
+        return {}
+    try:
+        found, vecs = embedding_store.vectors([seed_track_id])
+        return embedding_store.cosine(vecs[0], track_ids) if found else {}
+    except Exception as e:
+        print(f"Warning: embedding snapshot lookup failed: {e}")
+        return {}
+
+def _sample_order(ranked: List[dict]) -> List[dict]:
+    # Gumbel-max over score / temperature: a softmax sample without replacement, so the
+    # queue mostly follows the ranking but doesn't replay the same sequence every time.
+    scores = np.array([r["score"] for r in ranked]) / RADIO_TEMPERATURE
+    keys = scores + np.random.gumbel(size=len(ranked))
+    return [ranked[i] for i in np.argsort(-keys)]
+
+def _build_radio_queue(seed_track_id: str, prompt_text: Optional[str], exclude_ids: List[str],
+                       history: List[str], weights: Optional[Dict[str, float]], limit: int) -> List[dict]:
+    """Next `limit` tracks after the seed: pgvector neighbours of the prompt (or seed) plus gravity
+    neighbours, ranked by the hybrid scorer."""
+    exclude_ids = list(dict.fromkeys(exclude_ids + [seed_track_id]))
+    candidates = []
+    by_prompt = False
+    if prompt_text:
+        try:
+            candidates = _prompt_tracks(prompt_text, RADIO_CANDIDATES, exclude_ids)
+            by_prompt = bool(candidates)
+        except Exception as e:
+            print(f"Warning: prompt steering failed, using track similarity: {e}")
+    if not candidates:
+        candidates = _similar_tracks(seed_track_id, RADIO_CANDIDATES, exclude_ids)
+
+    gravity_scores, extra = _gravity_candidates(seed_track_id, candidates, exclude_ids)
+    pool = candidates + extra
+    if not pool:
+        # The seed track has no embedding yet; fall back to any live track.
+        return _live_sample(exclude_ids, limit)
+
+    rows = {t["id"]: t for t in pool}
+    similarity = {t["id"]: t["similarity"] for t in candidates}
+    if extra and not by_prompt:
+        similarity.update(_exact_similarity(seed_track_id, [t["id"] for t in extra]))
+    ranked = rank_candidates(
+        current_track_id=seed_track_id,
+        candidate_track_ids=list(rows),
+        embeddings_scores=similarity,
+        session_history=history,
+        gravity_scores=gravity_scores,
+        vote_scores={t["id"]: t.get("vote_score") or 0 for t in pool},
+        weights=weights,
+        top_n=limit * 2,
+    )
+    return [rows[r["track_id"]] for r in _sample_order(ranked)[:limit]]
+
+radio_queue = RadioQueueManager(_build_radio_queue)
+if event_ingestor:
+    event_ingestor.listeners.append(radio_queue.on_events)
+
 @app.post("/radio/next")
 def next_radio_track(req: RadioNextRequest):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
         
+    prompt_text = req.prompt_text.strip() if req.prompt_text and req.prompt_text.strip() else None
     try:
-        if req.prompt_text:
-            print(f"Radio Steer Request: '{req.prompt_text}' -> Text Embedding Vector Search (Deferred MVP Hack)")
-            
-        res = supabase.table("tracks").select("*").eq("status", "LIVE").limit(50).execute()
-        if not res.data:
-            return {"track": None}
-            
-        import random
-        candidates = [t for t in res.data if t["id"] != req.last_track_id]
-        if not candidates:
-            return {"track": res.data[0]}
-            
-        return {"track": random.choice(candidates)}
+        track = radio_queue.next_track(
+            req.session_id,
+            req.last_track_id,
+            prompt_text=prompt_text,
+            recent_track_ids=req.recent_track_ids,
+            weights=req.weights,
+        )
+        return {"track": track}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/radio/queue")
+def get_radio_queue(session_id: str, limit: Optional[int] = None):
+    tracks = radio_queue.peek(session_id, limit)
+    if tracks is None:
+        raise HTTPException(status_code=404, detail="Unknown or expired radio session")
+    return {"session_id": session_id, "tracks": tracks}
+
 @app.get("/tokens/balance")
-def get_token_balance(session_id: str):
+async def get_token_balance(session_id: str):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
@@ -269,21 +808,15 @@ def get_token_balance(session_id: str):
         raise HTTPException(status_code=400, detail="session_id required")
 
     try:
-        res = supabase.table("token_balances").select("*").eq("session_id", session_id).execute()
-        if res.data:
-            return {"session_id": session_id, "balance": res.data[0]["balance"]}
-
-        insert_res = supabase.table("token_balances").insert({
-            "session_id": session_id,
-            "balance": DEFAULT_TOKEN_BALANCE
-        }).execute()
-        balance = insert_res.data[0]["balance"] if insert_res.data else DEFAULT_TOKEN_BALANCE
-        return {"session_id": session_id, "balance": balance}
+        row = await db.get_token_balance(session_id)
+        if row is None:
+            row = await db.create_token_balance(session_id, DEFAULT_TOKEN_BALANCE)
+        return {"session_id": session_id, "balance": row["balance"]}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/tracks/{track_id}/vote")
-def vote_track(track_id: str, req: VoteRequest):
+async def vote_track(track_id: str, req: VoteRequest):
     if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
 
@@ -291,43 +824,47 @@ def vote_track(track_id: str, req: VoteRequest):
         raise HTTPException(status_code=400, detail="tokens_spent must be > 0")
 
     try:
-        track_res = supabase.table("tracks").select("id, vote_score").eq("id", track_id).execute()
-        if not track_res.data:
-            raise HTTPException(status_code=404, detail="Track not found")
+        result = await db.cast_vote(track_id, req.session_id, req.tokens_spent, DEFAULT_TOKEN_BALANCE,
+                                    vote_coalescer is not None)
     except Exception as e:
-        if isinstance(e, HTTPException): raise
         raise HTTPException(status_code=500, detail=str(e))
 
-    try:
-        bal_res = supabase.table("token_balances").select("*").eq("session_id", req.session_id).execute()
-        if not bal_res.data:
-            bal_insert = supabase.table("token_balances").insert({
-                "session_id": req.session_id,
-                "balance": DEFAULT_TOKEN_BALANCE
-            }).execute()
-            balance = bal_insert.data[0]["balance"] if bal_insert.data else DEFAULT_TOKEN_BALANCE
-        else:
-            balance = bal_res.data[0]["balance"]
-
-        if balance < req.tokens_spent:
-            raise HTTPException(status_code=400, detail="Insufficient tokens")
-
-        new_balance = balance - req.tokens_spent
-        supabase.table("token_balances").update({
-            "balance": new_balance,
-            "updated_at": datetime.utcnow().isoformat()
-        }).eq("session_id", req.session_id).execute()
-
-        supabase.table("votes").insert({
-            "track_id": track_id,
-            "session_id": req.session_id,
-            "tokens_spent": req.tokens_spent
-        }).execute()
-
-        new_score = (track_res.data[0].get("vote_score") or 0) + req.tokens_spent
-        supabase.table("tracks").update({"vote_score": new_score}).eq("id", track_id).execute()
-
-        return {"track_id": track_id, "vote_score": new_score, "balance": new_balance}
-    except Exception as e:
-        if isinstance(e, HTTPException): raise
-        raise HTTPException(status_code=500, detail=str(e))
+    if result.get("status") == "not_found":
+        raise HTTPException(status_code=404, detail="Track not found")
+    if result.get("status") == "insufficient_tokens":
+        raise HTTPException(status_code=400, detail="Insufficient tokens")
+
+    if leaderboard and result.get("vote_id"):
+        leaderboard.record(result["vote_id"], track_id, req.tokens_spent)
+
+    vote_score = result.get("vote_score") or 0
+    if vote_coalescer:
+        vote_coalescer.add(track_id, req.tokens_spent)
+        vote_score = vote_coalescer.score(track_id, vote_score)
+    return {"track_id": track_id, "vote_score": vote_score, "balance": result.get("balance")}
+
+@app.get("/db/stats")
+def get_db_stats():
+    """Per-query call counts and latency (ms) from the data-access layer."""
+    return {"queries": db.query_stats()}
+
+@app.get("/votes/stats")
+def get_vote_stats():
+    if not vote_coalescer:
+        return {"coalescing": False}
+    return {"coalescing": True, "interval_seconds": vote_coalescer.interval, **vote_coalescer.stats()}
+
+@app.get("/leaderboard")
+def get_leaderboard(window: str = "all", limit: int = 50):
+    if not leaderboard:
+        raise HTTPException(status_code=500, detail="Supabase not configured")
+    if window != "all" and window not in leaderboard.windows:
+        raise HTTPException(status_code=400, detail=f"window must be one of: all, {', '.join(leaderboard.windows)}")
+    if not leaderboard.loaded:
+        raise HTTPException(status_code=503, detail="Leaderboard is still loading", headers={"Retry-After": "5"})
+
+    entries = leaderboard.top(window, min(max(limit, 1), 500))
+    rows = spatial_index.lookup([e["track_id"] for e in entries]) if spatial_index else {}
+    for entry in entries:
+        entry["track"] = rows.get(entry["track_id"])
+    return {"window": window, "tracks": entries}
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+"""Local CLAP inference server: one process holds the model for every API and ml_worker process on the host.
+
+Run with `python model_server.py --socket /tmp/stellos_model.sock` (or `--port 7861`) and point
+clients at it with MODEL_SERVER_URL=unix:///tmp/stellos_model.sock (or http://127.0.0.1:7861).
+Concurrent requests are collected for up to MODEL_SERVER_BATCH_WAIT_MS and run as one forward pass.
+"""
+import argparse
+import io
+import json
+import os
+import queue
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, List
+
+import httpx
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+MODEL_SERVER_URL = os.environ.get("MODEL_SERVER_URL", "")
+MODEL_SERVER_TIMEOUT_SECONDS = float(os.environ.get("MODEL_SERVER_TIMEOUT_SECONDS", "120"))
+MODEL_SERVER_BATCH_WAIT_MS = float(os.environ.get("MODEL_SERVER_BATCH_WAIT_MS", "10"))
+MODEL_SERVER_AUDIO_BATCH = int(os.environ.get("MODEL_SERVER_AUDIO_BATCH", "16"))
+MODEL_SERVER_TEXT_BATCH = int(os.environ.get("MODEL_SERVER_TEXT_BATCH", "64"))
+
+
+class DynamicBatcher:
+    """Merges concurrent requests (each a list of inputs) into forward passes of up to `max_batch` inputs.
+
+    The first request opens a window of `max_wait_ms`; everything that arrives before it closes (or
+    until the batch is full) runs together, and each caller gets back its own slice of the outputs.
+    """
+
+    def __init__(self, run_fn: Callable[[list], list], max_wait_ms: float = MODEL_SERVER_BATCH_WAIT_MS,
+                 max_batch: int = MODEL_SERVER_AUDIO_BATCH, lock: threading.Lock = None):
+        self.run_fn = run_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        # Shared between batchers so audio and text passes don't fight over the same cores.
+        self.lock = lock or threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self._queue = queue.Queue()
+        self._pending = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, items: list) -> Future:
+        fut = Future()
+        if not items:
+            fut.set_result([])
+        else:
+            self._queue.put((list(items), fut))
+        return fut
+
+    def _next(self, timeout=None):
+        if self._pending is not None:
+            request, self._pending = self._pending, None
+            return request
+        return self._queue.get(timeout=timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._next()]
+            size = len(batch[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self._next(timeout=remaining)
+                except queue.Empty:
+                    break
+                if size + len(request[0]) > self.max_batch:
+                    # Doesn't fit; it opens the next window instead.
+                    self._pending = request
+                    break
+                batch.append(request)
+                size += len(request[0])
+
+            inputs = [item for items, _ in batch for item in items]
+            try:
+                with self.lock:
+                    outputs = self.run_fn(inputs)
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(inputs)
+            start = 0
+            for items, fut in batch:
+                fut.set_result(outputs[start:start + len(items)])
+                start += len(items)
+
+    def stats(self):
+        return {"batches": self.batches, "items": self.items,
+                "avg_batch": round(self.items / self.batches, 2) if self.batches else 0}
+
+
+def encode_clips(clips) -> bytes:
+    """Stacks fixed-length clips into one float32 .npy payload."""
+    buf = io.BytesIO()
+    np.save(buf, np.stack([np.asarray(c, dtype=np.float32) for c in clips]), allow_pickle=False)
+    return buf.getvalue()
+
+
+def decode_clips(payload: bytes) -> np.ndarray:
+    clips = np.load(io.BytesIO(payload), allow_pickle=False)
+    if clips.ndim != 2 or clips.dtype != np.float32:
+        raise ValueError("expected a 2-D float32 array of clips")
+    return clips
+
+
+class ModelServerClient:
+    """Thin client for the model server; returned by services.get("model_server") when MODEL_SERVER_URL is set."""
+
+    def __init__(self, url: str = MODEL_SERVER_URL, timeout: float = MODEL_SERVER_TIMEOUT_SECONDS):
+        self.url = url
+        if url.startswith("unix://"):
+            transport = httpx.HTTPTransport(uds=url[len("unix://"):])
+            base_url = "http://model-server"
+        else:
+            transport = None
+            base_url = url.rstrip("/")
+        self._http = httpx.Client(base_url=base_url, transport=transport, timeout=timeout)
+
+    def _post(self, path: str, **kwargs) -> List[List[float]]:
+        res = self._http.post(path, **kwargs)
+        if res.status_code != 200:
+            raise RuntimeError(f"model server {path} returned {res.status_code}: {res.text[:200]}")
+        return res.json()["embeddings"]
+
+    def embed_audio(self, clips) -> List[List[float]]:
+        return self._post("/embed/audio", content=encode_clips(clips),
+                          headers={"Content-Type": "application/octet-stream"})
+
+    def embed_text(self, prompts) -> List[List[float]]:
+        return self._post("/embed/text", json={"prompts": list(prompts)})
+
+    def health(self) -> dict:
+        res = self._http.get("/health")
+        res.raise_for_status()
+        return res.json()
+
+    def wait_ready(self, timeout: float = 60.0) -> dict:
+        """Polls /health until the server answers (it may still be loading the model)."""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return self.health()
+            except httpx.HTTPError:
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(1.0)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "stellos-model-server"
+
+    def _reply(self, status: int, body: dict):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        if self.path != "/health":
+            return self._reply(404, {"detail": "Not found"})
+        self._reply(200, {
+            "status": "ok",
+            "quantized": self.server.quantized,
+            "threads": self.server.threads,
+            "audio": self.server.audio.stats(),
+            "text": self.server.text.stats(),
+        })
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        try:
+            if self.path == "/embed/audio":
+                fut = self.server.audio.submit(list(decode_clips(body)))
+            elif self.path == "/embed/text":
+                prompts = json.loads(body).get("prompts") or []
+                if not all(isinstance(p, str) for p in prompts):
+                    raise ValueError("prompts must be strings")
+                fut = self.server.text.submit(prompts)
+            else:
+                return self._reply(404, {"detail": "Not found"})
+        except ValueError as e:
+            return self._reply(400, {"detail": str(e)})
+        try:
+            embeddings = fut.result()
+        except Exception as e:
+            print(f"[model-server] inference failed: {e}")
+            return self._reply(500, {"detail": str(e)})
+        self._reply(200, {"embeddings": embeddings})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request, ("local", 0)
+
+
+def tune_threads(threads: int):
+    """One intra-op pool sized to the cores and no inter-op pool: batches already run one at a time."""
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        pass  # Already fixed once torch has run any parallel work.
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STELLOS CLAP inference server")
+    parser.add_argument("--socket", help="listen on this Unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7861)
+    parser.add_argument("--threads", type=int, default=os.cpu_count() or 1, help="torch intra-op threads")
+    parser.add_argument("--quantize", action="store_true",
+                        help="int8 dynamic quantization of the Linear layers (CPU only, faster, slightly less exact)")
+    parser.add_argument("--batch-wait-ms", type=float, default=MODEL_SERVER_BATCH_WAIT_MS,
+                        help="how long the first request in a batch waits for others")
+    parser.add_argument("--audio-batch", type=int, default=MODEL_SERVER_AUDIO_BATCH, help="max clips per forward pass")
+    parser.add_argument("--text-batch", type=int, default=MODEL_SERVER_TEXT_BATCH, help="max prompts per forward pass")
+    args = parser.parse_args()
+
+    import services
+    from process import clap_audio_features, clap_text_features
+
+    started = time.monotonic()
+    try:
+        tune_threads(args.threads)
+        clap = services.load_clap(quantize=args.quantize)
+    except Exception as exc:
+        print(f"[model-server] startup error: {exc}")
+        return 1
+    print(f"[model-server] loaded CLAP in {time.monotonic() - started:.1f}s "
+          f"({args.threads} thread(s){', int8' if args.quantize else ''})")
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        server = _UnixHTTPServer(args.socket, _Handler)
+        where = f"unix://{args.socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), _Handler)
+        where = f"http://{args.host}:{args.port}"
+
+    lock = threading.Lock()
+    server.threads = args.threads
+    server.quantized = args.quantize
+    server.audio = DynamicBatcher(lambda clips: clap_audio_features(clap, clips),
+                                  args.batch_wait_ms, max(1, args.audio_batch), lock)
+    server.text = DynamicBatcher(lambda prompts: clap_text_features(clap, prompts),
+                                 args.batch_wait_ms, max(1, args.text_batch), lock)
+
+    print(f"[model-server] listening on {where}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("[model-server] stopped")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,8 +1,9 @@
 import os
 import tempfile
+import threading
 import requests
-import random
-from supabase import create_client
+import services
+from db import execute_sync, get_sync_client, vector_literal
 from dotenv import load_dotenv
 
 try:
@@ -11,143 +12,318 @@ except Exception:
     ffmpeg = None
 
 try:
-    import librosa
+    import numpy as np
 except Exception:
-    librosa = None
+    np = None
 
 try:
-    import torch
+    from layout import place
 except Exception:
-    torch = None
+    place = None
 
 try:
-    from transformers import ClapModel, ClapProcessor
+    import librosa
 except Exception:
-    ClapModel = None
-    ClapProcessor = None
+    librosa = None
 
 load_dotenv()
 
 SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
-SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
-supabase = None
-if SUPABASE_URL and SUPABASE_KEY:
-    try:
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
-    except Exception as e:
-        print(f"Failed to initialize Supabase in process: {e}")
-
-# Load model globally so it stays in memory across background tasks
-model_id = "laion/clap-htsat-unfused"
-if ClapModel is None or ClapProcessor is None:
-    print("Transformers/CLAP not installed; embedding generation disabled.")
-    processor = None
-    model = None
-else:
+supabase = get_sync_client()
+
+# With MODEL_SERVER_URL set, embeddings come from the shared model server (model_server.py);
+# otherwise CLAP (torch + transformers) loads on first embed through the service registry and
+# then stays in memory for the life of the process.
+def model_server():
+    return services.get("model_server")
+
+
+def clap_available() -> bool:
     try:
-        processor = ClapProcessor.from_pretrained(model_id)
-        model = ClapModel.from_pretrained(model_id)
-    except Exception as e:
-        print(f"Failed to load CLAP model globally: {e}")
-        processor = None
-        model = None
+        return model_server() is not None or services.get("clap") is not None
+    except services.ServiceUnavailable:
+        return False
 
-def make_preview(track_id: str, audio_url: str):
-    print(f"make_preview background task started for {track_id}")
-    if ffmpeg is None:
-        print("ffmpeg-python not installed; skipping preview generation")
-        return
+SAMPLE_RATE = 48000
+CLIP_SECONDS = 10.0
+PREVIEW_START_SECONDS = 30.0
+PREVIEW_SECONDS = 10.0
+# Only the start of a track is kept in memory (preview window and CLAP clip); the rest is
+# streamed through the analyzers DECODE_CHUNK_SECONDS at a time.
+HEAD_SECONDS = max(PREVIEW_START_SECONDS + PREVIEW_SECONDS, CLIP_SECONDS)
+DECODE_CHUNK_SECONDS = 1.0
+
+def decode_audio(audio_url: str, sr: int = SAMPLE_RATE, duration: float = CLIP_SECONDS):
+    """Downloads a track and decodes the first `duration` seconds to mono PCM.
+
+    Kept free of model state so it can run inside a process pool.
+    """
+    if librosa is None:
+        return None
     r = requests.get(audio_url)
     if r.status_code != 200:
-        print("Failed to download audio for preview")
-        return
-        
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f_in, \
-         tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as f_out:
+        print(f"Failed to download audio for decoding: {audio_url}")
+        return None
+
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f_in:
         f_in.write(r.content)
         f_in.flush()
-        
         try:
-            (
-                ffmpeg.input(f_in.name, ss=30)
-                .output(f_out.name, t=10, format='mp3')
-                .overwrite_output()
-                .run(capture_stdout=True, capture_stderr=True)
-            )
-        except ffmpeg.Error:
-            try:
-                (
-                    ffmpeg.input(f_in.name)
-                    .output(f_out.name, t=10, format='mp3')
-                    .overwrite_output()
-                    .run(capture_stdout=True, capture_stderr=True)
-                )
-            except ffmpeg.Error:
-                print("FFmpeg slicing failed")
-                os.remove(f_in.name)
-                os.remove(f_out.name)
-                return
-        
-        if supabase:
-            with open(f_out.name, "rb") as po:
-                preview_path = f"previews/{track_id}.mp3"
-                supabase.storage.from_("audio").upload(
-                    path=preview_path, 
-                    file=po.read(), 
-                    file_options={"content-type": "audio/mpeg"}
-                )
-            preview_url = f"{SUPABASE_URL}/storage/v1/object/public/audio/{preview_path}"
-            supabase.table("tracks").update({"preview_file_url": preview_url, "status": "PREVIEW_READY"}).eq("id", track_id).execute()
-            
+            audio_data, _ = librosa.load(f_in.name, sr=sr, duration=duration)
+        except Exception as e:
+            print(f"Audio decode failed: {str(e)}")
+            audio_data = None
     os.remove(f_in.name)
-    os.remove(f_out.name)
+    return audio_data
 
 
-def make_embedding(track_id: str, audio_url: str):
-    print(f"make_embedding background task started for {track_id}")
-    if not supabase or not model or not processor or not librosa or not torch:
-        print("Missing deps for embedding")
-        return False
-        
-    r = requests.get(audio_url)
-    if r.status_code != 200:
-        print("Failed to download audio for embedding")
-        return False
-        
-    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as f_in:
-        f_in.write(r.content)
-        f_in.flush()
-        
+def fit_clip(audio_data, n_samples: int = int(SAMPLE_RATE * CLIP_SECONDS)):
+    """Repeat-pads or trims a clip to exactly `n_samples` so batches stack into one tensor."""
+    if len(audio_data) == 0:
+        return np.zeros(n_samples, dtype=np.float32)
+    if len(audio_data) < n_samples:
+        audio_data = np.tile(audio_data, int(np.ceil(n_samples / len(audio_data))))
+    return np.ascontiguousarray(audio_data[:n_samples], dtype=np.float32)
+
+
+def clap_audio_features(clap, clips):
+    """One CLAP audio forward pass over clips already fitted with fit_clip."""
+    inputs = clap.processor(audios=list(clips), return_tensors="pt", sampling_rate=SAMPLE_RATE)
+    with clap.torch.no_grad():
+        audio_embed = clap.model.get_audio_features(**inputs)
+    return audio_embed.tolist()
+
+
+def clap_text_features(clap, prompts):
+    inputs = clap.processor(text=list(prompts), return_tensors="pt", padding=True)
+    with clap.torch.no_grad():
+        text_embed = clap.model.get_text_features(**inputs)
+    return text_embed.tolist()
+
+
+def embed_audio_batch(clips):
+    """Runs a list of decoded clips through CLAP in a single forward pass."""
+    batch = [fit_clip(c) for c in clips]
+    remote = model_server()
+    if remote is not None:
+        return remote.embed_audio(batch)
+    return clap_audio_features(services.get("clap"), batch)
+
+
+def embed_text_batch(prompts):
+    """Encodes a list of text prompts with the CLAP text tower in one forward pass."""
+    remote = model_server()
+    if remote is not None:
+        return remote.embed_text(prompts)
+    return clap_text_features(services.get("clap"), prompts)
+
+
+def scan_pcm(audio_url: str = None, audio_bytes: bytes = None, sr: int = SAMPLE_RATE,
+             head_seconds: float = HEAD_SECONDS):
+    """Decodes a track in one streaming pass; memory stays flat however long the track is.
+
+    Returns (head, analysis): the first `head_seconds` as float32 stereo PCM with shape
+    (n_samples, 2), and the track columns computed by ANALYZERS over the whole track.
+    Reads from in-memory bytes when given, otherwise ffmpeg fetches the URL itself,
+    so no temp files are written either way.
+    """
+    source = ffmpeg.input("pipe:0") if audio_bytes is not None else ffmpeg.input(audio_url)
+    proc = (
+        source.output("pipe:1", format="f32le", ac=2, ar=sr)
+        .global_args("-loglevel", "error")
+        .run_async(pipe_stdin=audio_bytes is not None, pipe_stdout=True)
+    )
+    feeder = None
+    if audio_bytes is not None:
+        # Fed from a thread: ffmpeg stops reading stdin while its stdout is full.
+        def feed():
+            try:
+                proc.stdin.write(audio_bytes)
+            except BrokenPipeError:
+                pass
+            finally:
+                proc.stdin.close()
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+
+    analyzers = [make(sr) for make in ANALYZERS]
+    head, kept = [], 0
+    head_samples = int(head_seconds * sr)
+    chunk_bytes = int(DECODE_CHUNK_SECONDS * sr) * 8  # 2 channels x float32
+    try:
+        while True:
+            buf = proc.stdout.read(chunk_bytes)
+            if not buf:
+                break
+            pcm = np.frombuffer(buf, dtype=np.float32, count=len(buf) // 4 // 2 * 2).reshape(-1, 2)
+            if kept < head_samples:
+                head.append(pcm[:head_samples - kept].copy())
+                kept += len(head[-1])
+            mono = pcm.mean(axis=1)
+            for analyzer in list(analyzers):
+                try:
+                    analyzer.update(mono)
+                except Exception as e:
+                    print(f"Analyzer {type(analyzer).__name__} failed: {e}")
+                    analyzers.remove(analyzer)
+        if proc.wait() != 0:
+            raise RuntimeError(f"ffmpeg exited with status {proc.returncode}")
+    finally:
+        if proc.poll() is None:
+            proc.kill()
+            proc.wait()
+        if feeder is not None:
+            feeder.join()
+
+    analysis = {}
+    for analyzer in analyzers:
+        try:
+            analysis.update(analyzer.result())
+        except Exception as e:
+            print(f"Analyzer {type(analyzer).__name__} failed: {e}")
+    head = np.concatenate(head) if head else np.zeros((0, 2), dtype=np.float32)
+    return head, analysis
+
+
+def encode_preview(pcm, sr: int = SAMPLE_RATE) -> bytes:
+    """Encodes a PREVIEW_SECONDS mp3 from decoded PCM, starting 30s in when the track is long enough."""
+    start = int(PREVIEW_START_SECONDS * sr)
+    if len(pcm) < start + int(PREVIEW_SECONDS * sr):
+        start = 0
+    clip = np.ascontiguousarray(pcm[start:start + int(PREVIEW_SECONDS * sr)])
+    out, _ = (
+        ffmpeg.input("pipe:0", format="f32le", ac=2, ar=sr)
+        .output("pipe:1", format="mp3")
+        .run(input=clip.tobytes(), capture_stdout=True, capture_stderr=True)
+    )
+    return out
+
+
+class DurationAnalyzer:
+    def __init__(self, sr: int):
+        self.sr = sr
+        self.samples = 0
+
+    def update(self, mono):
+        self.samples += len(mono)
+
+    def result(self):
+        return {"duration": round(self.samples / self.sr, 3)}
+
+
+class LoudnessAnalyzer:
+    """Whole-track RMS level in dBFS."""
+
+    def __init__(self, sr: int):
+        self.samples = 0
+        self.sum_squares = 0.0
+
+    def update(self, mono):
+        self.samples += len(mono)
+        self.sum_squares += float(np.sum(np.square(mono, dtype=np.float64)))
+
+    def result(self):
+        rms = (self.sum_squares / self.samples) ** 0.5 if self.samples else 0.0
+        return {"loudness_db": round(float(20 * np.log10(max(rms, 1e-9))), 2)}
+
+
+# Each analyzer is built with the sample rate, sees every mono chunk in order, and
+# returns track columns to update from result().
+ANALYZERS = [DurationAnalyzer, LoudnessAnalyzer]
+
+
+def run_media_pipeline(track_id: str, audio_url: str, audio_bytes: bytes = None,
+                       preview: bool = True, embed: bool = True):
+    """Decodes a track once, streaming it through ANALYZERS and keeping the head for the preview and CLAP.
+
+    All results land in a single tracks update. Returns a dict describing what ran.
+    """
+    print(f"media pipeline started for {track_id}")
+    result = {"preview": False, "embedded": False}
+    if ffmpeg is None or np is None:
+        print("ffmpeg-python/numpy not installed; skipping media pipeline")
+        return result
+
+    try:
+        pcm, update_data = scan_pcm(audio_url, audio_bytes)
+    except Exception as e:
+        if audio_bytes is None:
+            print(f"FFmpeg decode failed: {e}")
+            return result
+        # Some containers (e.g. m4a with a trailing moov atom) can't be probed from a pipe.
         try:
-            audio_data, sr = librosa.load(f_in.name, sr=48000, duration=10.0)
-            inputs = processor(audios=audio_data, return_tensors="pt", sampling_rate=48000)
-            with torch.no_grad():
-                audio_embed = model.get_audio_features(**inputs)
-                
-            embedding_list = audio_embed[0].tolist()
+            pcm, update_data = scan_pcm(audio_url)
+        except Exception as e:
+            print(f"FFmpeg decode failed: {e}")
+            return result
+    if not len(pcm):
+        print("Decoded audio is empty")
+        return result
+
+    if preview and supabase:
+        try:
+            preview_path = f"previews/{track_id}.mp3"
+            supabase.storage.from_("audio").upload(
+                path=preview_path,
+                file=encode_preview(pcm),
+                # A retried job finds the object from the earlier attempt already there.
+                file_options={"content-type": "audio/mpeg", "upsert": "true"}
+            )
+            update_data["preview_file_url"] = f"{SUPABASE_URL}/storage/v1/object/public/audio/{preview_path}"
+            result["preview"] = True
+        except Exception as e:
+            print(f"Preview generation failed: {e}")
+
+    if embed and clap_available():
+        try:
+            embedding_list = embed_audio_batch([pcm[:int(SAMPLE_RATE * CLIP_SECONDS)].mean(axis=1)])[0]
+            map_x, map_y = place(supabase, [embedding_list])[0]
+            update_data.update({
+                "embedding_vector": vector_literal(embedding_list),
+                "map_x": map_x,
+                "map_y": map_y,
+                "status": "LIVE"
+            })
+            result["embedded"] = True
         except Exception as e:
             print(f"Embedding extraction failed: {str(e)}")
-            os.remove(f_in.name)
-            return False
-            
-    os.remove(f_in.name)
-    
-    vec_str = "[" + ",".join(map(str, embedding_list)) + "]"
-    
-    map_x = random.uniform(0, 100)
-    map_y = random.uniform(0, 100)
-
-    update_data = {
-        "embedding_vector": vec_str,
-        "map_x": map_x,
-        "map_y": map_y,
-        "status": "LIVE"
-    }
-    
+
+    if not supabase:
+        return result
     try:
-        supabase.table("tracks").update(update_data).eq("id", track_id).execute()
-        print(f"Successfully embedded and mapped {track_id}")
-        return True
+        if update_data:
+            supabase.table("tracks").update(update_data).eq("id", track_id).execute()
+        if result["preview"] and not result["embedded"]:
+            # Only advance UPLOADED rows; never pull a claimed (EMBEDDING) or LIVE track back.
+            supabase.table("tracks").update({"status": "PREVIEW_READY"}).eq("id", track_id).eq("status", "UPLOADED").execute()
+        print(f"media pipeline finished for {track_id}: {result}")
     except Exception as e:
+        # Nothing reached the row, so report failure and let the job be retried.
         print(f"DB update failed: {str(e)}")
+        result["preview"] = False
+        result["embedded"] = False
+    return result
+
+
+def reuse_media(track_id: str) -> dict:
+    """Copies preview/embedding/map position from an earlier upload of the same audio (by content hash).
+
+    Returns {"reused_from", "preview", "embedded"}; all falsy when there's nothing to reuse.
+    """
+    if not supabase:
+        return {"reused_from": None, "preview": False, "embedded": False}
+    res = execute_sync("tracks.reuse_media", supabase.rpc("reuse_track_media", {"p_track_id": track_id}))
+    return res.data or {"reused_from": None, "preview": False, "embedded": False}
+
+
+def make_preview(track_id: str, audio_url: str):
+    print(f"make_preview background task started for {track_id}")
+    run_media_pipeline(track_id, audio_url, embed=False)
+
+
+def make_embedding(track_id: str, audio_url: str):
+    print(f"make_embedding background task started for {track_id}")
+    if not supabase or not clap_available():
+        print("Missing deps for embedding")
         return False
+    return run_media_pipeline(track_id, audio_url, preview=False)["embedded"]
@@ -0,0 +1,249 @@
+import os
+import time
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Sequence
+
+RADIO_QUEUE_DEPTH = int(os.environ.get("RADIO_QUEUE_DEPTH", "10"))
+RADIO_QUEUE_LOW_WATER = int(os.environ.get("RADIO_QUEUE_LOW_WATER", "3"))
+RADIO_SESSION_TTL_SECONDS = float(os.environ.get("RADIO_SESSION_TTL_SECONDS", "1800"))
+RADIO_MAX_SESSIONS = int(os.environ.get("RADIO_MAX_SESSIONS", "10000"))
+RADIO_HISTORY_SIZE = 200
+# Recent plays and skips excluded from candidate searches outright; older ones are only down-ranked.
+RADIO_EXCLUDE_RECENT = 50
+
+# build_fn(seed_track_id, prompt_text, exclude_ids, history, weights, limit) -> ranked track rows
+BuildFn = Callable[[str, Optional[str], List[str], List[str], Optional[Dict[str, float]], int], List[dict]]
+
+
+class RadioSession:
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.lock = threading.Lock()
+        self.queue: List[dict] = []
+        self.history = deque(maxlen=RADIO_HISTORY_SIZE)
+        self.skipped = deque(maxlen=RADIO_HISTORY_SIZE)
+        self.prompt_text: Optional[str] = None
+        self.weights: Optional[Dict[str, float]] = None
+        self.served_id: Optional[str] = None
+        # Bumped whenever the queue is replaced; refills started under an older generation are dropped.
+        self.generation = 0
+        self.refilling = False
+        self.touched = time.monotonic()
+
+    def exclude_ids(self) -> List[str]:
+        recent = list(self.history)[-RADIO_EXCLUDE_RECENT:]
+        recent_skips = list(self.skipped)[-RADIO_EXCLUDE_RECENT:]
+        return list(dict.fromkeys([*recent, *(t["id"] for t in self.queue), *recent_skips]))
+
+    def ranking_history(self) -> List[str]:
+        """Play history for the ranker, oldest first, led by older skips so they're down-ranked too."""
+        played = set(self.history)
+        older_skips = [t for t in list(self.skipped)[:-RADIO_EXCLUDE_RECENT] if t not in played]
+        return older_skips + list(self.history)
+
+    def record_skip(self, track_id: str):
+        if track_id in self.skipped:
+            self.skipped.remove(track_id)
+        self.skipped.append(track_id)
+
+    def record_play(self, track_id: str):
+        if not self.history or self.history[-1] != track_id:
+            self.history.append(track_id)
+
+    def anchor(self) -> Optional[str]:
+        """Most recent played track the listener didn't skip."""
+        for track_id in reversed(self.history):
+            if track_id not in self.skipped:
+                return track_id
+        return self.history[-1] if self.history else None
+
+
+class InMemoryRadioStore:
+    """Sessions by id, evicted after `ttl_seconds` idle or least-recently-used beyond `max_sessions`.
+
+    Anything with get/create/stats can stand in (e.g. a shared store for several API replicas).
+    """
+
+    def __init__(self, ttl_seconds: float = RADIO_SESSION_TTL_SECONDS, max_sessions: int = RADIO_MAX_SESSIONS):
+        self.ttl_seconds = ttl_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        cutoff = time.monotonic() - self.ttl_seconds
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.touched >= cutoff and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def get(self, session_id: str) -> Optional[RadioSession]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None or session.touched < time.monotonic() - self.ttl_seconds:
+                return None
+            session.touched = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def create(self, session_id: str) -> RadioSession:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = RadioSession(session_id)
+            session.touched = time.monotonic()
+            self._sessions.move_to_end(session_id)
+            self._evict()
+            return session
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._sessions)}
+
+
+class RadioQueueManager:
+    """Keeps a ranked look-ahead queue per radio session so transitions are served from memory.
+
+    The first request of a session (or one that leaves the queue: a new prompt, new
+    weights, a jump to an unqueued track) builds the queue inline. After that the queue
+    is topped up in the background whenever it drops below `low_water`, and a skip
+    event re-ranks it from the last track the listener kept.
+    """
+
+    def __init__(self, build_fn: BuildFn, store=None, depth: int = RADIO_QUEUE_DEPTH,
+                 low_water: int = RADIO_QUEUE_LOW_WATER, workers: int = 4):
+        self.build_fn = build_fn
+        self.store = store or InMemoryRadioStore()
+        self.depth = depth
+        self.low_water = low_water
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="radio-queue")
+        self.served_from_queue = 0
+        self.inline_builds = 0
+        self.background_builds = 0
+
+    def _build(self, session: RadioSession, seed_track_id: str) -> List[dict]:
+        return self.build_fn(
+            seed_track_id,
+            session.prompt_text,
+            session.exclude_ids(),
+            session.ranking_history() + [t["id"] for t in session.queue],
+            session.weights,
+            self.depth,
+        )
+
+    def _schedule(self, session: RadioSession, replace: bool = False):
+        """Refills (or, with replace, rebuilds) the queue off the request path. Caller holds session.lock."""
+        if session.refilling and not replace:
+            return
+        if replace:
+            session.generation += 1
+        session.refilling = True
+        self._executor.submit(self._refill, session, session.generation, replace)
+
+    def _refill(self, session: RadioSession, generation: int, replace: bool):
+        try:
+            with session.lock:
+                if generation != session.generation:
+                    return
+                if replace:
+                    seed = session.anchor()
+                else:
+                    seed = session.queue[-1]["id"] if session.queue else session.served_id
+                if seed is None:
+                    return
+                prompt_text, weights = session.prompt_text, session.weights
+                exclude = session.exclude_ids()
+                history = session.ranking_history() + ([] if replace else [t["id"] for t in session.queue])
+            tracks = self.build_fn(seed, prompt_text, exclude, history, weights, self.depth)
+            self.background_builds += 1
+            with session.lock:
+                if generation != session.generation:
+                    return
+                if replace:
+                    session.queue = []
+                seen = set(session.exclude_ids())
+                for track in tracks:
+                    if track["id"] not in seen and len(session.queue) < self.depth:
+                        session.queue.append(track)
+                        seen.add(track["id"])
+        except Exception as e:
+            print(f"Radio queue refill failed for {session.session_id}: {e}")
+        finally:
+            with session.lock:
+                if generation == session.generation:
+                    session.refilling = False
+
+    def start(self, session_id: str, track_id: str):
+        """Registers a new session on its first track and fills its queue in the background."""
+        session = self.store.create(session_id)
+        with session.lock:
+            session.record_play(track_id)
+            session.served_id = track_id
+            self._schedule(session, replace=True)
+
+    def next_track(self, session_id: str, last_track_id: str, prompt_text: Optional[str] = None,
+                   recent_track_ids: Sequence[str] = (), weights: Optional[Dict[str, float]] = None) -> Optional[dict]:
+        session = self.store.create(session_id)
+        with session.lock:
+            for track_id in recent_track_ids:
+                if track_id not in session.history:
+                    session.history.append(track_id)
+            session.record_play(last_track_id)
+
+            queued = [t["id"] for t in session.queue]
+            stale = prompt_text != session.prompt_text or weights != session.weights
+            if last_track_id in queued:
+                # Client played ahead from the prefetched queue.
+                del session.queue[:queued.index(last_track_id) + 1]
+            elif session.served_id is not None and last_track_id != session.served_id:
+                stale = True
+
+            if stale or not session.queue:
+                session.prompt_text, session.weights = prompt_text, weights
+                session.generation += 1
+                session.refilling = False
+                session.queue = []
+                session.queue = self._build(session, last_track_id)
+                self.inline_builds += 1
+            else:
+                self.served_from_queue += 1
+
+            track = session.queue.pop(0) if session.queue else None
+            session.served_id = track["id"] if track else last_track_id
+            if len(session.queue) < self.low_water:
+                self._schedule(session)
+            return track
+
+    def peek(self, session_id: str, limit: Optional[int] = None) -> Optional[List[dict]]:
+        session = self.store.get(session_id)
+        if session is None:
+            return None
+        with session.lock:
+            return list(session.queue[:limit] if limit else session.queue)
+
+    def on_events(self, rows: List[dict]):
+        """Event ingest listener: a skip re-ranks that session's queue away from the skipped track."""
+        for row in rows:
+            if row.get("event_type") != "skip":
+                continue
+            self._executor.submit(self._handle_skip, row["session_id"], row["track_id"])
+
+    def _handle_skip(self, session_id: str, track_id: str):
+        session = self.store.get(session_id)
+        if session is None:
+            return
+        with session.lock:
+            session.record_skip(track_id)
+            session.queue = [t for t in session.queue if t["id"] != track_id]
+            self._schedule(session, replace=True)
+
+    def stats(self):
+        return {
+            **self.store.stats(),
+            "served_from_queue": self.served_from_queue,
+            "inline_builds": self.inline_builds,
+            "background_builds": self.background_builds,
+        }
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import Client, create_client
+
+# Ensure repo root is importable when running `python scripts/export_embeddings.py`.
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from embedding_store import EMBEDDINGS_PATH, append, read_meta, remove, write_snapshot
+from layout import decode_halfvec, iter_embeddings
+from spatial_index import CHANGE_SEQ_OVERLAP
+
+
+def init_supabase() -> Client:
+    load_dotenv()
+    url = os.environ.get("SUPABASE_URL", "")
+    key = os.environ.get("SUPABASE_KEY", "")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+    return create_client(url, key)
+
+
+def current_change_seq(supabase: Client) -> int:
+    res = supabase.table("tracks").select("change_seq").order("change_seq", desc=True).limit(1).execute()
+    return res.data[0]["change_seq"] if res.data else 0
+
+
+def export_full(supabase: Client, path: str, page_size: int) -> int:
+    # Anything that changes while the export runs is picked up by the next incremental pass.
+    cursor = current_change_seq(supabase)
+    return write_snapshot(path, iter_embeddings(supabase, page_size, dtype=np.float16), meta={"cursor": cursor})
+
+
+def export_incremental(supabase: Client, path: str, page_size: int):
+    """Applies embeddings changed since the snapshot's cursor. Returns (appended, updated, removed).
+
+    Tracks that left LIVE, lost their embedding or were deleted come back without an
+    embedding and are masked out of the snapshot.
+    """
+    cursor = read_meta(path).get("cursor", 0)
+    # change_seq is assigned before commit, so re-read a window behind the cursor; rewriting a row is harmless.
+    since = max(cursor - CHANGE_SEQ_OVERLAP, 0)
+    appended = updated = removed = 0
+    while True:
+        rows = supabase.rpc("export_embeddings_since", {"p_after_seq": since, "p_limit": page_size}).execute().data or []
+        if not rows:
+            break
+        since = rows[-1]["change_seq"]
+        cursor = max(cursor, since)
+        # Rows come in change order, so the last one per track wins.
+        latest = {r["id"]: r["embedding"] for r in rows}
+        live = [(track_id, emb) for track_id, emb in latest.items() if emb is not None]
+        gone = [track_id for track_id, emb in latest.items() if emb is None]
+        if gone:
+            removed += remove(path, gone, meta={"cursor": cursor})
+        if live:
+            added, changed = append(
+                path,
+                [track_id for track_id, _ in live],
+                np.stack([decode_halfvec(emb) for _, emb in live]),
+                meta={"cursor": cursor},
+            )
+            appended += added
+            updated += changed
+        if len(rows) < page_size:
+            break
+    return appended, updated, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export LIVE embeddings to a memory-mapped .npy snapshot")
+    parser.add_argument("--path", default=EMBEDDINGS_PATH, help="snapshot file (ids and cursor live next to it)")
+    parser.add_argument("--full", action="store_true", help="rewrite the snapshot instead of appending changes")
+    parser.add_argument("--page-size", type=int, default=1000, help="embeddings fetched per request")
+    parser.add_argument("--interval", type=float, default=0,
+                        help="keep running, appending changes every N seconds (0 exits after one pass)")
+    args = parser.parse_args()
+
+    try:
+        supabase = init_supabase()
+    except Exception as exc:
+        print(f"[embeddings] startup error: {exc}")
+        return 1
+
+    while True:
+        started = time.monotonic()
+        try:
+            if args.full or not os.path.exists(args.path):
+                rows = export_full(supabase, args.path, args.page_size)
+                print(f"[embeddings] wrote {rows} embedding(s) to {args.path} in {time.monotonic() - started:.1f}s")
+                args.full = False
+            else:
+                appended, updated, removed = export_incremental(supabase, args.path, args.page_size)
+                if appended or updated or removed or not args.interval:
+                    print(f"[embeddings] appended {appended}, updated {updated}, removed {removed} "
+                          f"in {time.monotonic() - started:.1f}s")
+        except Exception as exc:
+            print(f"[embeddings] export failed: {exc}")
+            if not args.interval:
+                return 1
+        if not args.interval:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
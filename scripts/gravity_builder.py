@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Tuple
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import Client, create_client
+
+load_dotenv()
+
+# Transition weights credited to the edge (previous track -> this track).
+EVENT_WEIGHTS = {"play_10s": 1.0, "like": 2.0}
+# A skip costs up to SKIP_PENALTY, less the longer the track played first.
+SKIP_PENALTY = 1.0
+SKIP_WINDOW_MS = 30000.0
+# Events further apart than this don't connect two tracks.
+SESSION_GAP_SECONDS = 30 * 60
+# Shared with the API, which decays stored weights to "now" when ranking neighbors.
+HALF_LIFE_DAYS = float(os.environ.get("GRAVITY_HALF_LIFE_DAYS", "30"))
+SESSION_STATE_TTL = timedelta(days=1)
+
+
+def init_supabase() -> Client:
+    load_dotenv()
+    url = os.environ.get("SUPABASE_URL", "")
+    key = os.environ.get("SUPABASE_KEY", "")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+    return create_client(url, key)
+
+
+def _epoch(value: str) -> float:
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def read_cursor(supabase: Client) -> int:
+    res = supabase.table("gravity_cursor").select("last_processed_seq").limit(1).execute()
+    return int(res.data[0]["last_processed_seq"]) if res.data else 0
+
+
+def fetch_events(supabase: Client, after_seq: int, limit: int, settle_seconds: int) -> List[dict]:
+    res = supabase.rpc("fetch_gravity_events", {
+        "p_after_seq": after_seq,
+        "p_limit": limit,
+        "p_settle_seconds": settle_seconds,
+    }).execute()
+    return res.data or []
+
+
+def load_session_states(supabase: Client, session_ids: List[str]) -> Dict[str, dict]:
+    res = supabase.rpc("gravity_session_states", {"p_session_ids": session_ids}).execute()
+    return {r["session_id"]: r for r in res.data or []}
+
+
+def aggregate(events: List[dict], states: Dict[str, dict], now: float,
+              half_life_days: float = HALF_LIFE_DAYS) -> Tuple[List[dict], List[dict]]:
+    """Turns a chunk of events into summed edge deltas plus the new per-session state.
+
+    Within a session, events on a track are credited to the edge from the track played
+    before it. The session's last two tracks come from `states` so a transition split
+    across chunks still counts. Deltas are discounted by event age with the same
+    half-life the database applies to stored weights.
+    """
+    n = len(events)
+    sess_ids, sess = np.unique(np.array([e["session_id"] for e in events]), return_inverse=True)
+    state_tracks = [s[k] for s in states.values() for k in ("current_track_id", "previous_track_id") if s.get(k)]
+    track_ids, track_inv = np.unique(np.array([e["track_id"] for e in events] + state_tracks), return_inverse=True)
+    track = track_inv[:n]
+    code = {t: i for i, t in enumerate(track_ids)}
+    seq = np.array([e["seq"] for e in events], dtype=np.int64)
+    ts = np.array([_epoch(e["event_at"]) for e in events])
+    etype = np.array([e["event_type"] for e in events])
+    elapsed = np.array([np.nan if e.get("elapsed_ms") is None else e["elapsed_ms"] for e in events], dtype=np.float64)
+
+    order = np.lexsort((seq, ts, sess))
+    sess, track, seq, ts, etype, elapsed = sess[order], track[order], seq[order], ts[order], etype[order], elapsed[order]
+
+    # Carried-over state, per session code.
+    m = len(sess_ids)
+    carry_cur = np.full(m, -1)
+    carry_prev = np.full(m, -1)
+    carry_ts = np.full(m, -np.inf)
+    for i, sid in enumerate(sess_ids):
+        s = states.get(sid)
+        if s:
+            carry_cur[i] = code.get(s.get("current_track_id"), -1)
+            carry_prev[i] = code.get(s.get("previous_track_id"), -1)
+            carry_ts[i] = _epoch(s["last_event_at"])
+
+    session_start = np.ones(n, dtype=bool)
+    session_start[1:] = sess[1:] != sess[:-1]
+    prev_ts = np.empty(n)
+    prev_ts[1:] = ts[:-1]
+    prev_ts[session_start] = carry_ts[sess[session_start]]
+    broken = (ts - prev_ts) > SESSION_GAP_SECONDS
+    track_change = np.ones(n, dtype=bool)
+    track_change[1:] = track[1:] != track[:-1]
+    run_start = session_start | broken | track_change
+
+    run_id = np.cumsum(run_start) - 1
+    starts = np.flatnonzero(run_start)
+    run_track = track[starts]
+    run_from = np.full(len(starts), -1)
+    run_from[1:] = run_track[:-1]
+    # First run of a session continues from the carried state (unless too old).
+    first = session_start[starts]
+    s0 = sess[starts[first]]
+    continues = carry_cur[s0] == run_track[first]
+    run_from[first] = np.where(continues, carry_prev[s0], carry_cur[s0])
+    run_from[broken[starts]] = -1
+    source = run_from[run_id]
+
+    weight = np.zeros(n)
+    for name, w in EVENT_WEIGHTS.items():
+        weight[etype == name] = w
+    skips = etype == "skip"
+    played = np.clip(np.nan_to_num(elapsed[skips], nan=0.0) / SKIP_WINDOW_MS, 0.0, 1.0)
+    weight[skips] = -SKIP_PENALTY * (1.0 - played)
+    age_days = np.clip(now - ts, 0.0, None) / 86400.0
+    weight *= 0.5 ** (age_days / half_life_days)
+
+    mask = (source >= 0) & (source != track) & (weight != 0)
+    deltas = []
+    if mask.any():
+        k = len(track_ids)
+        keys, inverse = np.unique(source[mask] * k + track[mask], return_inverse=True)
+        sums = np.bincount(inverse, weights=weight[mask])
+        deltas = [
+            {"from_track_id": track_ids[key // k], "to_track_id": track_ids[key % k], "weight": round(float(w), 6)}
+            for key, w in zip(keys, sums)
+            if w != 0
+        ]
+
+    last = np.flatnonzero(np.r_[sess[1:] != sess[:-1], True])
+    sessions = []
+    for i in last:
+        prev = run_from[run_id[i]]
+        sessions.append({
+            "session_id": sess_ids[sess[i]],
+            "current_track_id": track_ids[track[i]],
+            "previous_track_id": track_ids[prev] if prev >= 0 else None,
+            "last_seq": int(seq[i]),
+            "last_event_at": datetime.fromtimestamp(ts[i], tz=timezone.utc).isoformat(),
+        })
+    return deltas, sessions
+
+
+def run_once(supabase: Client, chunk_size: int, settle_seconds: int, half_life_days: float) -> Tuple[int, int]:
+    """Processes every settled event after the cursor. Returns (events, edges) applied."""
+    cursor = read_cursor(supabase)
+    total_events = total_edges = 0
+    while True:
+        events = fetch_events(supabase, cursor, chunk_size, settle_seconds)
+        if not events:
+            break
+        states = load_session_states(supabase, sorted({e["session_id"] for e in events}))
+        deltas, sessions = aggregate(events, states, time.time(), half_life_days)
+        to_seq = events[-1]["seq"]
+        res = supabase.rpc("apply_edge_deltas", {
+            "p_deltas": deltas,
+            "p_sessions": sessions,
+            "p_from_seq": cursor,
+            "p_to_seq": to_seq,
+            "p_half_life_days": half_life_days,
+        }).execute()
+        cursor = to_seq
+        total_events += len(events)
+        total_edges += res.data or 0
+        if len(events) < chunk_size:
+            break
+    return total_events, total_edges
+
+
+def prune_session_states(supabase: Client):
+    cutoff = (datetime.now(timezone.utc) - SESSION_STATE_TTL).isoformat()
+    supabase.table("gravity_session_state").delete().lt("last_event_at", cutoff).execute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fold new listening events into the track_edges gravity graph")
+    parser.add_argument("--chunk-size", type=int, default=5000, help="events read and applied per batch")
+    parser.add_argument("--settle-seconds", type=int, default=30,
+                        help="leave events this recent for the next run (in-flight inserts may still commit below them)")
+    parser.add_argument("--half-life-days", type=float, default=HALF_LIFE_DAYS, help="edge weight decay half-life")
+    parser.add_argument("--interval", type=int, default=0, help="keep running, polling every N seconds (0 runs once)")
+    args = parser.parse_args()
+
+    try:
+        supabase = init_supabase()
+    except Exception as exc:
+        print(f"[gravity] startup error: {exc}")
+        return 1
+
+    while True:
+        started = time.monotonic()
+        try:
+            events, edges = run_once(supabase, args.chunk_size, args.settle_seconds, args.half_life_days)
+            prune_session_states(supabase)
+            if events:
+                print(f"[gravity] {events} event(s) -> {edges} edge update(s) in {time.monotonic() - started:.1f}s")
+        except KeyboardInterrupt:
+            print("[gravity] stopped")
+            return 0
+        except Exception as exc:
+            print(f"[gravity] run error: {exc}")
+            if not args.interval:
+                return 1
+        if not args.interval:
+            return 0
+        time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
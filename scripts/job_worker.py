@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+import argparse
+import multiprocessing
+import os
+import socket
+import sys
+import time
+import uuid
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+# Ensure repo root is importable when running `python scripts/job_worker.py`.
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from jobqueue import create_queue, JOB_QUEUE_BACKEND
+
+
+def handle_media_pipeline(job):
+    # Imported here so only worker processes ever load ffmpeg/CLAP.
+    from process import run_media_pipeline, reuse_media
+
+    payload = job["payload"]
+    preview, embed = payload.get("preview", True), payload.get("embed", True)
+    # An identical upload may have finished processing since this job was enqueued.
+    reused = reuse_media(payload["track_id"])
+    preview, embed = preview and not reused["preview"], embed and not reused["embedded"]
+    if not preview and not embed:
+        print(f"media pipeline for {payload['track_id']} satisfied by {reused['reused_from']}")
+        return
+    result = run_media_pipeline(payload["track_id"], payload["audio_url"], job.get("blob"),
+                                preview=preview, embed=embed)
+    if not result["preview"] and not result["embedded"]:
+        raise RuntimeError("media pipeline produced neither preview nor embedding")
+
+
+HANDLERS = {
+    "media_pipeline": handle_media_pipeline,
+}
+
+
+def init_queue(backend: str):
+    load_dotenv()
+    supabase = None
+    if backend == "postgres":
+        from supabase import create_client
+        url = os.environ.get("SUPABASE_URL", "")
+        key = os.environ.get("SUPABASE_KEY", "")
+        if not url or not key:
+            raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+        supabase = create_client(url, key)
+    return create_queue(backend, supabase)
+
+
+def run_job(queue, job, worker_id: str):
+    handler = HANDLERS.get(job["kind"])
+    if handler is None:
+        queue.fail(job["id"], f"no handler for job kind {job['kind']}", worker_id)
+        return False
+    try:
+        handler(job)
+    except Exception as exc:
+        print(f"[jobs] {job['kind']} {job['id']} failed (attempt {job['attempts']}): {exc}")
+        queue.fail(job["id"], str(exc), worker_id)
+        return False
+    if not queue.complete(job["id"], worker_id):
+        print(f"[jobs] {job['kind']} {job['id']} finished after its lease was reclaimed; result dropped")
+        return False
+    return True
+
+
+def worker_loop(backend: str, interval: float, lease_seconds: int, once: bool = False):
+    queue = init_queue(backend)
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    print(f"[jobs] worker {worker_id} started ({backend})")
+    while True:
+        try:
+            jobs = queue.claim(worker_id, limit=1, lease_seconds=lease_seconds, kinds=list(HANDLERS))
+            for job in jobs:
+                run_job(queue, job, worker_id)
+            if once:
+                return
+            if not jobs:
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            return
+        except Exception as exc:
+            print(f"[jobs] loop error: {exc}")
+            time.sleep(interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="STELLOS job queue worker pool")
+    parser.add_argument("--backend", default=JOB_QUEUE_BACKEND, choices=("sqlite", "postgres"))
+    parser.add_argument("--concurrency", type=int, default=1, help="worker processes")
+    parser.add_argument("--interval", type=float, default=1.0, help="idle poll interval in seconds")
+    parser.add_argument("--lease-seconds", type=int, default=600, help="job lease; expired jobs are retried")
+    parser.add_argument("--once", action="store_true", help="claim and run one job, then exit")
+    args = parser.parse_args()
+
+    if args.once or args.concurrency <= 1:
+        worker_loop(args.backend, args.interval, args.lease_seconds, args.once)
+        return 0
+
+    procs = [
+        multiprocessing.Process(target=worker_loop, args=(args.backend, args.interval, args.lease_seconds))
+        for _ in range(args.concurrency)
+    ]
+    for p in procs:
+        p.start()
+    try:
+        for p in procs:
+            p.join()
+    except KeyboardInterrupt:
+        print("[jobs] stopping")
+        for p in procs:
+            p.terminate()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from dotenv import load_dotenv
+from supabase import Client, create_client
+
+# Ensure repo root is importable when running `python scripts/layout_refit.py`.
+ROOT_DIR = Path(__file__).resolve().parents[1]
+if str(ROOT_DIR) not in sys.path:
+    sys.path.insert(0, str(ROOT_DIR))
+
+from embedding_store import REMOVED_ID, EmbeddingStore
+from layout import fit_projection, iter_embeddings, project, save_projection
+
+
+def init_supabase() -> Client:
+    load_dotenv()
+    url = os.environ.get("SUPABASE_URL", "")
+    key = os.environ.get("SUPABASE_KEY", "")
+    if not url or not key:
+        raise RuntimeError("SUPABASE_URL and SUPABASE_KEY must be set")
+    return create_client(url, key)
+
+
+def snapshot_pages(store: EmbeddingStore, page_size: int):
+    """(ids, float32 matrix) pages straight from a memory-mapped snapshot, skipping removed rows."""
+    for start in range(0, len(store.ids), page_size):
+        ids = store.ids[start:start + page_size]
+        keep = [i for i, track_id in enumerate(ids) if track_id != REMOVED_ID]
+        if keep:
+            yield [ids[i] for i in keep], np.asarray(store.matrix[start:start + page_size][keep], dtype=np.float32)
+
+
+def sample_embeddings(pages, fit_sample: int, seed: int = 0):
+    """Reservoir-samples up to `fit_sample` embeddings in one streaming pass."""
+    rng = np.random.default_rng(seed)
+    reservoir = None
+    seen = 0
+    for _, page in pages:
+        if reservoir is None:
+            reservoir = np.empty((fit_sample, page.shape[1]), dtype=np.float32)
+        for vec in page:
+            if seen < fit_sample:
+                reservoir[seen] = vec
+            else:
+                j = rng.integers(0, seen + 1)
+                if j < fit_sample:
+                    reservoir[j] = vec
+            seen += 1
+    if reservoir is None:
+        return None, 0
+    return reservoir[:min(seen, fit_sample)], seen
+
+
+def write_positions(supabase: Client, projection, pages, write_batch: int):
+    written = 0
+    for ids, page in pages:
+        coords = project(projection, page)
+        rows = [
+            {"id": track_id, "map_x": float(x), "map_y": float(y)}
+            for track_id, (x, y) in zip(ids, coords)
+        ]
+        for start in range(0, len(rows), write_batch):
+            res = supabase.rpc("bulk_update_track_positions", {"updates": rows[start:start + write_batch]}).execute()
+            written += res.data or 0
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-fit the galaxy map layout and rewrite all track positions")
+    parser.add_argument("--fit-sample", type=int, default=50000, help="max embeddings used to fit the projection")
+    parser.add_argument("--page-size", type=int, default=1000, help="embeddings fetched per request")
+    parser.add_argument("--write-batch", type=int, default=500, help="positions per bulk update")
+    parser.add_argument("--snapshot", help="read embeddings from this export_embeddings.py snapshot instead of the database")
+    args = parser.parse_args()
+
+    try:
+        supabase = init_supabase()
+    except Exception as exc:
+        print(f"[layout] startup error: {exc}")
+        return 1
+
+    store = None
+    if args.snapshot:
+        store = EmbeddingStore(args.snapshot)
+        print(f"[layout] reading {len(store)} embedding(s) from {args.snapshot}")
+
+    def pages():
+        if store is not None:
+            return snapshot_pages(store, args.page_size)
+        return iter_embeddings(supabase, args.page_size)
+
+    started = time.monotonic()
+    sample, total = sample_embeddings(pages(), args.fit_sample)
+    if sample is None or len(sample) < 3:
+        print("[layout] not enough embedded tracks to fit a layout")
+        return 0
+
+    projection = save_projection(supabase, fit_projection(sample))
+    print(f"[layout] fitted projection on {len(sample)}/{total} track(s)")
+
+    written = write_positions(supabase, projection, pages(), args.write_batch)
+    print(f"[layout] placed {written} track(s) in {time.monotonic() - started:.1f}s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
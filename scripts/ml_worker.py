@@ -1,8 +1,12 @@
 #!/usr/bin/env python3
 import argparse
 import os
+import socket
 import sys
+import threading
 import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 from dotenv import load_dotenv
@@ -14,7 +18,10 @@ if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 # Reuse embedding pipeline logic from backend.
-from process import make_embedding
+from process import decode_audio, embed_audio_batch
+from db import vector_literal
+from layout import place
+import services
 
 
 def init_supabase() -> Client:
@@ -26,61 +33,151 @@ def init_supabase() -> Client:
     return create_client(url, key)
 
 
-def fetch_pending_tracks(supabase: Client, batch_size: int):
-    pending = []
-    for status in ("UPLOADED", "PREVIEW_READY"):
+def make_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+
+def claim_tracks(supabase: Client, worker_id: str, batch_size: int, lease_seconds: int):
+    """Atomically claims up to `batch_size` pending (or lease-expired) tracks for this worker."""
+    try:
+        res = supabase.rpc("claim_embedding_jobs", {
+            "p_worker_id": worker_id,
+            "p_limit": batch_size,
+            "p_lease_seconds": lease_seconds,
+        }).execute()
+        return res.data or []
+    except Exception as exc:
+        print(f"[worker] failed to claim tracks: {exc}")
+        return []
+
+
+def release_tracks(supabase: Client, worker_id: str, track_ids, status: str = "PREVIEW_READY"):
+    if not track_ids:
+        return
+    try:
+        supabase.rpc("release_embedding_jobs", {
+            "p_worker_id": worker_id,
+            "p_track_ids": list(track_ids),
+            "p_status": status,
+        }).execute()
+    except Exception as exc:
+        print(f"[worker] could not release {len(track_ids)} track(s): {exc}")
+
+
+class LeaseHeartbeat:
+    """Background thread that keeps the leases on an in-flight batch alive."""
+
+    def __init__(self, supabase: Client, worker_id: str, track_ids, lease_seconds: int):
+        self.supabase = supabase
+        self.worker_id = worker_id
+        self.track_ids = list(track_ids)
+        self.lease_seconds = lease_seconds
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        interval = max(1.0, self.lease_seconds / 3)
+        while not self._stop.wait(interval):
+            try:
+                self.supabase.rpc("heartbeat_embedding_jobs", {
+                    "p_worker_id": self.worker_id,
+                    "p_track_ids": self.track_ids,
+                    "p_lease_seconds": self.lease_seconds,
+                }).execute()
+            except Exception as exc:
+                print(f"[worker] heartbeat failed: {exc}")
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+
+def decode_tracks(tracks, decode_pool=None):
+    urls = [t["audio_file_url"] for t in tracks]
+    if decode_pool is None:
+        return [decode_audio(u) for u in urls]
+    return list(decode_pool.map(decode_audio, urls))
+
+
+def embed_tracks(tracks, clips, infer_batch: int):
+    """Sends decoded clips through CLAP `infer_batch` at a time. Returns ([(track_id, vector)], failed_ids)."""
+    embedded, failed = [], []
+    ready = [(t, c) for t, c in zip(tracks, clips) if c is not None]
+    failed.extend(t["id"] for t, c in zip(tracks, clips) if c is None)
+
+    for start in range(0, len(ready), infer_batch):
+        chunk = ready[start:start + infer_batch]
         try:
-            res = (
-                supabase.table("tracks")
-                .select("id,audio_file_url,status")
-                .eq("status", status)
-                .limit(batch_size)
-                .execute()
-            )
-            pending.extend(res.data or [])
-            if len(pending) >= batch_size:
-                break
+            vectors = embed_audio_batch([c for _, c in chunk])
         except Exception as exc:
-            print(f"[worker] failed to fetch {status} tracks: {exc}")
-    return pending[:batch_size]
+            print(f"[worker] embedding batch failed: {exc}")
+            failed.extend(t["id"] for t, _ in chunk)
+            continue
+        embedded.extend((track["id"], vec) for (track, _), vec in zip(chunk, vectors))
+    return embedded, failed
 
 
-def process_batch(supabase: Client, batch_size: int):
-    tracks = fetch_pending_tracks(supabase, batch_size)
+def build_rows(supabase: Client, embedded):
+    """Places a batch of new embeddings on the map with the frozen layout projection."""
+    if not embedded:
+        return []
+    coords = place(supabase, [vec for _, vec in embedded])
+    return [
+        {"id": track_id, "embedding_vector": vector_literal(vec), "map_x": x, "map_y": y}
+        for (track_id, vec), (x, y) in zip(embedded, coords)
+    ]
+
+
+def write_back(supabase: Client, worker_id: str, rows):
+    if not rows:
+        return 0
+    res = supabase.rpc("bulk_update_track_embeddings", {"updates": rows, "p_worker_id": worker_id}).execute()
+    return res.data or 0
+
+
+def process_batch(supabase: Client, worker_id: str, batch_size: int, decode_pool=None,
+                  infer_batch: int = 8, lease_seconds: int = 300):
+    tracks = claim_tracks(supabase, worker_id, batch_size, lease_seconds)
     if not tracks:
         print("[worker] no pending tracks")
         return 0
 
-    processed = 0
-    for track in tracks:
-        track_id = track.get("id")
-        audio_url = track.get("audio_file_url")
-        if not track_id or not audio_url:
-            continue
+    started = time.monotonic()
+    print(f"[worker] {worker_id} embedding {len(tracks)} track(s)")
+
+    with LeaseHeartbeat(supabase, worker_id, [t["id"] for t in tracks], lease_seconds):
+        clips = decode_tracks(tracks, decode_pool)
+        embedded, failed = embed_tracks(tracks, clips, max(1, infer_batch))
+        rows = build_rows(supabase, embedded)
 
-        print(f"[worker] embedding track {track_id} ({track.get('status')})")
-        # Best effort lock to reduce duplicate processing if multiple workers run.
         try:
-            supabase.table("tracks").update({"status": "EMBEDDING"}).eq("id", track_id).execute()
+            written = write_back(supabase, worker_id, rows)
         except Exception as exc:
-            print(f"[worker] could not set EMBEDDING for {track_id}: {exc}")
+            print(f"[worker] bulk write-back failed: {exc}")
+            failed.extend(r["id"] for r in rows)
+            written = 0
 
-        success = make_embedding(track_id, audio_url)
-        if not success:
-            # Put the track back so it can be retried on future worker loops.
-            try:
-                supabase.table("tracks").update({"status": "PREVIEW_READY"}).eq("id", track_id).execute()
-            except Exception as exc:
-                print(f"[worker] could not reset status for {track_id}: {exc}")
-        processed += 1
+    # Put failed tracks back so they can be retried on future worker loops.
+    release_tracks(supabase, worker_id, failed)
 
-    return processed
+    elapsed = max(time.monotonic() - started, 1e-6)
+    print(f"[worker] embedded {written}/{len(tracks)} track(s) in {elapsed:.1f}s ({written / elapsed:.2f} tracks/sec)")
+    return len(tracks)
 
 
 def main():
     parser = argparse.ArgumentParser(description="STELLOS async ML embedding worker")
     parser.add_argument("--interval", type=int, default=20, help="poll interval in seconds")
     parser.add_argument("--batch-size", type=int, default=10, help="tracks per poll")
+    parser.add_argument("--decode-workers", type=int, default=os.cpu_count() or 1,
+                        help="processes used for download/decode (0 decodes inline)")
+    parser.add_argument("--infer-batch", type=int, default=8, help="clips per CLAP forward pass")
+    parser.add_argument("--lease-seconds", type=int, default=300,
+                        help="claim lease length; expired leases are reclaimed by other workers")
     parser.add_argument("--once", action="store_true", help="run one batch and exit")
     args = parser.parse_args()
 
@@ -90,20 +187,40 @@ def main():
         print(f"[worker] startup error: {exc}")
         return 1
 
-    print("[worker] started")
-    if args.once:
-        process_batch(supabase, args.batch_size)
-        return 0
+    # Load CLAP (or reach the model server) before claiming anything, so a worker
+    # without a model never leases tracks.
+    try:
+        remote = services.get("model_server")
+        if remote is not None:
+            remote.wait_ready()
+            print(f"[worker] using model server at {remote.url}")
+        else:
+            services.get("clap")
+    except Exception as exc:
+        print(f"[worker] startup error: {exc}")
+        return 1
 
-    while True:
-        try:
-            process_batch(supabase, args.batch_size)
-        except KeyboardInterrupt:
-            print("[worker] stopped")
+    worker_id = make_worker_id()
+    decode_pool = ProcessPoolExecutor(max_workers=args.decode_workers) if args.decode_workers > 0 else None
+
+    print(f"[worker] started as {worker_id}")
+    try:
+        if args.once:
+            process_batch(supabase, worker_id, args.batch_size, decode_pool, args.infer_batch, args.lease_seconds)
             return 0
-        except Exception as exc:
-            print(f"[worker] loop error: {exc}")
-        time.sleep(args.interval)
+
+        while True:
+            try:
+                process_batch(supabase, worker_id, args.batch_size, decode_pool, args.infer_batch, args.lease_seconds)
+            except KeyboardInterrupt:
+                print("[worker] stopped")
+                return 0
+            except Exception as exc:
+                print(f"[worker] loop error: {exc}")
+            time.sleep(args.interval)
+    finally:
+        if decode_pool is not None:
+            decode_pool.shutdown(cancel_futures=True)
 
 
 if __name__ == "__main__":
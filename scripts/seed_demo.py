@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
 import argparse
+import hashlib
+import json
 import os
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 import requests
+from requests.adapters import HTTPAdapter
 
 SUPPORTED_EXT = {".mp3", ".wav", ".m4a", ".flac", ".aac", ".ogg"}
+HASH_CHUNK_BYTES = 1024 * 1024
 
 def find_audio_files(path: str):
     files = []
@@ -20,24 +28,216 @@ def find_audio_files(path: str):
             files.append(path)
     return files
 
-def upload_file(api_url: str, file_path: str, title: str, artist: str):
+def file_sha256(file_path: str) -> str:
+    h = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_BYTES), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def title_for(file_path: str, prefix: str) -> str:
+    return f"{prefix}{os.path.splitext(os.path.basename(file_path))[0]}"
+
+_local = threading.local()
+
+def http_session(pool_size: int) -> requests.Session:
+    """One keep-alive session per worker thread."""
+    session = getattr(_local, "session", None)
+    if session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        _local.session = session
+    return session
+
+def upload_file(api_url: str, file_path: str, title: str, artist: str, session=requests):
     with open(file_path, "rb") as f:
         files = {"file": (os.path.basename(file_path), f)}
         data = {
             "title": title,
             "artist_name": artist
         }
-        res = requests.post(f"{api_url}/upload", files=files, data=data, timeout=120)
+        res = session.post(f"{api_url}/upload", files=files, data=data, timeout=120)
         if not res.ok:
             raise RuntimeError(f"Upload failed: {res.status_code} {res.text}")
         return res.json()
 
+def upload_batch(api_url: str, file_paths, titles, artist: str, session=requests):
+    handles = [open(fp, "rb") for fp in file_paths]
+    try:
+        files = [("files", (os.path.basename(fp), fh)) for fp, fh in zip(file_paths, handles)]
+        data = [("titles", t) for t in titles] + [("artist_name", artist)]
+        res = session.post(f"{api_url}/upload/batch", files=files, data=data, timeout=600)
+        if not res.ok:
+            raise RuntimeError(f"Batch upload failed: {res.status_code} {res.text}")
+        return res.json()["uploads"]
+    finally:
+        for fh in handles:
+            fh.close()
+
+
+class Manifest:
+    """Append-only JSONL record of finished uploads, so reruns skip them.
+
+    A file counts as done if its path, size and mtime match an entry; identical audio
+    (same sha256) under another path is skipped as a duplicate.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.done = {}
+        self.hashes = {}
+        self._claimed = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.done[entry["path"]] = (entry["size"], entry["mtime"])
+                    self.hashes[entry["sha256"]] = entry["track_id"]
+        self._out = open(path, "a", encoding="utf-8")
+
+    @staticmethod
+    def _stat(file_path: str):
+        st = os.stat(file_path)
+        return st.st_size, int(st.st_mtime)
+
+    def is_done(self, file_path: str) -> bool:
+        return self.done.get(os.path.abspath(file_path)) == self._stat(file_path)
+
+    def claim(self, sha256: str):
+        """Returns the track id already holding this audio, or None after reserving it for the caller."""
+        with self._lock:
+            if sha256 in self.hashes:
+                return self.hashes[sha256]
+            if sha256 in self._claimed:
+                return "a file uploading in this run"
+            self._claimed.add(sha256)
+            return None
+
+    def release(self, sha256: str):
+        with self._lock:
+            self._claimed.discard(sha256)
+
+    def record(self, file_path: str, sha256: str, track_id: str):
+        size, mtime = self._stat(file_path)
+        entry = {"path": os.path.abspath(file_path), "size": size, "mtime": mtime,
+                 "sha256": sha256, "track_id": track_id}
+        with self._lock:
+            self._claimed.discard(sha256)
+            self.hashes[sha256] = track_id
+            self.done[entry["path"]] = (size, mtime)
+            self._out.write(json.dumps(entry) + "\n")
+            self._out.flush()
+
+    def close(self):
+        self._out.close()
+
+
+def seed_sequential(args, files):
+    for i, fp in enumerate(files, start=1):
+        title = title_for(fp, args.title_prefix)
+        print(f"[{i}/{len(files)}] {fp}")
+        try:
+            resp = upload_file(args.api_url, fp, title, args.artist)
+            print(f"  -> track_id={resp.get('track_id')} status={resp.get('status')}")
+        except Exception as e:
+            print(f"  -> failed: {e}")
+
+def seed_bulk(args, files):
+    manifest = Manifest(args.manifest)
+    pending = [fp for fp in files if not manifest.is_done(fp)]
+    print(f"{len(files) - len(pending)} file(s) already in {args.manifest}, {len(pending)} to go")
+    counts = {"uploaded": 0, "duplicate": 0, "failed": 0}
+    counts_lock = threading.Lock()
+    started = time.monotonic()
+
+    def bump(key, n=1):
+        with counts_lock:
+            counts[key] += n
+            done = sum(counts.values())
+        if done % 100 == 0 or done == len(pending):
+            rate = done / max(time.monotonic() - started, 1e-9)
+            print(f"  {done}/{len(pending)} ({counts['uploaded']} uploaded, {counts['duplicate']} duplicate, "
+                  f"{counts['failed']} failed, {rate:.1f} files/s)")
+
+    def prepare(fp):
+        """Hashes a file and reserves its content; None if it's a duplicate."""
+        sha = file_sha256(fp)
+        existing = manifest.claim(sha)
+        if existing:
+            print(f"  skip {fp}: same audio as {existing}")
+            bump("duplicate")
+            return None
+        return sha
+
+    def upload_one(fp):
+        sha = prepare(fp)
+        if sha is None:
+            return
+        try:
+            resp = upload_file(args.api_url, fp, title_for(fp, args.title_prefix), args.artist,
+                               http_session(args.workers))
+            manifest.record(fp, sha, resp["track_id"])
+            bump("uploaded")
+        except Exception as e:
+            manifest.release(sha)
+            print(f"  failed {fp}: {e}")
+            bump("failed")
+
+    def upload_group(group):
+        ready = [(fp, sha) for fp in group for sha in [prepare(fp)] if sha is not None]
+        if not ready:
+            return
+        try:
+            results = upload_batch(args.api_url, [fp for fp, _ in ready],
+                                   [title_for(fp, args.title_prefix) for fp, _ in ready],
+                                   args.artist, http_session(args.workers))
+        except Exception as e:
+            for _, sha in ready:
+                manifest.release(sha)
+            print(f"  batch of {len(ready)} failed: {e}")
+            bump("failed", len(ready))
+            return
+        for (fp, sha), result in zip(ready, results):
+            if result.get("status") == "UPLOADED":
+                manifest.record(fp, sha, result["track_id"])
+                bump("uploaded")
+            else:
+                manifest.release(sha)
+                print(f"  failed {fp}: {result.get('error')}")
+                bump("failed")
+
+    try:
+        with ThreadPoolExecutor(max_workers=args.workers) as pool:
+            if args.batch_size > 1:
+                groups = [pending[i:i + args.batch_size] for i in range(0, len(pending), args.batch_size)]
+                futures = [pool.submit(upload_group, g) for g in groups]
+            else:
+                futures = [pool.submit(upload_one, fp) for fp in pending]
+            for fut in as_completed(futures):
+                fut.result()
+    finally:
+        manifest.close()
+    print(f"Done in {time.monotonic() - started:.1f}s: {counts}")
+
 def main():
     parser = argparse.ArgumentParser(description="Seed demo tracks via API upload.")
     parser.add_argument("--api-url", default=os.environ.get("API_URL", "http://localhost:7860"))
     parser.add_argument("--path", required=True, help="File or directory containing audio files")
     parser.add_argument("--artist", default="Demo Artist", help="Artist name for all uploads")
     parser.add_argument("--title-prefix", default="", help="Prefix for titles")
+    parser.add_argument("--bulk", action="store_true",
+                        help="parallel, resumable import with content dedupe (see --workers, --manifest)")
+    parser.add_argument("--workers", type=int, default=8, help="concurrent uploads in --bulk mode")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="files per /upload/batch request in --bulk mode (1 uses /upload)")
+    parser.add_argument("--manifest", default="seed_manifest.jsonl",
+                        help="progress file for --bulk mode; reruns skip files listed in it")
     args = parser.parse_args()
 
     files = find_audio_files(args.path)
@@ -46,14 +246,10 @@ def main():
         return 1
 
     print(f"Uploading {len(files)} file(s) to {args.api_url}")
-    for i, fp in enumerate(files, start=1):
-        title = f"{args.title_prefix}{os.path.splitext(os.path.basename(fp))[0]}"
-        print(f"[{i}/{len(files)}] {fp}")
-        try:
-            resp = upload_file(args.api_url, fp, title, args.artist)
-            print(f"  -> track_id={resp.get('track_id')} status={resp.get('status')}")
-        except Exception as e:
-            print(f"  -> failed: {e}")
+    if args.bulk:
+        seed_bulk(args, sorted(files))
+    else:
+        seed_sequential(args, files)
     return 0
 
 if __name__ == "__main__":
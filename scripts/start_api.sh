@@ -0,0 +1,9 @@
+#!/bin/sh
+# API container entrypoint. Uploads only enqueue media jobs, so something has to consume them:
+# by default a job_worker runs next to uvicorn, sharing the sqlite queue file on this disk.
+# Set JOB_WORKERS=0 when a separate worker service consumes a JOB_QUEUE_BACKEND=postgres queue.
+set -e
+if [ "${JOB_WORKERS:-1}" -gt 0 ]; then
+    python -u scripts/job_worker.py --concurrency "${JOB_WORKERS:-1}" &
+fi
+exec uvicorn main:app --host 0.0.0.0 --port "${PORT:-7860}"
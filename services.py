@@ -0,0 +1,162 @@
+import os
+import time
+import threading
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Loaded in the background right after API startup; anything else loads on first use.
+WARM_SERVICES = [s.strip() for s in os.environ.get("WARM_SERVICES", "stripe,xrpl").split(",") if s.strip()]
+# A failed load is retried on the next get() once this long has passed.
+SERVICE_RETRY_SECONDS = float(os.environ.get("SERVICE_RETRY_SECONDS", "60"))
+CLAP_MODEL_ID = os.environ.get("CLAP_MODEL_ID", "laion/clap-htsat-unfused")
+CLAP_QUANTIZE = os.environ.get("CLAP_QUANTIZE", "0") == "1"
+XRPL_RPC_URL = os.environ.get("XRPL_RPC_URL", "https://s.altnet.rippletest.net:51234/")
+
+
+class ServiceUnavailable(RuntimeError):
+    pass
+
+
+class LazyService:
+    """A heavy component built by `loader` once, on first get() or by a warm-up.
+
+    A loader returning None means the component is switched off by configuration
+    (callers fall back to their mock path); a loader that raises leaves the service
+    failed, and get() raises ServiceUnavailable until `retry_seconds` have passed,
+    when the next get() tries loading again.
+    """
+
+    def __init__(self, name: str, loader: Callable[[], Any], retry_seconds: float = SERVICE_RETRY_SECONDS):
+        self.name = name
+        self.loader = loader
+        self.retry_seconds = retry_seconds
+        self.state = "idle"
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self.failed_at: Optional[float] = None
+        self._value = None
+        self._lock = threading.Lock()
+
+    def retry_due(self) -> bool:
+        return self.state == "failed" and time.monotonic() - self.failed_at >= self.retry_seconds
+
+    def get(self):
+        if self.state not in ("ready", "disabled"):
+            with self._lock:
+                if self.state == "idle" or self.retry_due():
+                    self._load()
+        if self.state == "failed":
+            raise ServiceUnavailable(self.error)
+        return self._value
+
+    def _load(self):
+        self.state = "loading"
+        started = time.monotonic()
+        try:
+            value = self.loader()
+        except Exception as e:
+            self.error = f"{self.name} unavailable: {type(e).__name__}: {e}"
+            self.failed_at = time.monotonic()
+            self.state = "failed"
+            print(f"Failed to load {self.name}: {e}")
+        else:
+            self._value = value
+            self.error = None
+            self.state = "disabled" if value is None else "ready"
+        self.load_seconds = round(time.monotonic() - started, 3)
+
+    def status(self) -> Dict[str, Any]:
+        status = {"state": self.state, "load_seconds": self.load_seconds, "error": self.error}
+        if self.state == "failed":
+            status["retry_in_seconds"] = round(max(self.retry_seconds - (time.monotonic() - self.failed_at), 0), 1)
+        return status
+
+
+class ServiceRegistry:
+    def __init__(self):
+        self._services: Dict[str, LazyService] = {}
+
+    def register(self, name: str, loader: Callable[[], Any]) -> LazyService:
+        service = self._services[name] = LazyService(name, loader)
+        return service
+
+    def get(self, name: str):
+        return self._services[name].get()
+
+    def warm_up(self, names: List[str] = WARM_SERVICES):
+        """Loads the named services now (call from a thread; loaders block)."""
+        for name in names:
+            if name not in self._services:
+                print(f"Warning: unknown service {name} in WARM_SERVICES")
+                continue
+            try:
+                self.get(name)
+            except ServiceUnavailable:
+                pass
+
+    def due_for_retry(self, names: List[str]) -> List[str]:
+        return [name for name in names if name in self._services and self._services[name].retry_due()]
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {name: service.status() for name, service in self._services.items()}
+
+
+def load_clap(quantize: bool = CLAP_QUANTIZE):
+    import torch
+    from transformers import ClapModel, ClapProcessor
+    processor = ClapProcessor.from_pretrained(CLAP_MODEL_ID)
+    model = ClapModel.from_pretrained(CLAP_MODEL_ID)
+    model.eval()
+    if quantize:
+        # int8 weights for every Linear layer, activations quantized on the fly (CPU only).
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return SimpleNamespace(torch=torch, model=model, processor=processor)
+
+
+def _load_model_server():
+    url = os.environ.get("MODEL_SERVER_URL", "")
+    if not url:
+        return None
+    from model_server import ModelServerClient
+    return ModelServerClient(url)
+
+
+def _load_stripe():
+    api_key = os.environ.get("STRIPE_API_KEY", "")
+    if not api_key:
+        return None
+    import stripe
+    stripe.api_key = api_key
+    return stripe
+
+
+def _load_xrpl():
+    seed = os.environ.get("XRPL_SEED", "")
+    if not seed:
+        return None
+    from xrpl.clients import JsonRpcClient
+    from xrpl.models.transactions import Memo, Payment
+    from xrpl.transaction import submit_and_wait
+    from xrpl.wallet import Wallet
+    return SimpleNamespace(
+        client=JsonRpcClient(XRPL_RPC_URL),
+        wallet=Wallet.from_seed(seed),
+        Memo=Memo,
+        Payment=Payment,
+        submit_and_wait=submit_and_wait,
+    )
+
+
+registry = ServiceRegistry()
+registry.register("clap", load_clap)
+registry.register("model_server", _load_model_server)
+registry.register("stripe", _load_stripe)
+registry.register("xrpl", _load_xrpl)
+
+
+def get(name: str):
+    return registry.get(name)
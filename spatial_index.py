@@ -0,0 +1,252 @@
+import time
+import threading
+from collections import deque
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from layout import MAP_SIZE
+
+# Columns the map needs; never the 512-float embedding.
+SLIM_COLUMNS = "id,title,artist_name,audio_file_url,preview_file_url,status,map_x,map_y,vote_score,licensing_enabled,artist_id,change_seq"
+
+# Sequence values are handed out before commit, so a slow transaction can commit a
+# lower change_seq after a reader has moved past it. Re-reading a small window
+# behind the cursor catches those rows; applying a row twice is harmless.
+CHANGE_SEQ_OVERLAP = 200
+
+# Recent changes kept for /tracks/changes; older cursors get a full reset.
+CHANGE_LOG_SIZE = 10000
+
+TILE_MAX_POINTS = 500
+CLUSTER_GRID = 16
+
+
+class GridIndex:
+    """Uniform grid over map coordinates. Cells hold track ids; rows are kept by id."""
+
+    def __init__(self, cell_size: float = 2.0):
+        self.cell_size = cell_size
+        self.rows: Dict[str, dict] = {}
+        self.cells: Dict[Tuple[int, int], set] = {}
+        self._cell_of: Dict[str, Tuple[int, int]] = {}
+
+    def _cell(self, x: float, y: float) -> Tuple[int, int]:
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def upsert(self, row: dict):
+        track_id = row["id"]
+        self.remove(track_id)
+        cell = self._cell(float(row["map_x"]), float(row["map_y"]))
+        self.rows[track_id] = row
+        self.cells.setdefault(cell, set()).add(track_id)
+        self._cell_of[track_id] = cell
+
+    def remove(self, track_id: str):
+        cell = self._cell_of.pop(track_id, None)
+        if cell is None:
+            return
+        self.rows.pop(track_id, None)
+        ids = self.cells.get(cell)
+        if ids is not None:
+            ids.discard(track_id)
+            if not ids:
+                del self.cells[cell]
+
+    def query(self, x1: float, y1: float, x2: float, y2: float) -> List[dict]:
+        cx1, cy1 = self._cell(x1, y1)
+        cx2, cy2 = self._cell(x2, y2)
+        out = []
+        # Walk whichever is smaller: the cells in the box or the occupied cells.
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) <= len(self.cells):
+            cells = ((cx, cy) for cx in range(cx1, cx2 + 1) for cy in range(cy1, cy2 + 1))
+        else:
+            cells = (c for c in self.cells if cx1 <= c[0] <= cx2 and cy1 <= c[1] <= cy2)
+        for cell in cells:
+            for track_id in self.cells.get(cell, ()):
+                row = self.rows[track_id]
+                if x1 <= float(row["map_x"]) <= x2 and y1 <= float(row["map_y"]) <= y2:
+                    out.append(row)
+        return out
+
+    def __len__(self):
+        return len(self.rows)
+
+
+def is_placed(row: dict) -> bool:
+    return row.get("status") == "LIVE" and row.get("map_x") is not None and row.get("map_y") is not None
+
+
+class TrackSpatialIndex:
+    """In-memory index of LIVE track positions, refreshed incrementally via tracks.change_seq.
+
+    Every applied change is also appended to a bounded change log so clients can sync
+    deltas (`changes_since`) without touching the database.
+    """
+
+    def __init__(self, supabase, cell_size: float = 2.0, refresh_seconds: float = 5.0, page_size: int = 1000):
+        self.supabase = supabase
+        self.grid = GridIndex(cell_size)
+        self.refresh_seconds = refresh_seconds
+        self.page_size = page_size
+        self.cursor = 0
+        self.loaded = False
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        # (position, row). Positions never decrease; see apply() for late rows.
+        self.log = deque()
+        self.log_floor = 0
+        self._applied_seq: Dict[str, int] = {}
+
+    def _fetch_changes(self, since: int) -> List[dict]:
+        rows = []
+        while True:
+            query = (
+                self.supabase.table("tracks")
+                .select(SLIM_COLUMNS)
+                .gt("change_seq", since)
+                .order("change_seq")
+                .limit(self.page_size)
+            )
+            if not self.loaded:
+                query = query.eq("status", "LIVE")
+            page = query.execute().data or []
+            rows.extend(page)
+            if len(page) < self.page_size:
+                return rows
+            since = page[-1]["change_seq"]
+
+    def _fetch_tombstones(self, since: int) -> List[dict]:
+        res = (
+            self.supabase.table("track_tombstones")
+            .select("track_id,change_seq")
+            .gt("change_seq", since)
+            .order("change_seq")
+            .execute()
+        )
+        return [{"id": r["track_id"], "status": "DELETED", "change_seq": r["change_seq"]} for r in res.data or []]
+
+    def apply(self, rows: List[dict]) -> List[dict]:
+        """Applies changed rows and returns the ones not seen before.
+
+        LIVE rows with a position are (re)indexed, everything else is dropped from the index.
+        """
+        fresh = []
+        for row in sorted(rows, key=lambda r: r.get("change_seq") or 0):
+            seq = row.get("change_seq") or 0
+            if self._applied_seq.get(row["id"], -1) >= seq:
+                continue
+            self._applied_seq[row["id"]] = seq
+            if is_placed(row):
+                self.grid.upsert(row)
+            else:
+                self.grid.remove(row["id"])
+            fresh.append(row)
+
+            if seq > self.cursor:
+                self.cursor = seq
+                position = float(seq)
+            else:
+                # Committed late, behind cursors already handed out. Log it just past the
+                # current cursor so every client holding that cursor still receives it.
+                position = self.cursor + 0.5
+            if self.loaded:
+                self.log.append((position, row))
+        while len(self.log) > CHANGE_LOG_SIZE:
+            position, _ = self.log.popleft()
+            self.log_floor = position
+        return fresh
+
+    def refresh(self) -> List[dict]:
+        """Pulls changes since the cursor and returns the newly applied rows."""
+        with self._lock:
+            since = max(self.cursor - CHANGE_SEQ_OVERLAP, 0) if self.loaded else 0
+            rows = self._fetch_changes(since)
+            if self.loaded:
+                rows.extend(self._fetch_tombstones(since))
+            fresh = self.apply(rows)
+            if not self.loaded:
+                self.loaded = True
+                self.log_floor = self.cursor
+            self._refreshed_at = time.monotonic()
+            return fresh
+
+    def snapshot(self) -> Tuple[int, List[dict]]:
+        """(cursor, all indexed LIVE rows)."""
+        self.maybe_refresh()
+        with self._lock:
+            return self.cursor, list(self.grid.rows.values())
+
+    def lookup(self, track_ids: List[str]) -> Dict[str, dict]:
+        """Indexed rows for the given ids; ids that aren't LIVE on the map are left out."""
+        with self._lock:
+            return {t: self.grid.rows[t] for t in track_ids if t in self.grid.rows}
+
+    def changes_since(self, since: int) -> dict:
+        """LIVE-catalog delta since a cursor from an earlier call. Cursors older than the log get a full reset."""
+        self.maybe_refresh()
+        with self._lock:
+            if since <= 0 or since < self.log_floor:
+                return {"cursor": self.cursor, "reset": True, "upserts": list(self.grid.rows.values()), "removed": []}
+            latest = {}
+            for position, row in reversed(self.log):
+                if position <= since:
+                    break
+                latest.setdefault(row["id"], row)
+            upserts = [r for r in latest.values() if is_placed(r)]
+            removed = [r["id"] for r in latest.values() if not is_placed(r)]
+            return {"cursor": self.cursor, "reset": False, "upserts": upserts, "removed": removed}
+
+    def maybe_refresh(self):
+        if time.monotonic() - self._refreshed_at >= self.refresh_seconds:
+            try:
+                self.refresh()
+            except Exception as e:
+                if not self.loaded:
+                    raise
+                print(f"Spatial index refresh failed, serving stale data: {e}")
+
+    def query_bbox(self, x1: float, y1: float, x2: float, y2: float) -> List[dict]:
+        self.maybe_refresh()
+        with self._lock:
+            return self.grid.query(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2))
+
+    def tile(self, z: int, x: int, y: int, max_points: int = TILE_MAX_POINTS, cluster_grid: int = CLUSTER_GRID) -> dict:
+        """Tracks in map tile (z, x, y). Dense tiles are collapsed into a cluster_grid x cluster_grid level of detail."""
+        size = MAP_SIZE / (2 ** z)
+        x0, y0 = x * size, y * size
+        rows = self.query_bbox(x0, y0, x0 + size, y0 + size)
+        tile = {"z": z, "x": x, "y": y, "bbox": [x0, y0, x0 + size, y0 + size], "count": len(rows)}
+        if len(rows) <= max_points:
+            tile.update({"tracks": rows, "clusters": []})
+            return tile
+
+        xs = np.fromiter((float(r["map_x"]) for r in rows), dtype=np.float64, count=len(rows))
+        ys = np.fromiter((float(r["map_y"]) for r in rows), dtype=np.float64, count=len(rows))
+        votes = np.fromiter((r.get("vote_score") or 0 for r in rows), dtype=np.float64, count=len(rows))
+        cx = np.clip(((xs - x0) / size * cluster_grid).astype(np.int64), 0, cluster_grid - 1)
+        cy = np.clip(((ys - y0) / size * cluster_grid).astype(np.int64), 0, cluster_grid - 1)
+        keys, inverse = np.unique(cx * cluster_grid + cy, return_inverse=True)
+        counts = np.bincount(inverse)
+        mean_x = np.bincount(inverse, weights=xs) / counts
+        mean_y = np.bincount(inverse, weights=ys) / counts
+
+        # Representative per cluster: its highest-voted track.
+        order = np.lexsort((-votes, inverse))
+        first = np.searchsorted(inverse[order], np.arange(len(keys)))
+        top = order[first]
+
+        clusters, singles = [], []
+        for i in range(len(keys)):
+            if counts[i] == 1:
+                singles.append(rows[top[i]])
+                continue
+            rep = rows[top[i]]
+            clusters.append({
+                "map_x": float(mean_x[i]),
+                "map_y": float(mean_y[i]),
+                "count": int(counts[i]),
+                "top_track": {"id": rep["id"], "title": rep["title"], "artist_name": rep.get("artist_name")},
+            })
+        tile.update({"tracks": singles, "clusters": clusters})
+        return tile
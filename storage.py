@@ -0,0 +1,81 @@
+import os
+import asyncio
+from typing import AsyncIterator, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SUPABASE_URL = os.environ.get("SUPABASE_URL", "")
+SUPABASE_KEY = os.environ.get("SUPABASE_KEY", "")
+AUDIO_BUCKET = "audio"
+
+# Upload limits. Memory per upload is bounded by UPLOAD_CHUNK_BYTES regardless of file size.
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_CHUNK_BYTES = int(os.environ.get("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+MAX_CONCURRENT_UPLOADS = int(os.environ.get("MAX_CONCURRENT_UPLOADS", "8"))
+
+_client: Optional[httpx.AsyncClient] = None
+_upload_slots = asyncio.Semaphore(MAX_CONCURRENT_UPLOADS)
+
+
+class UploadTooLarge(Exception):
+    pass
+
+
+def public_url(path: str) -> str:
+    return f"{SUPABASE_URL}/storage/v1/object/public/{AUDIO_BUCKET}/{path}"
+
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            base_url=f"{SUPABASE_URL}/storage/v1",
+            headers={"Authorization": f"Bearer {SUPABASE_KEY}", "apikey": SUPABASE_KEY},
+            timeout=httpx.Timeout(120.0, connect=10.0),
+        )
+    return _client
+
+
+async def _limited(chunks: AsyncIterator[bytes], max_bytes: int, counter: dict) -> AsyncIterator[bytes]:
+    async for chunk in chunks:
+        counter["bytes"] += len(chunk)
+        if counter["bytes"] > max_bytes:
+            raise UploadTooLarge(f"Upload exceeds {max_bytes} bytes")
+        yield chunk
+
+
+async def stream_to_storage(
+    path: str,
+    chunks: AsyncIterator[bytes],
+    content_type: Optional[str] = None,
+    max_bytes: int = MAX_UPLOAD_BYTES,
+) -> int:
+    """Pipes an async stream of chunks straight into the audio bucket.
+
+    httpx pulls the next chunk only once the previous one has been written to the
+    socket, so a slow storage backend slows down reading from the client instead of
+    buffering. At most MAX_CONCURRENT_UPLOADS uploads run at once; the rest wait.
+    Returns the number of bytes stored.
+    """
+    counter = {"bytes": 0}
+    async with _upload_slots:
+        res = await _get_client().post(
+            f"/object/{AUDIO_BUCKET}/{path}",
+            content=_limited(chunks, max_bytes, counter),
+            headers={"content-type": content_type or "application/octet-stream", "x-upsert": "false"},
+        )
+    if res.status_code >= 400:
+        raise RuntimeError(f"Storage upload failed: {res.status_code} {res.text}")
+    return counter["bytes"]
+
+
+async def iter_upload_file(file, chunk_size: int = UPLOAD_CHUNK_BYTES) -> AsyncIterator[bytes]:
+    """Reads a FastAPI UploadFile in fixed-size chunks."""
+    while True:
+        chunk = await file.read(chunk_size)
+        if not chunk:
+            break
+        yield chunk
@@ -0,0 +1,26 @@
+-- Applies a batch of worker embedding results in one round-trip.
+-- updates: [{"id": uuid, "embedding_vector": "[...]", "map_x": n, "map_y": n}, ...]
+CREATE OR REPLACE FUNCTION public.bulk_update_track_embeddings(updates JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH u AS (
+        SELECT
+            (e->>'id')::UUID AS id,
+            (e->>'embedding_vector')::vector(512) AS embedding_vector,
+            (e->>'map_x')::NUMERIC AS map_x,
+            (e->>'map_y')::NUMERIC AS map_y
+        FROM jsonb_array_elements(updates) AS e
+    ),
+    updated AS (
+        UPDATE public.tracks t
+        SET embedding_vector = u.embedding_vector,
+            map_x = u.map_x,
+            map_y = u.map_y,
+            status = 'LIVE'
+        FROM u
+        WHERE t.id = u.id
+        RETURNING t.id
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
@@ -0,0 +1,117 @@
+-- Lease-based job claiming for scripts/ml_worker.py.
+-- A worker claims rows atomically (FOR UPDATE SKIP LOCKED), keeps them alive with
+-- heartbeats, and any EMBEDDING row whose lease has expired is claimable again.
+
+ALTER TABLE public.tracks
+ADD COLUMN lease_owner TEXT,
+ADD COLUMN lease_expires_at TIMESTAMPTZ,
+ADD COLUMN embed_attempts INTEGER NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_tracks_embed_pending ON public.tracks(created_at)
+WHERE status IN ('UPLOADED', 'PREVIEW_READY', 'EMBEDDING');
+
+CREATE OR REPLACE FUNCTION public.claim_embedding_jobs(
+    p_worker_id TEXT,
+    p_limit INTEGER,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_max_attempts INTEGER DEFAULT 5
+)
+RETURNS TABLE (id UUID, audio_file_url TEXT, embed_attempts INTEGER)
+LANGUAGE sql
+AS $$
+    WITH candidates AS (
+        SELECT t.id
+        FROM public.tracks t
+        WHERE (
+                t.status IN ('UPLOADED', 'PREVIEW_READY')
+                OR (t.status = 'EMBEDDING' AND (t.lease_expires_at IS NULL OR t.lease_expires_at < NOW()))
+            )
+            AND t.embed_attempts < p_max_attempts
+        ORDER BY t.created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE public.tracks t
+    SET status = 'EMBEDDING',
+        lease_owner = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        embed_attempts = t.embed_attempts + 1
+    FROM candidates c
+    WHERE t.id = c.id
+    RETURNING t.id, t.audio_file_url, t.embed_attempts;
+$$;
+
+CREATE OR REPLACE FUNCTION public.heartbeat_embedding_jobs(
+    p_worker_id TEXT,
+    p_track_ids UUID[],
+    p_lease_seconds INTEGER DEFAULT 300
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH extended AS (
+        UPDATE public.tracks
+        SET lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+        WHERE id = ANY(p_track_ids)
+            AND status = 'EMBEDDING'
+            AND lease_owner = p_worker_id
+        RETURNING id
+    )
+    SELECT COUNT(*)::INTEGER FROM extended;
+$$;
+
+CREATE OR REPLACE FUNCTION public.release_embedding_jobs(
+    p_worker_id TEXT,
+    p_track_ids UUID[],
+    p_status TEXT DEFAULT 'PREVIEW_READY'
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH released AS (
+        UPDATE public.tracks
+        SET status = p_status,
+            lease_owner = NULL,
+            lease_expires_at = NULL
+        WHERE id = ANY(p_track_ids)
+            AND status = 'EMBEDDING'
+            AND lease_owner = p_worker_id
+        RETURNING id
+    )
+    SELECT COUNT(*)::INTEGER FROM released;
+$$;
+
+-- Write-back now only lands on rows the caller still holds a lease on, so a
+-- worker whose lease expired and was reclaimed cannot clobber the new owner.
+DROP FUNCTION IF EXISTS public.bulk_update_track_embeddings(JSONB);
+
+CREATE OR REPLACE FUNCTION public.bulk_update_track_embeddings(
+    updates JSONB,
+    p_worker_id TEXT DEFAULT NULL
+)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH u AS (
+        SELECT
+            (e->>'id')::UUID AS id,
+            (e->>'embedding_vector')::vector(512) AS embedding_vector,
+            (e->>'map_x')::NUMERIC AS map_x,
+            (e->>'map_y')::NUMERIC AS map_y
+        FROM jsonb_array_elements(updates) AS e
+    ),
+    updated AS (
+        UPDATE public.tracks t
+        SET embedding_vector = u.embedding_vector,
+            map_x = u.map_x,
+            map_y = u.map_y,
+            status = 'LIVE',
+            lease_owner = NULL,
+            lease_expires_at = NULL
+        FROM u
+        WHERE t.id = u.id
+            AND (p_worker_id IS NULL OR t.lease_owner = p_worker_id)
+        RETURNING t.id
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
@@ -0,0 +1,3 @@
+-- Filled by the media pipeline analyzers alongside tracks.duration.
+ALTER TABLE public.tracks
+ADD COLUMN loudness_db NUMERIC;
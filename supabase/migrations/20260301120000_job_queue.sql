@@ -0,0 +1,75 @@
+-- Postgres backend for jobqueue.PostgresJobQueue.
+CREATE TABLE public.jobs (
+    id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
+    kind TEXT NOT NULL,
+    payload JSONB NOT NULL DEFAULT '{}'::JSONB,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 5,
+    run_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    lease_owner TEXT,
+    lease_expires_at TIMESTAMPTZ,
+    last_error TEXT,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_jobs_ready ON public.jobs(priority DESC, run_at)
+WHERE status IN ('queued', 'running');
+
+CREATE OR REPLACE FUNCTION public.claim_jobs(
+    p_worker_id TEXT,
+    p_limit INTEGER,
+    p_lease_seconds INTEGER DEFAULT 300,
+    p_kinds TEXT[] DEFAULT NULL
+)
+RETURNS SETOF public.jobs
+LANGUAGE sql
+AS $$
+    -- Jobs whose lease expired on their last allowed attempt go to the dead-letter state.
+    UPDATE public.jobs
+    SET status = 'dead', last_error = 'lease expired', updated_at = NOW()
+    WHERE status = 'running' AND lease_expires_at < NOW() AND attempts >= max_attempts;
+
+    WITH candidates AS (
+        SELECT j.id
+        FROM public.jobs j
+        WHERE ((j.status = 'queued' AND j.run_at <= NOW())
+               OR (j.status = 'running' AND j.lease_expires_at < NOW()))
+            AND (p_kinds IS NULL OR j.kind = ANY(p_kinds))
+        ORDER BY j.priority DESC, j.run_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    )
+    UPDATE public.jobs j
+    SET status = 'running',
+        lease_owner = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds),
+        attempts = j.attempts + 1,
+        updated_at = NOW()
+    FROM candidates c
+    WHERE j.id = c.id
+    RETURNING j.*;
+$$;
+
+CREATE OR REPLACE FUNCTION public.fail_job(
+    p_job_id UUID,
+    p_error TEXT,
+    p_backoff_base_seconds DOUBLE PRECISION DEFAULT 10,
+    p_backoff_max_seconds DOUBLE PRECISION DEFAULT 900
+)
+RETURNS TEXT
+LANGUAGE sql
+AS $$
+    UPDATE public.jobs
+    SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+        run_at = NOW() + make_interval(
+            secs => LEAST(p_backoff_base_seconds * POWER(2, GREATEST(attempts - 1, 0)), p_backoff_max_seconds)
+        ),
+        last_error = p_error,
+        lease_owner = NULL,
+        updated_at = NOW()
+    WHERE id = p_job_id
+    RETURNING status;
+$$;
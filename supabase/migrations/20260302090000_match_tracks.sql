@@ -0,0 +1,80 @@
+-- k-NN over tracks.embedding_vector through the HNSW vector_ip_ops index.
+-- CLAP embeddings are L2-normalized, so the inner product is the cosine similarity.
+CREATE OR REPLACE FUNCTION public.match_tracks(
+    query_embedding vector(512),
+    match_count INTEGER DEFAULT 20,
+    exclude_ids UUID[] DEFAULT '{}',
+    ef_search INTEGER DEFAULT 40
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    artist_name TEXT,
+    audio_file_url TEXT,
+    preview_file_url TEXT,
+    status TEXT,
+    map_x NUMERIC,
+    map_y NUMERIC,
+    vote_score INTEGER,
+    licensing_enabled BOOLEAN,
+    artist_id UUID,
+    similarity DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    -- Scoped to this transaction; the index needs at least match_count + excluded candidates.
+    PERFORM set_config(
+        'hnsw.ef_search',
+        GREATEST(ef_search, match_count + COALESCE(array_length(exclude_ids, 1), 0))::TEXT,
+        TRUE
+    );
+
+    RETURN QUERY
+    SELECT t.id, t.title, t.artist_name, t.audio_file_url, t.preview_file_url, t.status,
+           t.map_x, t.map_y, t.vote_score, t.licensing_enabled, t.artist_id,
+           (-(t.embedding_vector <#> query_embedding))::DOUBLE PRECISION AS similarity
+    FROM public.tracks t
+    WHERE t.status = 'LIVE'
+        AND t.embedding_vector IS NOT NULL
+        AND NOT (t.id = ANY(exclude_ids))
+    ORDER BY t.embedding_vector <#> query_embedding
+    LIMIT match_count;
+END;
+$$;
+
+-- Same search seeded by a stored track, so callers never ship the vector around.
+CREATE OR REPLACE FUNCTION public.similar_tracks(
+    p_track_id UUID,
+    match_count INTEGER DEFAULT 20,
+    exclude_ids UUID[] DEFAULT '{}',
+    ef_search INTEGER DEFAULT 40
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    artist_name TEXT,
+    audio_file_url TEXT,
+    preview_file_url TEXT,
+    status TEXT,
+    map_x NUMERIC,
+    map_y NUMERIC,
+    vote_score INTEGER,
+    licensing_enabled BOOLEAN,
+    artist_id UUID,
+    similarity DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    seed vector(512);
+BEGIN
+    SELECT t.embedding_vector INTO seed FROM public.tracks t WHERE t.id = p_track_id;
+    IF seed IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    SELECT * FROM public.match_tracks(seed, match_count, array_append(exclude_ids, p_track_id), ef_search);
+END;
+$$;
@@ -0,0 +1,30 @@
+-- Frozen 2D projection used to place new tracks on the galaxy map (see layout.py).
+CREATE TABLE public.layout_projections (
+    id BIGSERIAL PRIMARY KEY,
+    method TEXT NOT NULL DEFAULT 'pca',
+    mean JSONB NOT NULL,
+    components JSONB NOT NULL,
+    lo JSONB NOT NULL,
+    hi JSONB NOT NULL,
+    n_tracks INTEGER NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- updates: [{"id": uuid, "map_x": n, "map_y": n}, ...]
+CREATE OR REPLACE FUNCTION public.bulk_update_track_positions(updates JSONB)
+RETURNS INTEGER
+LANGUAGE sql
+AS $$
+    WITH u AS (
+        SELECT (e->>'id')::UUID AS id, (e->>'map_x')::NUMERIC AS map_x, (e->>'map_y')::NUMERIC AS map_y
+        FROM jsonb_array_elements(updates) AS e
+    ),
+    updated AS (
+        UPDATE public.tracks t
+        SET map_x = u.map_x, map_y = u.map_y
+        FROM u
+        WHERE t.id = u.id
+        RETURNING t.id
+    )
+    SELECT COUNT(*)::INTEGER FROM updated;
+$$;
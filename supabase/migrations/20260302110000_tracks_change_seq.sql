@@ -0,0 +1,29 @@
+-- Monotonic change counter on tracks, so readers can pull "everything that changed since N".
+-- Only bumped when a column visible on the map changes (lease heartbeats don't count).
+CREATE SEQUENCE public.tracks_change_seq;
+
+ALTER TABLE public.tracks
+ADD COLUMN change_seq BIGINT NOT NULL DEFAULT nextval('public.tracks_change_seq');
+
+CREATE INDEX idx_tracks_change_seq ON public.tracks(change_seq);
+CREATE INDEX idx_tracks_live_position ON public.tracks(map_x, map_y) WHERE status = 'LIVE';
+
+CREATE OR REPLACE FUNCTION public.bump_track_change_seq()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.change_seq := nextval('public.tracks_change_seq');
+    RETURN NEW;
+END;
+$$;
+
+CREATE TRIGGER trg_tracks_change_seq
+BEFORE UPDATE ON public.tracks
+FOR EACH ROW
+WHEN (
+    (OLD.status, OLD.map_x, OLD.map_y, OLD.title, OLD.artist_name, OLD.preview_file_url, OLD.vote_score, OLD.licensing_enabled)
+    IS DISTINCT FROM
+    (NEW.status, NEW.map_x, NEW.map_y, NEW.title, NEW.artist_name, NEW.preview_file_url, NEW.vote_score, NEW.licensing_enabled)
+)
+EXECUTE FUNCTION public.bump_track_change_seq();
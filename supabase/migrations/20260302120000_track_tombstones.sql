@@ -0,0 +1,23 @@
+-- Hard deletes leave a tombstone on the same change counter so delta sync can report removals.
+CREATE TABLE public.track_tombstones (
+    track_id UUID NOT NULL,
+    change_seq BIGINT NOT NULL DEFAULT nextval('public.tracks_change_seq'),
+    deleted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_track_tombstones_change_seq ON public.track_tombstones(change_seq);
+
+CREATE OR REPLACE FUNCTION public.record_track_tombstone()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    INSERT INTO public.track_tombstones (track_id) VALUES (OLD.id);
+    RETURN OLD;
+END;
+$$;
+
+CREATE TRIGGER trg_tracks_tombstone
+AFTER DELETE ON public.tracks
+FOR EACH ROW
+EXECUTE FUNCTION public.record_track_tombstone();
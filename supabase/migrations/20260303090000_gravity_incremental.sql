@@ -0,0 +1,154 @@
+-- Incremental gravity builder: events get a monotonic seq so the builder can resume from
+-- a cursor and read only new rows, and per-session "where was this listener" state is
+-- kept so transitions that straddle two runs are still counted.
+ALTER TABLE public.events ADD COLUMN seq BIGSERIAL;
+ALTER TABLE public.events ADD COLUMN inserted_at TIMESTAMPTZ NOT NULL DEFAULT NOW();
+CREATE UNIQUE INDEX idx_events_seq ON public.events(seq);
+
+ALTER TABLE public.gravity_cursor ADD COLUMN last_processed_seq BIGINT NOT NULL DEFAULT 0;
+
+CREATE TABLE public.gravity_session_state (
+    session_id TEXT PRIMARY KEY,
+    current_track_id UUID,
+    previous_track_id UUID,
+    last_seq BIGINT NOT NULL,
+    last_event_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+CREATE INDEX idx_gravity_session_state_updated ON public.gravity_session_state(updated_at);
+
+-- One row per applied builder batch; API caches poll it to invalidate neighbor lists.
+CREATE TABLE public.gravity_batches (
+    id BIGSERIAL PRIMARY KEY,
+    from_seq BIGINT NOT NULL,
+    to_seq BIGINT NOT NULL,
+    edge_count INTEGER NOT NULL,
+    from_track_ids UUID[] NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+);
+
+-- Events after p_after_seq, in seq order. Sequence values are taken before commit, so a
+-- page stops at the first row younger than p_settle_seconds: a lower seq from a
+-- transaction that is still open can't be skipped over once the cursor moves on.
+CREATE OR REPLACE FUNCTION public.fetch_gravity_events(
+    p_after_seq BIGINT,
+    p_limit INTEGER DEFAULT 5000,
+    p_settle_seconds INTEGER DEFAULT 30
+)
+RETURNS TABLE (
+    seq BIGINT,
+    session_id TEXT,
+    track_id UUID,
+    event_type TEXT,
+    elapsed_ms DOUBLE PRECISION,
+    event_at TIMESTAMPTZ
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH page AS (
+        SELECT e.seq, e.session_id, e.track_id, e.event_type,
+               (e.meta->>'elapsed_ms')::DOUBLE PRECISION AS elapsed_ms,
+               e.timestamp AS event_at, e.inserted_at
+        FROM public.events e
+        WHERE e.seq > p_after_seq
+        ORDER BY e.seq
+        LIMIT p_limit
+    ),
+    cut AS (
+        SELECT MIN(page.seq) AS seq
+        FROM page
+        WHERE page.inserted_at > NOW() - make_interval(secs => p_settle_seconds)
+    )
+    SELECT page.seq, page.session_id, page.track_id, page.event_type, page.elapsed_ms, page.event_at
+    FROM page, cut
+    WHERE cut.seq IS NULL OR page.seq < cut.seq
+    ORDER BY page.seq;
+$$;
+
+CREATE OR REPLACE FUNCTION public.gravity_session_states(p_session_ids TEXT[])
+RETURNS SETOF public.gravity_session_state
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT * FROM public.gravity_session_state WHERE session_id = ANY(p_session_ids);
+$$;
+
+-- Applies one builder batch atomically: edge deltas (existing weights decay with the given
+-- half-life before the delta is added), session state, the cursor and a gravity_batches
+-- row. Raises if the cursor moved since the batch was read, so two builders can't both
+-- count the same events.
+-- p_deltas: [{"from_track_id": uuid, "to_track_id": uuid, "weight": n}, ...]
+-- p_sessions: [{"session_id": text, "current_track_id": uuid, "previous_track_id": uuid,
+--               "last_seq": n, "last_event_at": ts}, ...]
+CREATE OR REPLACE FUNCTION public.apply_edge_deltas(
+    p_deltas JSONB,
+    p_sessions JSONB,
+    p_from_seq BIGINT,
+    p_to_seq BIGINT,
+    p_half_life_days DOUBLE PRECISION DEFAULT 30
+)
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_cursor_id UUID;
+    v_cursor_seq BIGINT;
+    v_edges INTEGER;
+BEGIN
+    SELECT id, last_processed_seq INTO v_cursor_id, v_cursor_seq
+    FROM public.gravity_cursor
+    LIMIT 1
+    FOR UPDATE;
+
+    IF v_cursor_seq IS DISTINCT FROM p_from_seq THEN
+        RAISE EXCEPTION 'gravity cursor moved (expected %, found %)', p_from_seq, v_cursor_seq
+            USING ERRCODE = '40001';
+    END IF;
+
+    INSERT INTO public.track_edges AS t (from_track_id, to_track_id, weight, last_updated)
+    SELECT (e->>'from_track_id')::UUID, (e->>'to_track_id')::UUID, (e->>'weight')::NUMERIC, NOW()
+    FROM jsonb_array_elements(p_deltas) AS e
+    -- Tracks deleted since the events were logged would fail the foreign keys.
+    WHERE EXISTS (SELECT 1 FROM public.tracks WHERE id = (e->>'from_track_id')::UUID)
+      AND EXISTS (SELECT 1 FROM public.tracks WHERE id = (e->>'to_track_id')::UUID)
+    ON CONFLICT (from_track_id, to_track_id) DO UPDATE
+    SET weight = t.weight * power(
+            0.5,
+            EXTRACT(EPOCH FROM (NOW() - t.last_updated)) / (p_half_life_days * 86400.0)
+        )::NUMERIC + EXCLUDED.weight,
+        last_updated = NOW();
+    GET DIAGNOSTICS v_edges = ROW_COUNT;
+
+    INSERT INTO public.gravity_session_state AS s
+        (session_id, current_track_id, previous_track_id, last_seq, last_event_at, updated_at)
+    SELECT e->>'session_id',
+           (e->>'current_track_id')::UUID,
+           (e->>'previous_track_id')::UUID,
+           (e->>'last_seq')::BIGINT,
+           (e->>'last_event_at')::TIMESTAMPTZ,
+           NOW()
+    FROM jsonb_array_elements(p_sessions) AS e
+    ON CONFLICT (session_id) DO UPDATE
+    SET current_track_id = EXCLUDED.current_track_id,
+        previous_track_id = EXCLUDED.previous_track_id,
+        last_seq = EXCLUDED.last_seq,
+        last_event_at = EXCLUDED.last_event_at,
+        updated_at = NOW();
+
+    UPDATE public.gravity_cursor
+    SET last_processed_seq = p_to_seq,
+        last_processed_timestamp = NOW(),
+        updated_at = NOW()
+    WHERE id = v_cursor_id;
+
+    IF v_edges > 0 THEN
+        INSERT INTO public.gravity_batches (from_seq, to_seq, edge_count, from_track_ids)
+        SELECT p_from_seq, p_to_seq, v_edges,
+               ARRAY(SELECT DISTINCT (e->>'from_track_id')::UUID FROM jsonb_array_elements(p_deltas) AS e);
+    END IF;
+
+    RETURN v_edges;
+END;
+$$;
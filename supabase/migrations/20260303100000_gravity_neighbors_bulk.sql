@@ -0,0 +1,23 @@
+-- Serves the strongest outgoing edges straight from the index, without a sort.
+CREATE INDEX idx_track_edges_from_weight ON public.track_edges(from_track_id, weight DESC);
+
+-- Top p_limit neighbors (by weight) for each of many tracks in one round-trip.
+CREATE OR REPLACE FUNCTION public.gravity_neighbors_bulk(p_track_ids UUID[], p_limit INTEGER DEFAULT 50)
+RETURNS TABLE (
+    from_track_id UUID,
+    to_track_id UUID,
+    weight NUMERIC
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT ranked.from_track_id, ranked.to_track_id, ranked.weight
+    FROM (
+        SELECT e.from_track_id, e.to_track_id, e.weight,
+               row_number() OVER (PARTITION BY e.from_track_id ORDER BY e.weight DESC) AS rn
+        FROM public.track_edges e
+        WHERE e.from_track_id = ANY(p_track_ids)
+    ) ranked
+    WHERE ranked.rn <= p_limit
+    ORDER BY ranked.from_track_id, ranked.weight DESC;
+$$;
@@ -0,0 +1,107 @@
+-- Votes either bump tracks.vote_score immediately or are left uncounted for
+-- apply_pending_votes() to fold in, so a trending track's row isn't updated once per vote.
+ALTER TABLE public.votes ADD COLUMN counted BOOLEAN NOT NULL DEFAULT TRUE;
+ALTER TABLE public.votes ALTER COLUMN counted SET DEFAULT FALSE;
+
+CREATE INDEX idx_votes_uncounted ON public.votes(created_at) WHERE NOT counted;
+
+-- Spends tokens and records a vote in one transaction.
+-- The balance check and decrement are a single conditional UPDATE, so a session racing
+-- itself can't spend the same tokens twice.
+-- Returns {"status": "ok" | "not_found" | "insufficient_tokens", "vote_score": n, "balance": n}.
+-- With p_defer_score, vote_score is the stored score without this vote; it is counted by
+-- the next apply_pending_votes().
+CREATE OR REPLACE FUNCTION public.cast_vote(
+    p_track_id UUID,
+    p_session_id TEXT,
+    p_tokens INTEGER,
+    p_default_balance INTEGER DEFAULT 100,
+    p_defer_score BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_balance INTEGER;
+    v_score INTEGER;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM public.tracks WHERE id = p_track_id) THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    INSERT INTO public.token_balances (session_id, balance)
+    VALUES (p_session_id, p_default_balance)
+    ON CONFLICT (session_id) DO NOTHING;
+
+    UPDATE public.token_balances
+    SET balance = balance - p_tokens,
+        updated_at = NOW()
+    WHERE session_id = p_session_id AND balance >= p_tokens
+    RETURNING balance INTO v_balance;
+
+    IF NOT FOUND THEN
+        SELECT balance INTO v_balance FROM public.token_balances WHERE session_id = p_session_id;
+        RETURN jsonb_build_object('status', 'insufficient_tokens', 'balance', v_balance);
+    END IF;
+
+    INSERT INTO public.votes (track_id, session_id, tokens_spent, counted)
+    VALUES (p_track_id, p_session_id, p_tokens, NOT p_defer_score);
+
+    IF p_defer_score THEN
+        SELECT vote_score INTO v_score FROM public.tracks WHERE id = p_track_id;
+    ELSE
+        UPDATE public.tracks
+        SET vote_score = vote_score + p_tokens
+        WHERE id = p_track_id
+        RETURNING vote_score INTO v_score;
+    END IF;
+
+    RETURN jsonb_build_object('status', 'ok', 'vote_score', v_score, 'balance', v_balance);
+END;
+$$;
+
+-- Folds uncounted votes into tracks.vote_score with one update per track.
+-- SKIP LOCKED lets several API replicas flush concurrently without counting a vote twice;
+-- track rows are locked in id order so concurrent flushes can't deadlock.
+CREATE OR REPLACE FUNCTION public.apply_pending_votes(p_limit INTEGER DEFAULT 100000)
+RETURNS TABLE (track_id UUID, vote_score INTEGER)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_deltas JSONB;
+BEGIN
+    WITH pending AS (
+        SELECT v.id
+        FROM public.votes v
+        WHERE NOT v.counted
+        ORDER BY v.created_at
+        LIMIT p_limit
+        FOR UPDATE SKIP LOCKED
+    ),
+    marked AS (
+        UPDATE public.votes v
+        SET counted = TRUE
+        FROM pending
+        WHERE v.id = pending.id
+        RETURNING v.track_id, v.tokens_spent
+    )
+    SELECT jsonb_object_agg(m.track_id, m.delta) INTO v_deltas
+    FROM (SELECT marked.track_id, SUM(marked.tokens_spent) AS delta FROM marked GROUP BY marked.track_id) m;
+
+    IF v_deltas IS NULL THEN
+        RETURN;
+    END IF;
+
+    PERFORM 1 FROM public.tracks t
+    WHERE t.id IN (SELECT key::UUID FROM jsonb_each_text(v_deltas))
+    ORDER BY t.id
+    FOR UPDATE;
+
+    RETURN QUERY
+    UPDATE public.tracks t
+    SET vote_score = t.vote_score + d.value::INTEGER
+    FROM jsonb_each_text(v_deltas) AS d
+    WHERE t.id = d.key::UUID
+    RETURNING t.id, t.vote_score;
+END;
+$$;
@@ -0,0 +1,57 @@
+-- Leaderboard rebuild/sync streams votes in (created_at, id) order.
+CREATE INDEX idx_votes_created_id ON public.votes(created_at, id);
+
+-- cast_vote now also returns the new vote's id, so the API can apply it to the in-memory
+-- leaderboard right away and skip it when the same row arrives through the votes sync.
+CREATE OR REPLACE FUNCTION public.cast_vote(
+    p_track_id UUID,
+    p_session_id TEXT,
+    p_tokens INTEGER,
+    p_default_balance INTEGER DEFAULT 100,
+    p_defer_score BOOLEAN DEFAULT FALSE
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_balance INTEGER;
+    v_score INTEGER;
+    v_vote_id UUID;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM public.tracks WHERE id = p_track_id) THEN
+        RETURN jsonb_build_object('status', 'not_found');
+    END IF;
+
+    INSERT INTO public.token_balances (session_id, balance)
+    VALUES (p_session_id, p_default_balance)
+    ON CONFLICT (session_id) DO NOTHING;
+
+    UPDATE public.token_balances
+    SET balance = balance - p_tokens,
+        updated_at = NOW()
+    WHERE session_id = p_session_id AND balance >= p_tokens
+    RETURNING balance INTO v_balance;
+
+    IF NOT FOUND THEN
+        SELECT balance INTO v_balance FROM public.token_balances WHERE session_id = p_session_id;
+        RETURN jsonb_build_object('status', 'insufficient_tokens', 'balance', v_balance);
+    END IF;
+
+    INSERT INTO public.votes (track_id, session_id, tokens_spent, counted)
+    VALUES (p_track_id, p_session_id, p_tokens, NOT p_defer_score)
+    RETURNING id INTO v_vote_id;
+
+    IF p_defer_score THEN
+        SELECT vote_score INTO v_score FROM public.tracks WHERE id = p_track_id;
+    ELSE
+        UPDATE public.tracks
+        SET vote_score = vote_score + p_tokens
+        WHERE id = p_track_id
+        RETURNING vote_score INTO v_score;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'status', 'ok', 'vote_id', v_vote_id, 'vote_score', v_score, 'balance', v_balance
+    );
+END;
+$$;
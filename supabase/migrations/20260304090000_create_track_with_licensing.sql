@@ -0,0 +1,80 @@
+-- Artists are matched case-insensitively on a normalized name.
+ALTER TABLE public.artists
+ADD COLUMN name_key TEXT GENERATED ALWAYS AS (lower(btrim(name))) STORED;
+
+-- Merge artists duplicated by concurrent uploads into the oldest row with the same key.
+CREATE TEMP TABLE artist_dupes ON COMMIT DROP AS
+SELECT id, keeper
+FROM (
+    SELECT id, first_value(id) OVER (PARTITION BY name_key ORDER BY created_at, id) AS keeper
+    FROM public.artists
+) ranked
+WHERE id <> keeper;
+
+UPDATE public.tracks t
+SET artist_id = d.keeper
+FROM artist_dupes d
+WHERE t.artist_id = d.id;
+
+UPDATE public.artists a
+SET balance_cents = a.balance_cents + moved.balance_cents
+FROM (
+    SELECT d.keeper, SUM(dup.balance_cents) AS balance_cents
+    FROM artist_dupes d
+    JOIN public.artists dup ON dup.id = d.id
+    GROUP BY d.keeper
+) moved
+WHERE a.id = moved.keeper;
+
+DELETE FROM public.artists a
+USING artist_dupes d
+WHERE a.id = d.id;
+
+CREATE UNIQUE INDEX idx_artists_name_key ON public.artists(name_key);
+
+-- Registers an uploaded track with its artist (created if new) and, when p_template is
+-- given, a license template, in one transaction. Pass p_artist_id when the caller
+-- already knows it to skip the artist upsert.
+-- Returns {"track_id": uuid, "artist_id": uuid}.
+CREATE OR REPLACE FUNCTION public.create_track_with_licensing(
+    p_track_id UUID,
+    p_title TEXT,
+    p_artist_name TEXT,
+    p_audio_file_url TEXT,
+    p_template JSONB DEFAULT NULL,
+    p_artist_id UUID DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_artist_id UUID := p_artist_id;
+BEGIN
+    IF v_artist_id IS NULL THEN
+        INSERT INTO public.artists (name)
+        VALUES (btrim(p_artist_name))
+        ON CONFLICT (name_key) DO NOTHING
+        RETURNING id INTO v_artist_id;
+
+        IF v_artist_id IS NULL THEN
+            SELECT id INTO v_artist_id FROM public.artists WHERE name_key = lower(btrim(p_artist_name));
+        END IF;
+    END IF;
+
+    INSERT INTO public.tracks (id, title, artist_name, audio_file_url, status, artist_id, licensing_enabled)
+    VALUES (p_track_id, p_title, p_artist_name, p_audio_file_url, 'UPLOADED', v_artist_id, p_template IS NOT NULL);
+
+    IF p_template IS NOT NULL THEN
+        INSERT INTO public.license_templates (track_id, name, description, price_cents, usage_terms_text)
+        VALUES (
+            p_track_id,
+            p_template->>'name',
+            p_template->>'description',
+            (p_template->>'price_cents')::BIGINT,
+            p_template->>'usage_terms_text'
+        );
+    END IF;
+
+    RETURN jsonb_build_object('track_id', p_track_id, 'artist_id', v_artist_id);
+END;
+$$;
@@ -0,0 +1,17 @@
+-- Batch form of create_track_with_licensing for /upload/batch: one round-trip, one transaction.
+-- p_tracks: [{"id": uuid, "title": text, "artist_name": text, "audio_file_url": text, "artist_id": uuid|null}, ...]
+CREATE OR REPLACE FUNCTION public.create_tracks_with_licensing(p_tracks JSONB, p_template JSONB DEFAULT NULL)
+RETURNS SETOF JSONB
+LANGUAGE sql
+AS $$
+    SELECT public.create_track_with_licensing(
+        (t->>'id')::UUID,
+        t->>'title',
+        t->>'artist_name',
+        t->>'audio_file_url',
+        p_template,
+        (t->>'artist_id')::UUID
+    )
+    FROM jsonb_array_elements(p_tracks) WITH ORDINALITY AS e(t, n)
+    ORDER BY n;
+$$;
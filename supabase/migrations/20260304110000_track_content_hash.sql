@@ -0,0 +1,130 @@
+-- sha256 of the uploaded bytes. Re-uploads of the same audio copy the preview, embedding
+-- and map position of an earlier copy instead of running the media pipeline again.
+ALTER TABLE public.tracks ADD COLUMN content_hash TEXT;
+
+CREATE INDEX idx_tracks_content_hash ON public.tracks(content_hash) WHERE content_hash IS NOT NULL;
+
+-- Copies media results from the best earlier track with the same content_hash (embedded
+-- first, then oldest). Only tracks that haven't been processed yet are touched.
+-- Returns {"reused_from": uuid|null, "preview": bool, "embedded": bool}.
+CREATE OR REPLACE FUNCTION public.reuse_track_media(p_track_id UUID)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_hash TEXT;
+    v_donor public.tracks%ROWTYPE;
+BEGIN
+    SELECT content_hash INTO v_hash FROM public.tracks WHERE id = p_track_id;
+    IF v_hash IS NOT NULL THEN
+        SELECT * INTO v_donor
+        FROM public.tracks
+        WHERE content_hash = v_hash
+            AND id <> p_track_id
+            AND (embedding_vector IS NOT NULL OR preview_file_url IS NOT NULL)
+        ORDER BY (embedding_vector IS NOT NULL) DESC, created_at
+        LIMIT 1;
+    END IF;
+
+    IF v_donor.id IS NULL THEN
+        RETURN jsonb_build_object('reused_from', NULL, 'preview', FALSE, 'embedded', FALSE);
+    END IF;
+
+    UPDATE public.tracks
+    SET preview_file_url = COALESCE(preview_file_url, v_donor.preview_file_url),
+        duration = COALESCE(duration, v_donor.duration),
+        loudness_db = COALESCE(loudness_db, v_donor.loudness_db),
+        embedding_vector = COALESCE(embedding_vector, v_donor.embedding_vector),
+        map_x = COALESCE(map_x, v_donor.map_x),
+        map_y = COALESCE(map_y, v_donor.map_y),
+        status = CASE
+            WHEN v_donor.embedding_vector IS NOT NULL THEN 'LIVE'
+            WHEN v_donor.preview_file_url IS NOT NULL THEN 'PREVIEW_READY'
+            ELSE status
+        END
+    WHERE id = p_track_id
+        AND status IN ('UPLOADED', 'PREVIEW_READY');
+
+    IF NOT FOUND THEN
+        RETURN jsonb_build_object('reused_from', NULL, 'preview', FALSE, 'embedded', FALSE);
+    END IF;
+
+    RETURN jsonb_build_object(
+        'reused_from', v_donor.id,
+        'preview', v_donor.preview_file_url IS NOT NULL,
+        'embedded', v_donor.embedding_vector IS NOT NULL
+    );
+END;
+$$;
+
+-- Registration now records the content hash and reuses media in the same transaction.
+DROP FUNCTION public.create_tracks_with_licensing(JSONB, JSONB);
+DROP FUNCTION public.create_track_with_licensing(UUID, TEXT, TEXT, TEXT, JSONB, UUID);
+
+-- Returns {"track_id": uuid, "artist_id": uuid, "reused": <reuse_track_media result>}.
+CREATE OR REPLACE FUNCTION public.create_track_with_licensing(
+    p_track_id UUID,
+    p_title TEXT,
+    p_artist_name TEXT,
+    p_audio_file_url TEXT,
+    p_template JSONB DEFAULT NULL,
+    p_artist_id UUID DEFAULT NULL,
+    p_content_hash TEXT DEFAULT NULL
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_artist_id UUID := p_artist_id;
+    v_reused JSONB := jsonb_build_object('reused_from', NULL, 'preview', FALSE, 'embedded', FALSE);
+BEGIN
+    IF v_artist_id IS NULL THEN
+        INSERT INTO public.artists (name)
+        VALUES (btrim(p_artist_name))
+        ON CONFLICT (name_key) DO NOTHING
+        RETURNING id INTO v_artist_id;
+
+        IF v_artist_id IS NULL THEN
+            SELECT id INTO v_artist_id FROM public.artists WHERE name_key = lower(btrim(p_artist_name));
+        END IF;
+    END IF;
+
+    INSERT INTO public.tracks (id, title, artist_name, audio_file_url, status, artist_id, licensing_enabled, content_hash)
+    VALUES (p_track_id, p_title, p_artist_name, p_audio_file_url, 'UPLOADED', v_artist_id, p_template IS NOT NULL, p_content_hash);
+
+    IF p_template IS NOT NULL THEN
+        INSERT INTO public.license_templates (track_id, name, description, price_cents, usage_terms_text)
+        VALUES (
+            p_track_id,
+            p_template->>'name',
+            p_template->>'description',
+            (p_template->>'price_cents')::BIGINT,
+            p_template->>'usage_terms_text'
+        );
+    END IF;
+
+    IF p_content_hash IS NOT NULL THEN
+        v_reused := public.reuse_track_media(p_track_id);
+    END IF;
+
+    RETURN jsonb_build_object('track_id', p_track_id, 'artist_id', v_artist_id, 'reused', v_reused);
+END;
+$$;
+
+-- p_tracks: [{"id", "title", "artist_name", "audio_file_url", "artist_id", "content_hash"}, ...]
+CREATE OR REPLACE FUNCTION public.create_tracks_with_licensing(p_tracks JSONB, p_template JSONB DEFAULT NULL)
+RETURNS SETOF JSONB
+LANGUAGE sql
+AS $$
+    SELECT public.create_track_with_licensing(
+        (t->>'id')::UUID,
+        t->>'title',
+        t->>'artist_name',
+        t->>'audio_file_url',
+        p_template,
+        (t->>'artist_id')::UUID,
+        t->>'content_hash'
+    )
+    FROM jsonb_array_elements(p_tracks) WITH ORDINALITY AS e(t, n)
+    ORDER BY n;
+$$;
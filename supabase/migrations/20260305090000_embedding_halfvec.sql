@@ -0,0 +1,108 @@
+-- Store embeddings as float16 (pgvector halfvec): half the table and HNSW index size.
+-- CLAP vectors are L2-normalized, so float16 keeps inner products to ~1e-3.
+DROP INDEX IF EXISTS public.tracks_embedding_vector_idx;
+
+ALTER TABLE public.tracks
+ALTER COLUMN embedding_vector TYPE halfvec(512) USING embedding_vector::halfvec(512);
+
+CREATE INDEX idx_tracks_embedding_hnsw ON public.tracks USING hnsw (embedding_vector halfvec_ip_ops);
+
+-- Query embeddings still arrive as vector(512) text; compare in halfvec so the index applies.
+CREATE OR REPLACE FUNCTION public.match_tracks(
+    query_embedding vector(512),
+    match_count INTEGER DEFAULT 20,
+    exclude_ids UUID[] DEFAULT '{}',
+    ef_search INTEGER DEFAULT 40
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    artist_name TEXT,
+    audio_file_url TEXT,
+    preview_file_url TEXT,
+    status TEXT,
+    map_x NUMERIC,
+    map_y NUMERIC,
+    vote_score INTEGER,
+    licensing_enabled BOOLEAN,
+    artist_id UUID,
+    similarity DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    q halfvec(512) := query_embedding::halfvec(512);
+BEGIN
+    PERFORM set_config(
+        'hnsw.ef_search',
+        GREATEST(ef_search, match_count + COALESCE(array_length(exclude_ids, 1), 0))::TEXT,
+        TRUE
+    );
+
+    RETURN QUERY
+    SELECT t.id, t.title, t.artist_name, t.audio_file_url, t.preview_file_url, t.status,
+           t.map_x, t.map_y, t.vote_score, t.licensing_enabled, t.artist_id,
+           (-(t.embedding_vector <#> q))::DOUBLE PRECISION AS similarity
+    FROM public.tracks t
+    WHERE t.status = 'LIVE'
+        AND t.embedding_vector IS NOT NULL
+        AND NOT (t.id = ANY(exclude_ids))
+    ORDER BY t.embedding_vector <#> q
+    LIMIT match_count;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.similar_tracks(
+    p_track_id UUID,
+    match_count INTEGER DEFAULT 20,
+    exclude_ids UUID[] DEFAULT '{}',
+    ef_search INTEGER DEFAULT 40
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    artist_name TEXT,
+    audio_file_url TEXT,
+    preview_file_url TEXT,
+    status TEXT,
+    map_x NUMERIC,
+    map_y NUMERIC,
+    vote_score INTEGER,
+    licensing_enabled BOOLEAN,
+    artist_id UUID,
+    similarity DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    seed halfvec(512);
+BEGIN
+    SELECT t.embedding_vector INTO seed FROM public.tracks t WHERE t.id = p_track_id;
+    IF seed IS NULL THEN
+        RETURN;
+    END IF;
+
+    RETURN QUERY
+    SELECT * FROM public.match_tracks(seed::vector(512), match_count, array_append(exclude_ids, p_track_id), ef_search);
+END;
+$$;
+
+-- Keyset page of embeddings in binary form instead of "[0.0123,...]" text (~1.4 KB vs ~6 KB per track).
+-- embedding is base64 of halfvec_send: int16 dim, int16 unused, then dim big-endian float16 values.
+CREATE OR REPLACE FUNCTION public.export_embeddings(
+    p_after UUID DEFAULT NULL,
+    p_limit INTEGER DEFAULT 1000,
+    p_status TEXT DEFAULT 'LIVE'
+)
+RETURNS TABLE (id UUID, embedding TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT t.id, encode(halfvec_send(t.embedding_vector), 'base64')
+    FROM public.tracks t
+    WHERE t.status = p_status
+        AND t.embedding_vector IS NOT NULL
+        AND (p_after IS NULL OR t.id > p_after)
+    ORDER BY t.id
+    LIMIT p_limit;
+$$;
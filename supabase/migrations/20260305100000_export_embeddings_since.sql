@@ -0,0 +1,30 @@
+-- Re-embedding a track now bumps change_seq too, so incremental embedding exports see it.
+DROP TRIGGER trg_tracks_change_seq ON public.tracks;
+
+CREATE TRIGGER trg_tracks_change_seq
+BEFORE UPDATE ON public.tracks
+FOR EACH ROW
+WHEN (
+    (OLD.status, OLD.map_x, OLD.map_y, OLD.title, OLD.artist_name, OLD.preview_file_url, OLD.vote_score, OLD.licensing_enabled, OLD.embedding_vector)
+    IS DISTINCT FROM
+    (NEW.status, NEW.map_x, NEW.map_y, NEW.title, NEW.artist_name, NEW.preview_file_url, NEW.vote_score, NEW.licensing_enabled, NEW.embedding_vector)
+)
+EXECUTE FUNCTION public.bump_track_change_seq();
+
+-- LIVE embeddings changed after p_after_seq, in change_seq order (same encoding as export_embeddings).
+CREATE OR REPLACE FUNCTION public.export_embeddings_since(
+    p_after_seq BIGINT,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (id UUID, embedding TEXT, change_seq BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT t.id, encode(halfvec_send(t.embedding_vector), 'base64'), t.change_seq
+    FROM public.tracks t
+    WHERE t.change_seq > p_after_seq
+        AND t.status = 'LIVE'
+        AND t.embedding_vector IS NOT NULL
+    ORDER BY t.change_seq
+    LIMIT p_limit;
+$$;
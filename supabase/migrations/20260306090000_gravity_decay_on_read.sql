@@ -0,0 +1,39 @@
+-- apply_edge_deltas only decays an edge when a new delta lands on it, so stored weights of
+-- edges that stopped receiving events are stale. Rank on the weight decayed to now instead:
+-- weight * 0.5^(age / half-life), with the same half-life the builder uses (default 30 days).
+-- The decayed order isn't the stored order, so the (from_track_id, weight DESC) index no
+-- longer saves the sort; idx_track_edges_from serves the lookup.
+DROP INDEX IF EXISTS public.idx_track_edges_from_weight;
+
+DROP FUNCTION public.gravity_neighbors_bulk(UUID[], INTEGER);
+
+CREATE OR REPLACE FUNCTION public.gravity_neighbors_bulk(
+    p_track_ids UUID[],
+    p_limit INTEGER DEFAULT 50,
+    p_half_life_days DOUBLE PRECISION DEFAULT 30
+)
+RETURNS TABLE (
+    from_track_id UUID,
+    to_track_id UUID,
+    weight NUMERIC
+)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT ranked.from_track_id, ranked.to_track_id, ranked.weight
+    FROM (
+        SELECT decayed.*,
+               row_number() OVER (PARTITION BY decayed.from_track_id ORDER BY decayed.weight DESC) AS rn
+        FROM (
+            SELECT e.from_track_id, e.to_track_id,
+                   e.weight * power(
+                       0.5,
+                       EXTRACT(EPOCH FROM (NOW() - e.last_updated)) / (p_half_life_days * 86400.0)
+                   )::NUMERIC AS weight
+            FROM public.track_edges e
+            WHERE e.from_track_id = ANY(p_track_ids)
+        ) decayed
+    ) ranked
+    WHERE ranked.rn <= p_limit
+    ORDER BY ranked.from_track_id, ranked.weight DESC;
+$$;
@@ -0,0 +1,41 @@
+-- complete/fail only apply while the caller still holds the lease: a worker whose lease
+-- expired (and whose job was reclaimed by another worker) must not finish or requeue it.
+
+-- Returns TRUE if the job was marked done.
+CREATE OR REPLACE FUNCTION public.complete_job(p_job_id UUID, p_worker_id TEXT)
+RETURNS BOOLEAN
+LANGUAGE sql
+AS $$
+    WITH done AS (
+        UPDATE public.jobs
+        SET status = 'done', lease_owner = NULL, updated_at = NOW()
+        WHERE id = p_job_id AND status = 'running' AND lease_owner = p_worker_id
+        RETURNING id
+    )
+    SELECT EXISTS (SELECT 1 FROM done);
+$$;
+
+DROP FUNCTION public.fail_job(UUID, TEXT, DOUBLE PRECISION, DOUBLE PRECISION);
+
+-- Returns the new status, or NULL if p_worker_id no longer holds the lease.
+CREATE OR REPLACE FUNCTION public.fail_job(
+    p_job_id UUID,
+    p_error TEXT,
+    p_worker_id TEXT,
+    p_backoff_base_seconds DOUBLE PRECISION DEFAULT 10,
+    p_backoff_max_seconds DOUBLE PRECISION DEFAULT 900
+)
+RETURNS TEXT
+LANGUAGE sql
+AS $$
+    UPDATE public.jobs
+    SET status = CASE WHEN attempts >= max_attempts THEN 'dead' ELSE 'queued' END,
+        run_at = NOW() + make_interval(
+            secs => LEAST(p_backoff_base_seconds * POWER(2, GREATEST(attempts - 1, 0)), p_backoff_max_seconds)
+        ),
+        last_error = p_error,
+        lease_owner = NULL,
+        updated_at = NOW()
+    WHERE id = p_job_id AND status = 'running' AND lease_owner = p_worker_id
+    RETURNING status;
+$$;
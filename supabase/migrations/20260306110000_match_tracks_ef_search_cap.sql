@@ -0,0 +1,46 @@
+-- pgvector rejects hnsw.ef_search above 1000, so a long exclude list (or a large ef_search
+-- from the caller) made set_config raise and failed the whole similar/radio call. Cap it;
+-- past 1000 the scan may return fewer than match_count rows instead of erroring.
+CREATE OR REPLACE FUNCTION public.match_tracks(
+    query_embedding vector(512),
+    match_count INTEGER DEFAULT 20,
+    exclude_ids UUID[] DEFAULT '{}',
+    ef_search INTEGER DEFAULT 40
+)
+RETURNS TABLE (
+    id UUID,
+    title TEXT,
+    artist_name TEXT,
+    audio_file_url TEXT,
+    preview_file_url TEXT,
+    status TEXT,
+    map_x NUMERIC,
+    map_y NUMERIC,
+    vote_score INTEGER,
+    licensing_enabled BOOLEAN,
+    artist_id UUID,
+    similarity DOUBLE PRECISION
+)
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    q halfvec(512) := query_embedding::halfvec(512);
+BEGIN
+    PERFORM set_config(
+        'hnsw.ef_search',
+        LEAST(GREATEST(ef_search, match_count + COALESCE(array_length(exclude_ids, 1), 0)), 1000)::TEXT,
+        TRUE
+    );
+
+    RETURN QUERY
+    SELECT t.id, t.title, t.artist_name, t.audio_file_url, t.preview_file_url, t.status,
+           t.map_x, t.map_y, t.vote_score, t.licensing_enabled, t.artist_id,
+           (-(t.embedding_vector <#> q))::DOUBLE PRECISION AS similarity
+    FROM public.tracks t
+    WHERE t.status = 'LIVE'
+        AND t.embedding_vector IS NOT NULL
+        AND NOT (t.id = ANY(exclude_ids))
+    ORDER BY t.embedding_vector <#> q
+    LIMIT match_count;
+END;
+$$;
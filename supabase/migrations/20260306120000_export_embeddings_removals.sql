@@ -0,0 +1,28 @@
+-- Incremental embedding exports also need to hear about tracks that left LIVE, lost their
+-- embedding or were deleted, so the snapshot can drop them. Those come back with a NULL
+-- embedding; deletions come from track_tombstones on the same change counter.
+CREATE OR REPLACE FUNCTION public.export_embeddings_since(
+    p_after_seq BIGINT,
+    p_limit INTEGER DEFAULT 1000
+)
+RETURNS TABLE (id UUID, embedding TEXT, change_seq BIGINT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT c.id, c.embedding, c.change_seq
+    FROM (
+        SELECT t.id,
+               CASE WHEN t.status = 'LIVE' AND t.embedding_vector IS NOT NULL
+                    THEN encode(halfvec_send(t.embedding_vector), 'base64')
+               END AS embedding,
+               t.change_seq
+        FROM public.tracks t
+        WHERE t.change_seq > p_after_seq
+        UNION ALL
+        SELECT tt.track_id, NULL, tt.change_seq
+        FROM public.track_tombstones tt
+        WHERE tt.change_seq > p_after_seq
+    ) c
+    ORDER BY c.change_seq
+    LIMIT p_limit;
+$$;
@@ -13,6 +13,7 @@ if not os.environ.get("XRPL_SEED"):
     w = Wallet.create()
     os.environ["XRPL_SEED"] = w.seed
 
+import db
 from licensing import \
     router, LicensePurchaseRequest, process_stripe_payment, xrpl_record_license
 
@@ -24,43 +25,37 @@ class MockBackgroundTasks:
         self.tasks.append((func, args, kwargs))
 
 async def test_licensing_e2e():
-    from licensing import supabase
-    if not supabase:
+    if not db.configured():
         print("Skipping E2E test. Supabase is not configured locally.")
         return
 
+    try:
+        await run_licensing_e2e()
+    finally:
+        # The pooled client is bound to this event loop.
+        await db.close()
+
+async def run_licensing_e2e():
     print("--- Starting Licensing E2E Test ---")
     
     # Setup test data
-    test_artist_id = str(uuid.uuid4())
     test_track_id = str(uuid.uuid4())
-    test_template_id = str(uuid.uuid4())
-    
-    print(f"1. Creating Mock Artist ({test_artist_id})...")
-    supabase.table("artists").insert({
-        "id": test_artist_id,
-        "name": "Test SDK Artist",
-        "balance_cents": 0
-    }).execute()
-    
-    print(f"2. Creating Mock Track ({test_track_id})...")
-    supabase.table("tracks").insert({
-        "id": test_track_id,
-        "title": "E2E SDK Test Track",
-        "audio_file_url": "http://mock.com/raw/test.mp3",
-        "licensing_enabled": True,
-        "license_revenue_cents": 0,
-        "artist_id": test_artist_id
-    }).execute()
     
-    print(f"3. Creating Mock License Template ({test_template_id})...")
-    supabase.table("license_templates").insert({
-        "id": test_template_id,
-        "track_id": test_track_id,
-        "name": "Premium License",
-        "price_cents": 5000,
-        "usage_terms_text": "Unlimited streaming."
-    }).execute()
+    print(f"1. Creating Mock Track, Artist and License Template ({test_track_id})...")
+    created = await db.create_track({
+        "p_track_id": test_track_id,
+        "p_title": "E2E SDK Test Track",
+        "p_artist_name": f"Test SDK Artist {uuid.uuid4().hex[:8]}",
+        "p_audio_file_url": "http://mock.com/raw/test.mp3",
+        "p_template": {
+            "name": "Premium License",
+            "price_cents": 5000,
+            "usage_terms_text": "Unlimited streaming."
+        },
+    })
+    test_artist_id = created["artist_id"]
+    test_template_id = (await db.list_license_templates(test_track_id))[0]["id"]
+    print(f"   Artist: {test_artist_id}, Template: {test_template_id}")
 
     print("\n--- Running Purchase Flow ---")
     req = LicensePurchaseRequest(
@@ -90,13 +85,14 @@ async def test_licensing_e2e():
         print("No background tasks were enqueued.")
         
     print("\n--- Verifying Database State ---")
-    l_res = supabase.table("licenses").select("*").eq("id", resp.id).execute()
-    license_record = l_res.data[0]
+    dashboard = await db.artist_dashboard(test_artist_id)
+    license_record = next(l for l in dashboard["recent_licenses"] if l["id"] == resp.id)
     print(f"License Record Found. XRPL Tx Hash: {license_record.get('xrpl_tx_hash')}")
     print(f"Stripe Payment ID: {license_record.get('stripe_payment_id')}")
+    print(f"Artist Revenue: {dashboard['total_license_revenue_cents']} cents")
 
-    a_res = supabase.table("artists").select("balance_cents").eq("id", test_artist_id).execute()
-    print(f"Artist Balance: {a_res.data[0]['balance_cents']} cents")
+    artist = await db.get_artist(test_artist_id, "balance_cents")
+    print(f"Artist Balance: {artist['balance_cents']} cents")
     
     print("\n--- E2E Test Completed ---")
 
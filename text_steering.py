@@ -0,0 +1,116 @@
+import os
+import time
+import queue
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, List, Optional
+
+PROMPT_CACHE_SIZE = int(os.environ.get("PROMPT_CACHE_SIZE", "1024"))
+PROMPT_CACHE_TTL_SECONDS = float(os.environ.get("PROMPT_CACHE_TTL_SECONDS", "3600"))
+TEXT_BATCH_WAIT_MS = float(os.environ.get("TEXT_BATCH_WAIT_MS", "10"))
+TEXT_BATCH_MAX = int(os.environ.get("TEXT_BATCH_MAX", "32"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(prompt.lower().split())
+
+
+class PromptEmbeddingCache:
+    """Thread-safe LRU of prompt -> vector with a per-entry TTL."""
+
+    def __init__(self, max_size: int = PROMPT_CACHE_SIZE, ttl_seconds: float = PROMPT_CACHE_TTL_SECONDS):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: str, vector: List[float]):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+class TextEncodeBatcher:
+    """Collects prompts from concurrent callers for up to `max_wait_ms` and encodes them in one forward pass."""
+
+    def __init__(self, encode_fn: Callable[[List[str]], List[List[float]]],
+                 max_wait_ms: float = TEXT_BATCH_WAIT_MS, max_batch: int = TEXT_BATCH_MAX):
+        self.encode_fn = encode_fn
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, prompt: str) -> Future:
+        fut = Future()
+        self._queue.put((prompt, fut))
+        return fut
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            # Identical prompts in the same window share one row of the batch.
+            unique = list(dict.fromkeys(p for p, _ in batch))
+            try:
+                vectors = dict(zip(unique, self.encode_fn(unique)))
+            except Exception as e:
+                for _, fut in batch:
+                    fut.set_exception(e)
+                continue
+            for prompt, fut in batch:
+                fut.set_result(vectors[prompt])
+
+
+def _encode_with_clap(prompts: List[str]) -> List[List[float]]:
+    # Imported on first use so the API only loads CLAP when someone actually steers.
+    from process import embed_text_batch
+    return embed_text_batch(prompts)
+
+
+class PromptEncoder:
+    """Prompt -> CLAP text vector, served from the cache when possible."""
+
+    def __init__(self, encode_fn: Callable[[List[str]], List[List[float]]] = _encode_with_clap,
+                 cache: Optional[PromptEmbeddingCache] = None):
+        self.cache = cache or PromptEmbeddingCache()
+        self.batcher = TextEncodeBatcher(encode_fn)
+
+    def encode(self, prompt: str, timeout: Optional[float] = 30.0) -> List[float]:
+        key = normalize_prompt(prompt)
+        vector = self.cache.get(key)
+        if vector is None:
+            vector = self.batcher.submit(key).result(timeout=timeout)
+            self.cache.put(key, vector)
+        return vector
@@ -0,0 +1,76 @@
+import json
+import asyncio
+from typing import AsyncIterator, Optional
+
+from spatial_index import TrackSpatialIndex, is_placed
+
+TRACK_FEED_INTERVAL_SECONDS = 2.0
+KEEPALIVE_SECONDS = 15.0
+
+
+def _sse(event: str, data: dict, event_id: Optional[int] = None) -> str:
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+
+class _Subscriber:
+    def __init__(self, size: int):
+        self.queue = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+
+class TrackFeed:
+    """Polls the spatial index for changes and pushes them to Server-Sent-Events subscribers.
+
+    The database sees one poll per interval no matter how many clients are connected.
+    """
+
+    def __init__(self, index: TrackSpatialIndex, interval: float = TRACK_FEED_INTERVAL_SECONDS, queue_size: int = 100):
+        self.index = index
+        self.interval = interval
+        self.queue_size = queue_size
+        self.subscribers = set()
+
+    async def run(self):
+        while True:
+            try:
+                fresh = await asyncio.to_thread(self.index.refresh)
+                if fresh:
+                    self.publish({
+                        "cursor": self.index.cursor,
+                        "upserts": [r for r in fresh if is_placed(r)],
+                        "removed": [r["id"] for r in fresh if not is_placed(r)],
+                        "transitions": [{"id": r["id"], "status": r.get("status")} for r in fresh],
+                    })
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Track feed refresh failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def publish(self, payload: dict):
+        for sub in list(self.subscribers):
+            try:
+                sub.queue.put_nowait(payload)
+            except asyncio.QueueFull:
+                # Slow consumer: stop queueing and tell it to resync from its cursor.
+                sub.overflowed = True
+
+    async def stream(self, since: int = 0) -> AsyncIterator[str]:
+        sub = _Subscriber(self.queue_size)
+        self.subscribers.add(sub)
+        try:
+            catch_up = await asyncio.to_thread(self.index.changes_since, since)
+            yield _sse("changes", catch_up, catch_up["cursor"])
+            while True:
+                if sub.overflowed:
+                    yield _sse("resync", {"cursor": self.index.cursor})
+                    return
+                try:
+                    payload = await asyncio.wait_for(sub.queue.get(), timeout=KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield _sse("changes", payload, payload["cursor"])
+        finally:
+            self.subscribers.discard(sub)
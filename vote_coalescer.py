@@ -0,0 +1,73 @@
+import os
+import time
+import asyncio
+import threading
+from typing import Dict
+
+VOTE_COALESCE_SECONDS = float(os.environ.get("VOTE_COALESCE_SECONDS", "1.0"))
+
+
+class VoteCoalescer:
+    """Folds deferred votes into tracks.vote_score once per interval instead of once per vote.
+
+    Votes themselves are durable as soon as cast_vote returns (as uncounted rows); this
+    only batches the score update. Until the next flush, `score()` adds this process's
+    pending tokens to the last stored score so voters see their vote immediately.
+    """
+
+    def __init__(self, supabase, interval: float = VOTE_COALESCE_SECONDS):
+        self.supabase = supabase
+        self.interval = interval
+        self._pending: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.flushes = 0
+        self.tracks_updated = 0
+        self.last_flush_ms = 0.0
+
+    def add(self, track_id: str, tokens: int):
+        with self._lock:
+            self._pending[track_id] = self._pending.get(track_id, 0) + tokens
+
+    def score(self, track_id: str, stored_score: int) -> int:
+        with self._lock:
+            return stored_score + self._pending.get(track_id, 0)
+
+    def flush(self) -> Dict[str, int]:
+        """Applies every uncounted vote (from any replica). Returns {track_id: new vote_score}."""
+        started = time.monotonic()
+        with self._lock:
+            flushed = dict(self._pending)
+        res = self.supabase.rpc("apply_pending_votes", {}).execute()
+        with self._lock:
+            # Only what the RPC counted leaves _pending; votes added meanwhile (or everything, if
+            # the RPC raised) stay visible in score() until a flush succeeds.
+            for track_id, tokens in flushed.items():
+                left = self._pending.get(track_id, 0) - tokens
+                if left:
+                    self._pending[track_id] = left
+                else:
+                    self._pending.pop(track_id, None)
+        self.flushes += 1
+        self.tracks_updated += len(res.data or [])
+        self.last_flush_ms = round((time.monotonic() - started) * 1000, 1)
+        return {r["track_id"]: r["vote_score"] for r in res.data or []}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Vote flush failed: {e}")
+
+    def stats(self):
+        with self._lock:
+            pending = sum(self._pending.values())
+        return {
+            "pending_tokens": pending,
+            "flushes": self.flushes,
+            "tracks_updated": self.tracks_updated,
+            "last_flush_ms": self.last_flush_ms,
+        }